@@ -0,0 +1,386 @@
+"""
+Кэши для нескольких процессов сервера.
+
+SQLiteCache - кэш в файле SQLite, общий для всех процессов.
+В отличие от LocMemCache процессы видят одни и те же записи,
+поэтому сброс версии страницы в одном процессе действует во всех.
+add() и incr() атомарны между процессами: на них держатся версии
+страниц и блокировки пересчёта. Целые числа хранятся как INTEGER,
+остальное - pickle. Просроченные записи и лишние сверх MAX_ENTRIES
+удаляются раз в CULL_EVERY записей процесса.
+
+TieredCache - LRU в памяти процесса (L1) перед общим кэшем (L2).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+from core.metrics import registry
+
+CULL_EVERY = 100
+REQUESTS_METRIC = "yatube_cache_requests_total"
+MISSING = object()
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL
+);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+"""
+ALIVE = "(expires IS NULL OR expires > ?)"
+
+
+def _encode(value):
+    if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(value):
+    return value if isinstance(value, int) else pickle.loads(value)
+
+
+class SQLiteCache(BaseCache):
+    """LOCATION - путь к файлу; OPTIONS["timeout"] - ожидание блокировки."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self.timeout = params.get("OPTIONS", {}).get("timeout", 5)
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        # У каждого потока своё подключение; после fork - новое.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def validate_key(self, key):
+        # Ограничения memcached на длину и символы SQLite не касаются.
+        pass
+
+    def _key(self, key, version):
+        return self.make_key(key, version=version)
+
+    def _written(self, connection):
+        self._writes += 1
+        if self._writes % CULL_EVERY == 0:
+            self._cull(connection)
+
+    def _cull(self, connection):
+        connection.execute(
+            "DELETE FROM cache WHERE expires <= ?", [time.time()]
+        )
+        count = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self._max_entries and self._cull_frequency:
+            # Первыми уходят записи, которым и так скоро истекать.
+            connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                "ORDER BY expires IS NULL, expires LIMIT ?)",
+                [count // self._cull_frequency]
+            )
+
+    def get(self, key, default=None, version=None):
+        row = self._connection().execute(
+            f"SELECT value FROM cache WHERE key = ? AND {ALIVE}",
+            [self._key(key, version), time.time()]
+        ).fetchone()
+        return default if row is None else _decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        placeholders = ", ".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, value FROM cache "
+            f"WHERE key IN ({placeholders}) AND {ALIVE}",
+            [*keys, time.time()]
+        )
+        return {keys[key]: _decode(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) "
+            "VALUES (?, ?, ?)",
+            [
+                self._key(key, version), _encode(value),
+                self.get_backend_timeout(timeout),
+            ]
+        )
+        self._written(connection)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Просроченную запись add() перезаписывает, живую - нет;
+        # проверка и запись - один атомарный запрос.
+        connection = self._connection()
+        cursor = connection.execute(
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "value = excluded.value, expires = excluded.expires "
+            "WHERE cache.expires <= ?",
+            [
+                self._key(key, version), _encode(value),
+                self.get_backend_timeout(timeout), time.time(),
+            ]
+        )
+        self._written(connection)
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._connection().execute(
+            f"UPDATE cache SET expires = ? WHERE key = ? AND {ALIVE}",
+            [
+                self.get_backend_timeout(timeout), self._key(key, version),
+                time.time(),
+            ]
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        cursor = self._connection().execute(
+            "DELETE FROM cache WHERE key = ?", [self._key(key, version)]
+        )
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        return self._connection().execute(
+            f"SELECT 1 FROM cache WHERE key = ? AND {ALIVE}",
+            [self._key(key, version), time.time()]
+        ).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        connection = self._connection()
+        cache_key = self._key(key, version)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            updated = connection.execute(
+                "UPDATE cache SET value = value + ? WHERE key = ? "
+                f"AND typeof(value) = 'integer' AND {ALIVE}",
+                [delta, cache_key, time.time()]
+            ).rowcount
+            if updated:
+                value = connection.execute(
+                    "SELECT value FROM cache WHERE key = ?", [cache_key]
+                ).fetchone()[0]
+        finally:
+            connection.execute("COMMIT")
+        if not updated:
+            # Нет ключа - ValueError, не целое - как в BaseCache.
+            return super().incr(key, delta, version)
+        return value
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+
+class LocalLRU:
+    """LRU в памяти процесса с пределами по числу записей и байтам."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, data, ttl):
+        with self.lock:
+            self._pop(key)
+            if ttl <= 0 or len(data) > self.max_bytes:
+                return
+            self.entries[key] = (time.monotonic() + ttl, data)
+            self.size += len(data)
+            while (
+                len(self.entries) > self.max_entries
+                or self.size > self.max_bytes
+            ):
+                self._pop(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+# Django создаёт бэкенд кэша в каждом потоке, а L1 один на процесс.
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """
+    L1 в памяти процесса перед общим кэшем L2 с alias из LOCATION.
+
+    Чтение сначала идёт в L1, промах - в L2, найденное запоминается
+    в L1 не дольше L1_TIMEOUT секунд. Запись идёт в оба уровня,
+    add(), incr() и delete() - в L2 с удалением копии из L1.
+    Изменяемые на месте ключи - счётчики версий, префиксы которых
+    перечислены в BYPASS, - читаются только из L2. Остальные ключи,
+    которые сбрасывают сигналы, включают эти версии, поэтому после
+    сброса L1 их просто не находит. OPTIONS: MAX_ENTRIES и MAX_BYTES
+    - пределы L1, L1_TIMEOUT, BYPASS.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.shared_alias = location
+        self.local_timeout = options.get("L1_TIMEOUT", 60)
+        self.bypass = tuple(options.get("BYPASS", ()))
+        with _local_tiers_lock:
+            self.local = _local_tiers.setdefault(location, LocalLRU(
+                self._max_entries, options.get("MAX_BYTES", 32 * 1024 ** 2)
+            ))
+
+    @cached_property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _count(self, tier, hit):
+        registry.inc(REQUESTS_METRIC, {
+            "tier": tier, "result": "hit" if hit else "miss",
+        })
+
+    def _cached_locally(self, key):
+        return not key.startswith(self.bypass)
+
+    def _remember(self, key, value, timeout, version):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            ttl = self.local_timeout
+        else:
+            ttl = min(timeout, self.local_timeout)
+        self.local.set(
+            self.make_key(key, version),
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            ttl
+        )
+
+    def _local_get(self, key, version):
+        data = self.local.get(self.make_key(key, version))
+        self._count("l1", data is not None)
+        return MISSING if data is None else pickle.loads(data)
+
+    def get(self, key, default=None, version=None):
+        local = self._cached_locally(key)
+        if local:
+            value = self._local_get(key, version)
+            if value is not MISSING:
+                return value
+        value = self.shared.get(key, MISSING, version=version)
+        self._count("l2", value is not MISSING)
+        if value is MISSING:
+            return default
+        if local:
+            self._remember(key, value, DEFAULT_TIMEOUT, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            if self._cached_locally(key):
+                value = self._local_get(key, version)
+                if value is not MISSING:
+                    found[key] = value
+                    continue
+            missing.append(key)
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key in missing:
+                self._count("l2", key in shared)
+            for key, value in shared.items():
+                if self._cached_locally(key):
+                    self._remember(key, value, DEFAULT_TIMEOUT, version)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        if self._cached_locally(key):
+            self._remember(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if self._cached_locally(key) and key not in (failed or ()):
+                self._remember(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.discard(key, version)
+        return self.shared.add(key, value, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.discard(key, version)
+        return self.shared.incr(key, delta, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.discard(key, version)
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.discard(key, version)
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.discard(key, version)
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._cached_locally(key) and self.local.get(
+            self.make_key(key, version)
+        ) is not None:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def discard(self, key, version=None):
+        """Удаляет копию ключа из L1 этого процесса."""
+        self.local.delete(self.make_key(key, version))
+
+    def clear(self):
+        # L1 других процессов доживает до L1_TIMEOUT.
+        self.local.clear()
+        self.shared.clear()
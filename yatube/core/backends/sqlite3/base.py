@@ -0,0 +1,114 @@
+"""
+SQLite для нескольких процессов сервера.
+
+Поверх стандартного бэкенда: WAL и настроенные PRAGMA на каждом
+подключении, транзакции BEGIN IMMEDIATE и повтор с экспоненциальной
+паузой, если база занята. Параметры задаются в OPTIONS:
+pragmas (None отключает PRAGMA по умолчанию), transaction_mode,
+busy_retries, busy_backoff; timeout - время ожидания блокировки
+внутри самого sqlite3 в секундах. С "foreign_keys": "OFF" в pragmas
+внешние ключи не включаются и после миграций и не проверяются:
+так настраиваются базы, ссылки из которых ведут в другие базы.
+"""
+import random
+import time
+from functools import partial
+
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    # Читатели не ждут писателя, а писатель - читателей.
+    "journal_mode": "WAL",
+    # В режиме WAL fsync только на контрольных точках.
+    "synchronous": "NORMAL",
+    # Отрицательное значение - размер кэша страниц в КиБ.
+    "cache_size": -64000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+BUSY_MESSAGES = ("database is locked", "database is busy")
+
+
+def is_busy(error):
+    return str(error).startswith(BUSY_MESSAGES)
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    """
+    Повторяет запрос вне транзакции, если база занята. Внутри
+    транзакции повтор не поможет: её нужно откатить целиком.
+    """
+
+    def __init__(self, connection, retries, backoff):
+        super().__init__(connection)
+        self.retries = retries
+        self.backoff = backoff
+
+    def _retry(self, method, *args):
+        for attempt in range(self.retries + 1):
+            try:
+                return method(*args)
+            except base.Database.OperationalError as error:
+                if (
+                    attempt == self.retries
+                    or not is_busy(error)
+                    or self.connection.in_transaction
+                ):
+                    raise
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self._retry(super().executemany, query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict["OPTIONS"]
+        self.pragmas = {**DEFAULT_PRAGMAS, **options.get("pragmas", {})}
+        self.transaction_mode = options.get("transaction_mode", "IMMEDIATE")
+        self.busy_retries = options.get("busy_retries", 5)
+        self.busy_backoff = options.get("busy_backoff", 0.01)
+        self.foreign_keys = str(
+            self.pragmas.get("foreign_keys", "ON")
+        ).upper() not in ("OFF", "0", "FALSE")
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for option in (
+            "pragmas", "transaction_mode", "busy_retries", "busy_backoff"
+        ):
+            params.pop(option, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def enable_constraint_checking(self):
+        if self.foreign_keys:
+            super().enable_constraint_checking()
+
+    def check_constraints(self, table_names=None):
+        if self.foreign_keys:
+            super().check_constraints(table_names)
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=partial(
+            SQLiteCursorWrapper,
+            retries=self.busy_retries,
+            backoff=self.busy_backoff,
+        ))
+
+    def _start_transaction_under_autocommit(self):
+        # Отложенная транзакция, которая сначала читает, а потом пишет,
+        # получает "database is locked" сразу, без ожидания: sqlite
+        # так избегает взаимной блокировки. IMMEDIATE берёт блокировку
+        # записи в BEGIN, и его можно повторить.
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
@@ -0,0 +1,229 @@
+"""
+Замеры страниц сайта через тестовый клиент.
+
+Для каждого URL из posts, users и about считаются перцентили
+задержки, число запросов к БД, размер ответа и пик памяти.
+"""
+import json
+import math
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from about import urls as about_urls
+from posts import urls as posts_urls
+from posts.models import Group, Post, UserStats
+from users import urls as users_urls
+
+Case = namedtuple("Case", "name method url data writes")
+
+URLCONFS = (posts_urls, users_urls, about_urls)
+# View, меняющие данные: их запросы откатываются после замера.
+WRITES = {
+    "posts:post_create",
+    "posts:add_comment",
+    "posts:profile_follow",
+    "posts:profile_unfollow",
+}
+# POST-запросы вдобавок к GET для каждого URL.
+POSTS = {
+    "posts:post_create": {"text": "Пост из замера"},
+    "posts:add_comment": {"text": "Комментарий из замера"},
+}
+LOGOUT = "users:logout"
+
+
+class QueryCounter:
+    """
+    execute_wrapper, считающий запросы. CaptureQueriesContext
+    упирается в предел queries_log в 9000 запросов.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(samples, share):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def sample_objects():
+    """
+    Самые тяжёлые объекты базы: пост с наибольшим числом
+    комментариев, самые крупные группа и автор и самый
+    подписанный читатель.
+    """
+    post = Post.objects.order_by("-comment_count", "-pk").first()
+    group = Group.objects.annotate(
+        total=Count("posts")
+    ).order_by("-total", "pk").first()
+    author = UserStats.objects.select_related("user").order_by(
+        "-post_count", "pk"
+    ).first().user
+    reader = UserStats.objects.select_related("user").order_by(
+        "-following_count", "pk"
+    ).first().user
+    return post, group, author, reader
+
+
+def build_cases(post, group, author, reader):
+    """Случаи замера для каждого именованного URL в URLCONFS."""
+    values = {
+        "post_id": post.pk,
+        "slug": group.slug,
+        "username": author.username,
+        "uidb64": urlsafe_base64_encode(force_bytes(reader.pk)),
+        "token": default_token_generator.make_token(reader),
+    }
+    cases = []
+    for urlconf in URLCONFS:
+        for pattern in urlconf.urlpatterns:
+            name = f"{urlconf.app_name}:{pattern.name}"
+            url = reverse(name, kwargs={
+                key: values[key] for key in pattern.pattern.converters
+            })
+            writes = name in WRITES
+            cases.append(Case(name, "GET", url, None, writes))
+            if name in POSTS:
+                cases.append(Case(name, "POST", url, POSTS[name], writes))
+    return cases
+
+
+@contextmanager
+def rolled_back(enabled):
+    if not enabled:
+        yield
+        return
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def request(client, case):
+    with rolled_back(case.writes):
+        if case.method == "POST":
+            return client.post(case.url, case.data)
+        return client.get(case.url)
+
+
+def measure(client, case, repeat, cold):
+    """
+    Метрики одного случая. В холодном режиме кэш очищается
+    перед каждым запросом, в тёплом - прогревается одним запросом.
+    """
+    if not cold:
+        request(client, case)
+    samples = []
+    for _ in range(repeat):
+        if cold:
+            cache.clear()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            response = request(client, case)
+            samples.append((time.perf_counter() - started) * 1000)
+        # Число запросов и размер берутся с последнего прогона:
+        # первые запросы пользователя ещё ставят cookie csrftoken,
+        # и такие ответы cache_page не сохраняет.
+        queries = counter.count
+        size = len(response.content)
+        status = response.status_code
+    if cold:
+        cache.clear()
+    # Память меряется отдельным прогоном: tracemalloc замедляет код.
+    tracemalloc.start()
+    request(client, case)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "status": status,
+        "p50": percentile(samples, 0.50),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+        "queries": queries,
+        "bytes": size,
+        "peak_kb": peak // 1024,
+    }
+
+
+def run(repeat, only=None):
+    """Метрики всех случаев для гостя и пользователя, с кэшем и без."""
+    post, group, author, reader = sample_objects()
+    cases = build_cases(post, group, author, reader)
+    results = {}
+    for user_kind in ("anon", "auth"):
+        for cache_kind in ("cold", "warm"):
+            cache.clear()
+            client = Client()
+            if user_kind == "auth":
+                client.force_login(reader)
+            for case in cases:
+                key = f"{case.method} {case.name} {user_kind} {cache_kind}"
+                if only and only not in key:
+                    continue
+                results[key] = measure(
+                    client, case, repeat, cache_kind == "cold"
+                )
+                if case.name == LOGOUT and user_kind == "auth":
+                    client.force_login(reader)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Регрессии относительно baseline: рост p95 больше чем
+    в threshold раз (и больше чем на 1 мс), рост числа запросов
+    или размера ответа больше чем на 10%.
+    """
+    regressions = []
+    for key, current in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if (
+            current["p95"] > before["p95"] * threshold
+            and current["p95"] - before["p95"] > 1
+        ):
+            regressions.append(
+                f"{key}: p95 {before['p95']:.1f} -> {current['p95']:.1f} мс"
+            )
+        if current["queries"] > before["queries"]:
+            regressions.append(
+                f"{key}: запросов {before['queries']} -> "
+                f"{current['queries']}"
+            )
+        if current["bytes"] > before["bytes"] * 1.1:
+            regressions.append(
+                f"{key}: байт {before['bytes']} -> {current['bytes']}"
+            )
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding="utf-8") as baseline:
+            return json.load(baseline)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results):
+    with open(path, "w", encoding="utf-8") as baseline:
+        json.dump(results, baseline, ensure_ascii=False, indent=2)
+        baseline.write("\n")
@@ -0,0 +1,188 @@
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+ALIAS = "bench_sqlite"
+# Профили: бэкенд, OPTIONS и держит ли процесс подключение между
+# запросами, как при CONN_MAX_AGE > 0.
+PROFILES = {
+    "default": ("django.db.backends.sqlite3", {}, False),
+    "tuned": (
+        "core.backends.sqlite3",
+        {"timeout": 5, "busy_retries": 5, "busy_backoff": 0.01},
+        True,
+    ),
+}
+SCHEMA = """
+CREATE TABLE post (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    pub_date REAL NOT NULL,
+    comment_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX post_date ON post (pub_date);
+CREATE TABLE comment (
+    id INTEGER PRIMARY KEY,
+    post_id INTEGER NOT NULL REFERENCES post (id),
+    text TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX comment_post ON comment (post_id, created);
+"""
+
+
+def create_database(path, posts):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        "INSERT INTO post (text, pub_date) VALUES (?, ?)",
+        ((f"Пост {number}", number) for number in range(posts))
+    )
+    conn.commit()
+    conn.close()
+
+
+# Модуль импортируется в рабочем процессе до django.setup(),
+# поэтому код, которому нужны модели, подключается внутри функций.
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def read(cursor, rng, posts):
+    # Как лента: страница постов и комментарии к одному из них.
+    cursor.execute(
+        "SELECT id, text, comment_count FROM post "
+        "ORDER BY pub_date DESC LIMIT 10 OFFSET %s",
+        [rng.randrange(0, posts - 10, 10)]
+    )
+    post_id = cursor.fetchall()[0][0]
+    cursor.execute(
+        "SELECT text FROM comment WHERE post_id = %s "
+        "ORDER BY created DESC LIMIT 20",
+        [post_id]
+    )
+    cursor.fetchall()
+
+
+def write(cursor, rng, posts):
+    # Как add_comment: прочитать пост, добавить комментарий,
+    # обновить счётчик.
+    post_id = rng.randrange(1, posts + 1)
+    cursor.execute("SELECT id FROM post WHERE id = %s", [post_id])
+    cursor.fetchone()
+    cursor.execute(
+        "INSERT INTO comment (post_id, text, created) VALUES (%s, %s, %s)",
+        [post_id, "Комментарий", time.time()]
+    )
+    cursor.execute(
+        "UPDATE post SET comment_count = comment_count + 1 WHERE id = %s",
+        [post_id]
+    )
+
+
+def worker(profile, path, posts, write_share, duration, seed):
+    """Запросы одного процесса в течение duration секунд."""
+    from django.db import OperationalError, connections, transaction
+
+    engine, options, persistent = PROFILES[profile]
+    connections.databases[ALIAS] = {
+        "ENGINE": engine, "NAME": path, "OPTIONS": options,
+    }
+    connection = connections[ALIAS]
+    rng = random.Random(seed)
+    result = {"read": [], "write": [], "errors": 0}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        kind = "write" if rng.random() < write_share else "read"
+        started = time.perf_counter()
+        try:
+            if kind == "write":
+                with transaction.atomic(using=ALIAS):
+                    with connection.cursor() as cursor:
+                        write(cursor, rng, posts)
+            else:
+                with connection.cursor() as cursor:
+                    read(cursor, rng, posts)
+        except OperationalError:
+            result["errors"] += 1
+        else:
+            result[kind].append((time.perf_counter() - started) * 1000)
+        if not persistent:
+            connection.close()
+    connection.close()
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает стандартный sqlite3 и core.backends.sqlite3 "
+        "под конкурентными чтениями и записями из нескольких процессов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", default="1,2,4,8",
+            help="Числа процессов через запятую."
+        )
+        parser.add_argument(
+            "--duration", type=float, default=3,
+            help="Длительность замера в секундах."
+        )
+        parser.add_argument(
+            "--write-share", type=float, default=0.2,
+            help="Доля запросов на запись."
+        )
+        parser.add_argument("--posts", type=int, default=20000)
+
+    def handle(self, *args, **options):
+        workers = [int(number) for number in options["workers"].split(",")]
+        directory = tempfile.mkdtemp()
+        self.stdout.write(
+            f"{'профиль':<8} {'проц.':>5} {'чтений/с':>9} {'записей/с':>10} "
+            f"{'ошибок':>7} {'p95 чт.':>8} {'p95 зап.':>9}"
+        )
+        try:
+            for profile in PROFILES:
+                for count in workers:
+                    self.measure(profile, count, directory, options)
+        finally:
+            shutil.rmtree(directory)
+
+    def measure(self, profile, count, directory, options):
+        from core.benchmark import percentile
+
+        path = os.path.join(directory, f"{profile}-{count}.sqlite3")
+        create_database(path, options["posts"])
+        with ProcessPoolExecutor(
+            max_workers=count,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        ) as executor:
+            results = list(executor.map(
+                worker,
+                [profile] * count,
+                [path] * count,
+                [options["posts"]] * count,
+                [options["write_share"]] * count,
+                [options["duration"]] * count,
+                range(count),
+            ))
+        reads = [ms for result in results for ms in result["read"]]
+        writes = [ms for result in results for ms in result["write"]]
+        errors = sum(result["errors"] for result in results)
+        duration = options["duration"]
+        self.stdout.write(
+            f"{profile:<8} {count:>5} {len(reads) / duration:>9.0f} "
+            f"{len(writes) / duration:>10.0f} {errors:>7} "
+            f"{percentile(reads, 0.95) if reads else 0:>8.2f} "
+            f"{percentile(writes, 0.95) if writes else 0:>9.2f}"
+        )
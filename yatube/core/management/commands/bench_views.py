@@ -0,0 +1,109 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from core import benchmark
+from posts.ndjson import Progress, rebuild_derived
+from posts.seeding import Seeder
+
+BASELINE = os.path.join(settings.BASE_DIR, "benchmarks", "views.json")
+SIZES = {
+    "users": 300,
+    "groups": 20,
+    "posts": 5000,
+    "comments": 10000,
+    "follows": 3000,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет все страницы posts, users и about на заполненной "
+        "seed базе: p50/p95/p99, запросы, байты и пик памяти - для "
+        "гостя и пользователя, с холодным и тёплым кэшем."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--only", help="Замерять только случаи, содержащие строку."
+        )
+        parser.add_argument(
+            "--existing-db", action="store_true",
+            help="Мерить текущую БД вместо временной заполненной."
+        )
+        for name, default in SIZES.items():
+            parser.add_argument(f"--{name}", type=int, default=default)
+        parser.add_argument("--baseline", default=BASELINE)
+        parser.add_argument(
+            "--save-baseline", action="store_true",
+            help="Записать результаты как новый baseline."
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=1.5,
+            help="Во сколько раз p95 может вырасти без регрессии."
+        )
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Завершиться с ошибкой при регрессиях."
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = None
+        try:
+            if not options["existing_db"]:
+                old_name = connection.settings_dict["NAME"]
+                connection.creation.create_test_db(
+                    verbosity=0, autoclobber=True, serialize=False
+                )
+                # Реплики читают ту же тестовую базу, как в тестах.
+                for alias in settings.DATABASE_REPLICAS:
+                    connections[alias].creation.set_as_test_mirror(
+                        connection.settings_dict
+                    )
+                self.seed(options)
+            results = benchmark.run(options["repeat"], options["only"])
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.report(results)
+        if options["save_baseline"]:
+            benchmark.save_baseline(options["baseline"], results)
+            self.stdout.write(f"Baseline записан в {options['baseline']}")
+            return
+        baseline = benchmark.load_baseline(options["baseline"])
+        if baseline is None:
+            self.stdout.write("Baseline не найден, сравнивать не с чем")
+            return
+        regressions = benchmark.compare(
+            results, baseline, options["threshold"]
+        )
+        for line in regressions:
+            self.stdout.write(self.style.WARNING(line))
+        if regressions and options["check"]:
+            raise CommandError(f"Регрессий: {len(regressions)}")
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS("Регрессий нет"))
+
+    def seed(self, options):
+        seeder = Seeder(42, 5000, 1.1, 365, Progress(lambda line: None))
+        seeder.run(*(options[name] for name in SIZES))
+        rebuild_derived()
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'случай':<48} {'код':>4} {'p50':>7} {'p95':>7} {'p99':>7} "
+            f"{'запр.':>5} {'байт':>8} {'КБ':>6}"
+        )
+        for key, row in results.items():
+            self.stdout.write(
+                f"{key:<48} {row['status']:>4} {row['p50']:>7.1f} "
+                f"{row['p95']:>7.1f} {row['p99']:>7.1f} "
+                f"{row['queries']:>5} {row['bytes']:>8} {row['peak_kb']:>6}"
+            )
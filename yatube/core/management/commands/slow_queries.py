@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.slow_queries import read_log, top
+
+
+class Command(BaseCommand):
+    help = (
+        "Запросы из журнала медленных запросов с наибольшим "
+        "суммарным временем."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top", type=int, default=10,
+            help="Сколько запросов показать."
+        )
+        parser.add_argument(
+            "--log", default=settings.SLOW_QUERY_LOG,
+            help="Файл журнала, ротированные копии читаются тоже."
+        )
+        parser.add_argument(
+            "--plans", action="store_true",
+            help="Показать план самого медленного вызова."
+        )
+
+    def handle(self, *args, **options):
+        offenders = top(read_log(options["log"]), options["top"])
+        if not offenders:
+            self.stdout.write("Медленных запросов нет.")
+            return
+        for rank, offender in enumerate(offenders, 1):
+            view, _ = offender["views"].most_common(1)[0]
+            location, _ = offender["locations"].most_common(1)[0]
+            self.stdout.write(
+                f"{rank}. всего {offender['total_ms']:.1f} мс, "
+                f"вызовов {offender['count']}, "
+                f"среднее {offender['total_ms'] / offender['count']:.1f} мс, "
+                f"макс. {offender['max_ms']:.1f} мс"
+            )
+            self.stdout.write(f"   view: {view}, место: {location}")
+            self.stdout.write(f"   {offender['sql']}")
+            if options["plans"] and offender["plan"]:
+                for line in offender["plan"]:
+                    self.stdout.write(f"     {line}")
@@ -0,0 +1,308 @@
+"""
+Метрики запросов в текстовом формате Prometheus.
+
+Каждый процесс копит метрики в памяти и не чаще раза
+в METRICS_FLUSH_INTERVAL секунд записывает их в свой файл
+в METRICS_DIR. /metrics складывает файлы всех процессов, поэтому
+под несколькими воркерами ответ не зависит от того, какой воркер
+его отдал. Файлы завершившихся процессов остаются в сумме, чтобы
+счётчики не убывали; каталог очищается при перезапуске сервиса.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ContextDecorator
+
+from django.conf import settings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм в секундах, как в prometheus_client.
+BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75,
+    1.0, 2.5, 5.0, 7.5, 10.0,
+)
+
+FAMILIES = {
+    "yatube_http_requests_total": (
+        "counter", "Число запросов по view, методу и статусу."
+    ),
+    "yatube_http_request_duration_seconds": (
+        "histogram", "Время ответа view."
+    ),
+    "yatube_db_queries_total": (
+        "counter", "Число запросов к базе данных."
+    ),
+    "yatube_db_query_duration_seconds_total": (
+        "counter", "Суммарное время запросов к базе данных."
+    ),
+    "yatube_page_cache_requests_total": (
+        "counter", "Попадания и промахи кэша страниц."
+    ),
+    "yatube_template_render_duration_seconds": (
+        "histogram", "Время отрисовки шаблонов за запрос."
+    ),
+    "yatube_cache_requests_total": (
+        "counter", "Чтения уровней кэша: tier - l1 или l2, result."
+    ),
+    "yatube_cache_hit_ratio": (
+        "gauge", "Доля попаданий в уровень кэша с запуска."
+    ),
+    "yatube_follow_feed_requests_total": (
+        "counter",
+        "Чтения (op=read) и раскладки (op=write) ленты подписок по ветке.",
+    ),
+}
+
+
+class Registry:
+    """Метрики одного процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.reset()
+        atexit.register(self.flush, force=True)
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed = 0.0
+
+    def _check_fork(self):
+        # Дочерний процесс после fork получает копию значений
+        # родителя, и в сумме по файлам они посчитались бы дважды.
+        if os.getpid() != self.pid:
+            self.reset()
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._check_fork()
+            self.counters[key] += value
+
+    def observe(self, name, labels, value):
+        """
+        Добавляет значение в гистограмму. Хранятся число значений
+        в каждой корзине, последняя корзина - +Inf, и их сумма.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._check_fork()
+            counts = self.histograms.get(key)
+            if counts is None:
+                counts = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            counts[bisect_left(BUCKETS, value)] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            self._check_fork()
+            return {
+                "counters": [
+                    [name, labels, value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    [name, labels, counts]
+                    for (name, labels), counts in self.histograms.items()
+                ],
+            }
+
+    def flush(self, force=False):
+        """Записывает метрики процесса в его файл в METRICS_DIR."""
+        directory = settings.METRICS_DIR
+        if not directory or not (self.counters or self.histograms):
+            return
+        now = time.monotonic()
+        if not force and now - self.flushed < settings.METRICS_FLUSH_INTERVAL:
+            return
+        # Файл пишет один поток, остальные не ждут его.
+        if not self.flush_lock.acquire(blocking=force):
+            return
+        try:
+            self.flushed = now
+            write_process_file(directory, self.snapshot())
+        finally:
+            self.flush_lock.release()
+
+    def snapshots(self):
+        """Снимки метрик всех процессов."""
+        if not settings.METRICS_DIR:
+            return [self.snapshot()]
+        self.flush(force=True)
+        return read_process_files(settings.METRICS_DIR)
+
+
+def write_process_file(directory, data):
+    """Записывает data в файл текущего процесса в directory."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as dump:
+        json.dump(data, dump)
+    # Читатель видит либо старый файл, либо новый целиком.
+    os.replace(path + ".tmp", path)
+
+
+def read_process_files(directory):
+    """Данные из файлов всех процессов в directory."""
+    result = []
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            with open(path, encoding="utf-8") as dump:
+                result.append(json.load(dump))
+        except (OSError, ValueError):
+            continue
+    return result
+
+
+registry = Registry()
+
+
+def merge(snapshots):
+    """Складывает снимки процессов."""
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, counts in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(counts))
+            for index, count in enumerate(counts):
+                total[index] += count
+    return counters, histograms
+
+
+def hit_ratios(counters):
+    """Доли попаданий уровней кэша по сложенным счётчикам чтений."""
+    totals = defaultdict(lambda: {"hit": 0.0, "miss": 0.0})
+    for (name, labels), value in counters.items():
+        if name == "yatube_cache_requests_total":
+            labels = dict(labels)
+            totals[labels["tier"]][labels["result"]] += value
+    return {
+        ("yatube_cache_hit_ratio", (("tier", tier),)):
+            total["hit"] / (total["hit"] + total["miss"])
+        for tier, total in totals.items()
+        if total["hit"] + total["miss"]
+    }
+
+
+def _escape(value):
+    return (
+        str(value).replace("\\", r"\\").replace("\n", r"\n")
+        .replace('"', r"\"")
+    )
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    return repr(float(value))
+
+
+def exposition():
+    """Метрики всех процессов в текстовом формате Prometheus."""
+    counters, histograms = merge(registry.snapshots())
+    counters.update(hit_ratios(counters))
+    lines = []
+    for family, (kind, help_text) in FAMILIES.items():
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        for (name, labels), value in sorted(counters.items()):
+            if name == family:
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), counts in sorted(histograms.items()):
+            if name != family:
+                continue
+            cumulative = 0
+            bounds = [_number(bound) for bound in BUCKETS] + ["+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_labels(labels + (('le', bound),))} "
+                    f"{_number(cumulative)}"
+                )
+            lines.append(f"{name}_sum{_labels(labels)} {_number(counts[-1])}")
+            lines.append(
+                f"{name}_count{_labels(labels)} {_number(cumulative)}"
+            )
+    return "\n".join(lines) + "\n"
+
+
+_current = threading.local()
+
+
+class Span:
+    __slots__ = ("seconds", "count", "depth", "started")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.count = 0
+        self.depth = 0
+        self.started = 0.0
+
+
+def start_request():
+    """Начинает учёт участков timer() в текущем потоке."""
+    _current.spans = {}
+
+
+def collecting():
+    return getattr(_current, "spans", None) is not None
+
+
+def current_spans():
+    """Время и число вызовов каждого участка с начала запроса."""
+    spans = getattr(_current, "spans", None) or {}
+    return {name: (span.seconds, span.count) for name, span in spans.items()}
+
+
+def finish_request():
+    spans = current_spans()
+    _current.spans = None
+    return spans
+
+
+class timer(ContextDecorator):
+    """
+    Считает время участка name в текущем запросе. Участок,
+    вложенный в участок с тем же именем, уже входит во внешний.
+    Вне запроса ничего не делает.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        spans = getattr(_current, "spans", None)
+        if spans is not None:
+            span = spans.get(self.name)
+            if span is None:
+                span = spans[self.name] = Span()
+            if not span.depth:
+                span.started = time.perf_counter()
+            span.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        spans = getattr(_current, "spans", None)
+        span = spans.get(self.name) if spans else None
+        if span is None or not span.depth:
+            return
+        span.depth -= 1
+        if not span.depth:
+            span.seconds += time.perf_counter() - span.started
+            span.count += 1
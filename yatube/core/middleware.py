@@ -0,0 +1,157 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from . import metrics
+
+
+class QueryTimer:
+    """
+    execute_wrapper, считающий запросы и их суммарное время.
+    В блоке with стоит на всех подключениях к базам.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.stack = ExitStack()
+
+    def __enter__(self):
+        for connection in connections.all():
+            self.stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.stack.__exit__(*exc_info)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Собирает метрики каждого запроса с меткой view_name: число
+    и время ответов, запросы к базе, попадания в кэш страниц
+    и время отрисовки шаблонов. Стоит первым в MIDDLEWARE, чтобы
+    в замер попали и остальные middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        metrics.start_request()
+        started = time.perf_counter()
+        try:
+            with queries:
+                response = self.get_response(request)
+        finally:
+            spans = metrics.finish_request()
+        duration = time.perf_counter() - started
+        self.record(request, response, duration, queries, spans)
+        return response
+
+    def record(self, request, response, duration, queries, spans):
+        match = getattr(request, "resolver_match", None)
+        view = {"view": match.view_name if match else "unresolved"}
+        registry = metrics.registry
+        registry.inc("yatube_http_requests_total", {
+            **view,
+            "method": request.method,
+            "status": str(response.status_code),
+        })
+        registry.observe(
+            "yatube_http_request_duration_seconds", view, duration
+        )
+        registry.inc("yatube_db_queries_total", view, queries.count)
+        registry.inc(
+            "yatube_db_query_duration_seconds_total", view, queries.seconds
+        )
+        hit = getattr(request, "page_cache_hit", None)
+        if hit is not None:
+            registry.inc("yatube_page_cache_requests_total", {
+                **view, "result": "hit" if hit else "miss",
+            })
+        if "template" in spans:
+            registry.observe(
+                "yatube_template_render_duration_seconds",
+                view,
+                spans["template"][0]
+            )
+        registry.flush()
+
+
+class ServerTimingMiddleware:
+    """
+    Заголовок Server-Timing с разбивкой времени ответа: всего,
+    запросы к базе, шаблоны, миниатюры и кэш. Включается только
+    для сотрудников заголовком X-Server-Timing или cookie
+    server_timing, остальные запросы проходят без замеров.
+    Стоит после AuthenticationMiddleware.
+    """
+
+    header = "HTTP_X_SERVER_TIMING"
+    cookie = "server_timing"
+    # Участки timer(), которые попадают в заголовок.
+    spans = ("template", "thumbnail", "cache")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def enabled(self, request):
+        return (
+            (self.header in request.META or self.cookie in request.COOKIES)
+            and request.user.is_staff
+        )
+
+    def __call__(self, request):
+        if not self.enabled(request):
+            return self.get_response(request)
+        # Без MetricsMiddleware учёт участков начинается здесь.
+        own = not metrics.collecting()
+        if own:
+            metrics.start_request()
+        queries = QueryTimer()
+        before = metrics.current_spans()
+        started = time.perf_counter()
+        try:
+            with queries:
+                response = self.get_response(request)
+            duration = time.perf_counter() - started
+            spans = metrics.current_spans()
+        finally:
+            if own:
+                metrics.finish_request()
+        match = getattr(request, "resolver_match", None)
+        entries = [
+            self.entry(
+                "total", duration, match.view_name if match else "unresolved"
+            ),
+            self.entry("db", queries.seconds, f"{queries.count} queries"),
+        ]
+        for name in self.spans:
+            seconds, count = spans.get(name, (0.0, 0))
+            seconds -= before.get(name, (0.0, 0))[0]
+            count -= before.get(name, (0.0, 0))[1]
+            if not count:
+                continue
+            description = f"{count} calls"
+            hit = getattr(request, "page_cache_hit", None)
+            if name == "cache" and hit is not None:
+                description += ", page hit" if hit else ", page miss"
+            entries.append(self.entry(name, seconds, description))
+        response["Server-Timing"] = ", ".join(entries)
+        return response
+
+    @staticmethod
+    def entry(name, seconds, description):
+        # Значение заголовка должно остаться в ASCII.
+        description = description.replace("\\", "").replace('"', "")
+        return f'{name};dur={seconds * 1000:.1f};desc="{description}"'
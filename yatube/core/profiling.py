@@ -0,0 +1,277 @@
+"""
+Профилирование случайной доли запросов.
+
+В режиме sampling отдельный поток раз в PROFILE_INTERVAL секунд
+снимает стек потока запроса; в режиме cprofile запрос целиком идёт
+под cProfile. Стеки и статистика копятся по view_name и отдаются
+сотрудникам в формате collapsed stacks, speedscope или pstats.
+Кадры шаблонов подписываются именем шаблона и тега, чтобы было
+видно, какой шаблон или тег тормозит.
+"""
+import cProfile
+import glob
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+from collections import Counter, defaultdict
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+from django.template.base import Node, Template
+
+from .metrics import read_process_files, write_process_file
+
+RENDER_CODE = Template._render.__code__
+NODE_CODE = Node.render_annotated.__code__
+
+_labels = {}
+
+
+def _path(filename):
+    if filename.startswith(settings.BASE_DIR):
+        return os.path.relpath(filename, settings.BASE_DIR)
+    head, packages, tail = filename.rpartition("site-packages" + os.sep)
+    return tail if packages else filename
+
+
+def label(frame):
+    """Подпись кадра: шаблон, узел шаблона или функция с файлом."""
+    code = frame.f_code
+    if code is RENDER_CODE:
+        template = frame.f_locals.get("self")
+        return f"template {getattr(template, 'name', None)}"
+    if code is NODE_CODE:
+        node = frame.f_locals.get("self")
+        func = getattr(node, "func", None)
+        if func is not None:
+            return f"tag {func.__name__}"
+        return f"node {type(node).__name__}"
+    name = _labels.get(code)
+    if name is None:
+        name = _labels[code] = (
+            f"{code.co_name} ({_path(code.co_filename)}:"
+            f"{code.co_firstlineno})"
+        ).replace(";", ",")
+    return name
+
+
+def stack(frame, root):
+    """Стек от кода root до frame в виде кортежа подписей."""
+    labels = []
+    while frame is not None and frame.f_code is not root:
+        labels.append(label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+class Sampler:
+    """Поток, который снимает стек текущего потока до выхода из with."""
+
+    def __init__(self, interval, root):
+        self.interval = interval
+        self.root = root
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[stack(frame, self.root)] += 1
+
+
+class Profiles:
+    """Стеки и статистика cProfile одного процесса по view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.stacks = defaultdict(Counter)
+        self.stats = {}
+
+    def _check_fork(self):
+        if os.getpid() != self.pid:
+            self.reset()
+
+    def add_samples(self, view, stacks):
+        if not stacks:
+            # Запрос быстрее PROFILE_INTERVAL - сэмплов нет.
+            return
+        with self.lock:
+            self._check_fork()
+            self.stacks[view].update(stacks)
+            self.flush()
+
+    def add_profile(self, view, profile):
+        with self.lock:
+            self._check_fork()
+            if view in self.stats:
+                self.stats[view].add(profile)
+            else:
+                self.stats[view] = pstats.Stats(profile)
+            self.flush()
+
+    def snapshot(self):
+        return {
+            view: [[list(labels), count] for labels, count in stacks.items()]
+            for view, stacks in self.stacks.items()
+        }
+
+    def flush(self):
+        # Вызывается под self.lock после каждого профилированного
+        # запроса: при малой доле запросов это дёшево.
+        directory = settings.PROFILE_DIR
+        if not directory:
+            return
+        write_process_file(directory, self.snapshot())
+        for view, stats in self.stats.items():
+            path = os.path.join(
+                directory, f"{quote(view, safe='')}.{self.pid}.prof"
+            )
+            stats.dump_stats(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def stats_files():
+        """Файлы pstats всех процессов: пары (view, путь)."""
+        for path in glob.glob(os.path.join(settings.PROFILE_DIR, "*.prof")):
+            yield unquote(os.path.basename(path).rsplit(".", 2)[0]), path
+
+    def samples(self):
+        """Стеки всех процессов: view -> Counter стеков."""
+        if settings.PROFILE_DIR:
+            snapshots = read_process_files(settings.PROFILE_DIR)
+        else:
+            with self.lock:
+                snapshots = [self.snapshot()]
+        merged = defaultdict(Counter)
+        for snapshot in snapshots:
+            for view, stacks in snapshot.items():
+                for labels, count in stacks:
+                    merged[view][tuple(labels)] += count
+        return merged
+
+    def stats_for(self, view):
+        """Статистика cProfile всех процессов по view или None."""
+        if not settings.PROFILE_DIR:
+            with self.lock:
+                return self.stats.get(view)
+        paths = [path for name, path in self.stats_files() if name == view]
+        if not paths:
+            return None
+        return pstats.Stats(*paths)
+
+    def views(self):
+        """
+        Тройки (view, число сэмплов, есть ли статистика cProfile).
+        view без сэмплов и без статистики скачать нечего - их нет.
+        """
+        samples = {
+            view: sum(stacks.values())
+            for view, stacks in self.samples().items()
+        }
+        if settings.PROFILE_DIR:
+            with_stats = {name for name, _ in self.stats_files()}
+        else:
+            with self.lock:
+                with_stats = set(self.stats)
+        names = {view for view, count in samples.items() if count}
+        return [
+            (view, samples.get(view, 0), view in with_stats)
+            for view in sorted(names | with_stats)
+        ]
+
+
+profiles = Profiles()
+
+
+def collapsed(stacks):
+    """Стеки в формате collapsed stacks для flamegraph.pl."""
+    return "".join(
+        f"{';'.join(labels)} {count}\n"
+        for labels, count in sorted(stacks.items())
+    )
+
+
+def speedscope(view, stacks, interval):
+    """Стеки в формате speedscope, вес сэмпла - в миллисекундах."""
+    frames = {}
+    samples = []
+    weights = []
+    for labels, count in sorted(stacks.items()):
+        samples.append([
+            frames.setdefault(name, len(frames)) for name in labels
+        ])
+        weights.append(count * interval * 1000)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": view,
+        "exporter": "yatube",
+        "shared": {"frames": [{"name": name} for name in frames]},
+        "profiles": [{
+            "type": "sampled",
+            "name": view,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+
+def pstats_dump(stats):
+    """Статистика cProfile в формате файла pstats."""
+    return marshal.dumps(stats.stats)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует долю PROFILE_SAMPLE_RATE запросов. Остальные
+    запросы стоят одного вызова random().
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.PROFILE_SAMPLE_RATE
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+        if settings.PROFILE_MODE == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+            profiles.add_profile(self.view_name(request), profile)
+            return response
+        with Sampler(settings.PROFILE_INTERVAL, CALL_CODE) as sampler:
+            response = self.get_response(request)
+        profiles.add_samples(self.view_name(request), sampler.stacks)
+        return response
+
+    @staticmethod
+    def view_name(request):
+        match = getattr(request, "resolver_match", None)
+        return match.view_name if match else "unresolved"
+
+
+CALL_CODE = ProfilingMiddleware.__call__.__code__
@@ -0,0 +1,105 @@
+"""
+Чтение с реплик, запись в основную базу.
+
+Пользователь, который только что писал, READ_YOUR_WRITES_SECONDS
+секунд читает из основной базы: реплика может отставать, а свой
+пост он должен увидеть сразу. Окно хранится в cookie, поэтому
+работает под любым числом процессов. Окно открывает только запись
+в модели проекта запросом POST, PUT, PATCH или DELETE: сессии
+и last_login пишутся и на GET.
+
+Закрепление действует только внутри запроса. Команды и фоновые
+потоки после записи читают с реплик как прежде; что им нужно
+прочитать сразу после записи, пусть читают в транзакции.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = "primary_pin"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+_state = threading.local()
+
+
+def pinned():
+    return getattr(_state, "pinned", False)
+
+
+def pin():
+    """Чтения до конца запроса идут в основную базу."""
+    _state.pinned = True
+
+
+def reset():
+    _state.in_request = _state.pinned = _state.wrote = False
+
+
+def is_project_model(model):
+    return not model._meta.app_config.name.startswith("django.")
+
+
+def replicas():
+    """
+    Реплики из DATABASE_REPLICAS. Реплика, которая указывает на ту
+    же базу, что и основная (например, зеркало в тестах), не нужна.
+    """
+    primary = connections[DEFAULT_DB_ALIAS].settings_dict["NAME"]
+    return [
+        alias for alias in settings.DATABASE_REPLICAS
+        if connections[alias].settings_dict["NAME"] != primary
+    ]
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Внутри транзакции реплика не видит её изменений.
+        if pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas() or [DEFAULT_DB_ALIAS])
+
+    def db_for_write(self, model, **hints):
+        if getattr(_state, "in_request", False):
+            pin()
+            _state.wrote = _state.wrote or is_project_model(model)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Реплики - копии основной базы, их схему не меняют.
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReadYourWritesMiddleware:
+    """
+    Закрепляет за основной базой запросы на запись и запросы
+    пользователя, который писал недавно, и продлевает окно
+    после каждой записи.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method in WRITE_METHODS
+        try:
+            reset()
+            _state.in_request = True
+            _state.pinned = writes or PIN_COOKIE in request.COOKIES
+            response = self.get_response(request)
+            wrote = writes and _state.wrote
+        finally:
+            reset()
+        if wrote:
+            response.set_cookie(
+                PIN_COOKIE, "1",
+                max_age=settings.READ_YOUR_WRITES_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
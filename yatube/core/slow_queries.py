@@ -0,0 +1,176 @@
+"""
+Журнал медленных запросов к базе.
+
+Запрос дольше SLOW_QUERY_THRESHOLD миллисекунд пишется одной
+JSON-строкой в логгер core.slow_queries: SQL, параметры, view,
+место вызова в коде проекта и план EXPLAIN. Ротацию файла
+делает RotatingFileHandler из LOGGING.
+"""
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from . import metrics, middleware, templating
+
+logger = logging.getLogger(__name__)
+
+DJANGO_DB = os.path.join("django", "db", "")
+INSTRUMENTATION = {
+    __file__, metrics.__file__, middleware.__file__, templating.__file__,
+}
+EXPLAINED = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+STACK_DEPTH = 5
+# Списки IN (%s, %s, ...) разной длины - один и тот же запрос.
+PLACEHOLDERS_RE = re.compile(r"%s(?:, %s)+")
+
+
+def app_frames():
+    """
+    Кадры стека из кода проекта, от внешнего к внутреннему, до
+    входа в django.db. Замеры из core в место вызова не попадают.
+    """
+    frames = []
+    for frame in traceback.extract_stack():
+        if DJANGO_DB in frame.filename:
+            break
+        if (
+            frame.filename.startswith(settings.BASE_DIR)
+            and "site-packages" not in frame.filename
+            and frame.filename not in INSTRUMENTATION
+        ):
+            frames.append(frame)
+    return frames
+
+
+def _location(frame):
+    path = os.path.relpath(frame.filename, settings.BASE_DIR)
+    return f"{path}:{frame.lineno} in {frame.name}"
+
+
+def explain(connection, sql, params):
+    """
+    План запроса. Курсор берётся в обход execute_wrapper,
+    чтобы EXPLAIN не попал в журнал и в метрики.
+    """
+    if not sql.lstrip().upper().startswith(EXPLAINED):
+        return None
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(
+            f"{connection.ops.explain_query_prefix()} {sql}", params
+        )
+        return [str(row[-1]) for row in cursor.fetchall()]
+    except DatabaseError as error:
+        return [f"EXPLAIN failed: {error}"]
+    finally:
+        cursor.close()
+
+
+class SlowQueryLogger:
+    """execute_wrapper, который пишет в журнал медленные запросы."""
+
+    def __init__(self, request, threshold):
+        self.request = request
+        self.threshold = threshold
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - started) * 1000
+        if duration >= self.threshold:
+            self.log(sql, params, many, context["connection"], duration)
+        return result
+
+    def log(self, sql, params, many, connection, duration):
+        frames = app_frames()
+        match = getattr(self.request, "resolver_match", None)
+        logger.warning(json.dumps({
+            "time": timezone.now().isoformat(),
+            "duration_ms": round(duration, 3),
+            "database": connection.alias,
+            "sql": sql,
+            "params": None if many else params,
+            "view": match.view_name if match else None,
+            "method": self.request.method,
+            "path": self.request.path,
+            "location": _location(frames[-1]) if frames else None,
+            "stack": [_location(frame) for frame in frames[-STACK_DEPTH:]],
+            "plan": None if many else explain(connection, sql, params),
+        }, ensure_ascii=False, default=str))
+
+
+class SlowQueryMiddleware:
+    """Ставит SlowQueryLogger на все подключения на время запроса."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = settings.SLOW_QUERY_THRESHOLD
+        if threshold is None:
+            return self.get_response(request)
+        wrapper = SlowQueryLogger(request, threshold)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            return self.get_response(request)
+
+
+def read_log(path):
+    """Записи журнала path и его ротированных копий."""
+    paths = [path] + [
+        f"{path}.{number}" for number in range(1, 100)
+        if os.path.exists(f"{path}.{number}")
+    ]
+    for name in paths:
+        try:
+            with open(name, encoding="utf-8") as log:
+                for line in log:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
+
+
+def fingerprint(sql):
+    return PLACEHOLDERS_RE.sub("%s, ...", sql)
+
+
+def top(records, limit):
+    """
+    Запросы с наибольшим суммарным временем: число вызовов,
+    суммарное и максимальное время, частые view и места вызова
+    и план самого медленного вызова.
+    """
+    groups = defaultdict(lambda: {
+        "count": 0,
+        "total_ms": 0.0,
+        "max_ms": 0.0,
+        "views": Counter(),
+        "locations": Counter(),
+        "plan": None,
+    })
+    for record in records:
+        group = groups[fingerprint(record["sql"])]
+        group["count"] += 1
+        group["total_ms"] += record["duration_ms"]
+        group["views"][record.get("view")] += 1
+        group["locations"][record.get("location")] += 1
+        if record["duration_ms"] >= group["max_ms"]:
+            group["max_ms"] = record["duration_ms"]
+            group["plan"] = record.get("plan")
+    ranked = sorted(
+        groups.items(), key=lambda item: item[1]["total_ms"], reverse=True
+    )
+    return [{"sql": sql, **group} for sql, group in ranked[:limit]]
@@ -0,0 +1,22 @@
+"""Бэкенд шаблонов Django, который замеряет время отрисовки."""
+from django.template import TemplateDoesNotExist
+from django.template.backends import django
+
+from .metrics import timer
+
+
+class Template(django.Template):
+    def render(self, context=None, request=None):
+        with timer("template"):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django.reraise(exc, self)
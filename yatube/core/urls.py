@@ -0,0 +1,14 @@
+from django.urls import path
+
+from . import views
+
+app_name = "core"
+
+urlpatterns = [
+    path("profiles/", views.profile_list, name="profile_list"),
+    path(
+        "profiles/<str:view_name>/<str:fmt>/",
+        views.profile_download,
+        name="profile_download"
+    ),
+]
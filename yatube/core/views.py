@@ -1,4 +1,15 @@
+import json
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+
+from .metrics import CONTENT_TYPE, exposition
+from .profiling import collapsed, profiles, pstats_dump, speedscope
 
 
 def permission_denied_view(request, exception):
@@ -11,3 +22,62 @@ def page_not_found(request, exception):
 
 def server_error(request):
     return render(request, "core/500.html", status=500)
+
+
+def metrics_allowed(request):
+    """Персонал, сборщик с METRICS_TOKEN или адрес из METRICS_ALLOWED_IPS."""
+    if request.user.is_active and request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    if token and constant_time_compare(
+        request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}"
+    ):
+        return True
+    return request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+
+
+@never_cache
+def metrics(request):
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
+
+
+@staff_member_required
+def profile_list(request):
+    return render(request, "core/profiles.html", {
+        "profiles": profiles.views(),
+        "mode": settings.PROFILE_MODE,
+        "rate": settings.PROFILE_SAMPLE_RATE,
+    })
+
+
+@staff_member_required
+def profile_download(request, view_name, fmt):
+    if fmt == "pstats":
+        stats = profiles.stats_for(view_name)
+        if stats is None:
+            raise Http404
+        content = pstats_dump(stats)
+        content_type, extension = "application/octet-stream", "prof"
+    else:
+        stacks = profiles.samples().get(view_name)
+        if not stacks:
+            raise Http404
+        if fmt == "collapsed":
+            content = collapsed(stacks)
+            content_type, extension = "text/plain; charset=utf-8", "folded"
+        elif fmt == "speedscope":
+            content = json.dumps(
+                speedscope(view_name, stacks, settings.PROFILE_INTERVAL),
+                ensure_ascii=False
+            )
+            content_type, extension = "application/json", "speedscope.json"
+        else:
+            raise Http404
+    response = HttpResponse(content, content_type=content_type)
+    filename = view_name.replace(":", "-")
+    response["Content-Disposition"] = (
+        f'attachment; filename="{filename}.{extension}"'
+    )
+    return response
@@ -1,20 +1,106 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import ValidationError
 
-from .models import Comment, Follow, Group, Post
+from . import sharding
+from .models import Comment, Follow, Group, Post, UserStats
+from .search import search_posts
 
 
-class PostAdmin(admin.ModelAdmin):
+class ShardFilter(admin.SimpleListFilter):
+    """Список постов и комментариев читается с одного шарда."""
+
+    title = "шард"
+    parameter_name = "shard"
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.POST_SHARDS]
+
+    def queryset(self, request, queryset):
+        # Шард уже выбрал ShardedAdmin.get_queryset.
+        return queryset
+
+    def choices(self, changelist):
+        # "Все" нет: один список не читает сразу несколько баз.
+        current = self.value() or settings.POST_SHARDS[0]
+        for alias, title in self.lookup_choices:
+            yield {
+                "selected": alias == current,
+                "query_string": changelist.get_query_string(
+                    {self.parameter_name: alias}
+                ),
+                "display": title,
+            }
+
+
+class ShardedAdmin(admin.ModelAdmin):
+    """
+    Админка моделей на шардах: список - с шарда из ShardFilter,
+    объект - с шарда, на который указывает его id. Авторы и группы
+    в основной базе, поэтому они не JOIN-ятся, а подгружаются.
+    """
+
+    prefetch_fields = ()
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if sharding.enabled():
+            return (ShardFilter, *list_filter)
+        return list_filter
+
+    def get_list_select_related(self, request):
+        if sharding.enabled():
+            return ()
+        return super().get_list_select_related(request)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not sharding.enabled():
+            return queryset
+        alias = request.GET.get(ShardFilter.parameter_name)
+        if alias not in settings.POST_SHARDS:
+            alias = settings.POST_SHARDS[0]
+        return queryset.using(alias).prefetch_related(
+            *self.prefetch_fields
+        )
+
+    def get_object(self, request, object_id, from_field=None):
+        if not sharding.enabled():
+            return super().get_object(request, object_id, from_field)
+        try:
+            object_id = self.model._meta.pk.to_python(object_id)
+        except ValidationError:
+            return None
+        queryset = super().get_queryset(request).using(
+            sharding.shard_for(post_id=object_id)
+        )
+        return queryset.filter(pk=object_id).first()
+
+
+class PostAdmin(ShardedAdmin):
     list_display = (
         "pk",
         "text",
         "pub_date",
         "author",
         "group",
+        "comment_count",
     )
     search_fields = ("text",)
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
     list_editable = ("group",)
+    prefetch_fields = ("author", "group")
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по подстроке, как обычно в админке, плюс формы слов
+        # из поискового индекса.
+        found, use_distinct = super().get_search_results(
+            request, queryset, search_term
+        )
+        if search_term:
+            found |= queryset.filter(pk__in=search_posts(search_term))
+        return found, use_distinct
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -28,7 +114,7 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ShardedAdmin):
     list_display = (
         "pk",
         "author",
@@ -38,6 +124,7 @@ class CommentAdmin(admin.ModelAdmin):
     )
     search_fields = ("text",)
     empty_value_display = "-пусто-"
+    prefetch_fields = ("author", "post")
 
 
 class FollowAdmin(admin.ModelAdmin):
@@ -50,7 +137,18 @@ class FollowAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
 
 
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        "user",
+        "post_count",
+        "follower_count",
+        "following_count",
+    )
+    readonly_fields = list_display
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(UserStats, UserStatsAdmin)
@@ -0,0 +1,298 @@
+import copy
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.middleware.cache import CacheMiddleware
+from django.utils.decorators import decorator_from_middleware_with_args
+from django.views.decorators.vary import vary_on_cookie
+
+from core.metrics import timer
+
+from . import sharding
+from .models import Comment, Group, Post, User
+
+VERSION_PREFIX = "page_version"
+
+
+def _scope_key(prefix, scope, *suffix):
+    # slug и username бывают не ASCII, а memcached принимает только
+    # короткие ключи без пробелов, поэтому части области хешируются.
+    name, *parts = scope
+    if parts:
+        name += ":" + hashlib.md5(
+            "\x1f".join(str(part) for part in parts).encode()
+        ).hexdigest()
+    return ":".join(str(part) for part in (prefix, name, *suffix))
+
+
+def _version_key(scope):
+    return _scope_key(VERSION_PREFIX, scope)
+
+
+def _new_version():
+    # Версия, выданная после вытеснения ключа из кэша, всегда больше
+    # прежних, поэтому старые страницы не оживают.
+    return int(time.time() * 1000)
+
+
+class SingleFlightCache:
+    """
+    Обёртка кэша для CacheMiddleware: страницу пересчитывает один
+    процесс, остальные тем временем получают прежнюю.
+
+    Запись живёт на PAGE_CACHE_STALE секунд дольше своего срока.
+    Кто первым прочитал просроченную запись, берёт блокировку
+    и получает промах, остальные - устаревшую страницу. Если записи
+    нет совсем, остальные до PAGE_CACHE_LOCK_WAIT секунд ждут,
+    пока её запишут. Блокировки снимаются при записи или release();
+    если процесс упал, их снимет PAGE_CACHE_LOCK_TIMEOUT.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.locks = set()
+
+    def _lock(self, key):
+        if self.cache.add(
+            f"{key}:lock", 1, timeout=settings.PAGE_CACHE_LOCK_TIMEOUT
+        ):
+            self.locks.add(key)
+            return True
+        return False
+
+    def get(self, key, default=None):
+        entry = self.cache.get(key)
+        if (
+            entry is not None
+            and time.time() >= entry[1]
+            and hasattr(self.cache, "discard")
+        ):
+            # Устаревшая копия могла остаться только в L1 этого
+            # процесса, а в общем кэше страницу уже пересчитали.
+            self.cache.discard(key)
+            entry = self.cache.get(key)
+        if entry is not None:
+            value, fresh_until = entry
+            if time.time() < fresh_until or not self._lock(key):
+                return value
+            return default
+        deadline = time.monotonic() + settings.PAGE_CACHE_LOCK_WAIT
+        while not self._lock(key):
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry[0]
+        return default
+
+    def set(self, key, value, timeout):
+        self.cache.set(
+            key,
+            (value, time.time() + timeout),
+            timeout=timeout + settings.PAGE_CACHE_STALE
+        )
+        if key in self.locks:
+            self.locks.discard(key)
+            self.cache.delete(f"{key}:lock")
+
+    def release(self):
+        """Снимает блокировки, которые не сняла запись."""
+        if not self.locks:
+            return
+        self.cache.delete_many([f"{key}:lock" for key in self.locks])
+        self.locks.clear()
+
+
+class TimedCacheMiddleware(CacheMiddleware):
+    """
+    CacheMiddleware с защитой от одновременного пересчёта страницы,
+    время поиска и записи которого видно в замерах.
+
+    Экземпляр один на view, а префикс ключа (request.page_cache_prefix)
+    и блокировки пересчёта свои у каждого запроса - их держит
+    копия экземпляра, привязанная к запросу.
+    """
+
+    def _bound(self, request):
+        bound = getattr(request, "_page_cache", None)
+        if bound is None:
+            bound = copy.copy(self)
+            bound.key_prefix = getattr(
+                request, "page_cache_prefix", self.key_prefix
+            )
+            bound.cache = SingleFlightCache(caches[self.cache_alias])
+            request._page_cache = bound
+        return bound
+
+    def process_request(self, request):
+        with timer("cache"):
+            return CacheMiddleware.process_request(
+                self._bound(request), request
+            )
+
+    def process_response(self, request, response):
+        bound = self._bound(request)
+        with timer("cache"):
+            try:
+                return CacheMiddleware.process_response(
+                    bound, request, response
+                )
+            finally:
+                bound.cache.release()
+
+    def process_exception(self, request, exception):
+        self._bound(request).cache.release()
+
+
+def cache_page(timeout, key_prefix):
+    return decorator_from_middleware_with_args(TimedCacheMiddleware)(
+        cache_timeout=timeout, key_prefix=key_prefix
+    )
+
+
+@timer("cache")
+def get_versions(scopes):
+    """Текущие версии областей кэша, например ("group", slug)."""
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+@timer("cache")
+def bump(*scopes):
+    """Сбрасывает закэшированные страницы перечисленных областей."""
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _new_version(), timeout=None)
+
+
+def cache_versioned(get_scopes, timeout=None, per_user=True):
+    """
+    cache_page, ключ которого включает версии областей.
+
+    get_scopes(**kwargs) получает аргументы view и возвращает области,
+    от которых зависит страница. Страница живёт долго, но сразу
+    перестаёт отдаваться после bump() любой из её областей.
+    per_user=False - ответ одинаков для всех и кэшируется один раз.
+    """
+    def decorator(view):
+        @wraps(view)
+        def rendered(request, *args, **kwargs):
+            # До самого view доходит только промах кэша.
+            request.page_cache_hit = False
+            return view(request, *args, **kwargs)
+
+        # Шапка страницы своя у каждого пользователя, а Vary: Cookie
+        # от SessionMiddleware появляется уже после cache_page.
+        view_for_cookie = vary_on_cookie(rendered) if per_user else rendered
+        cached_view = cache_page(
+            timeout or settings.PAGE_CACHE_TIMEOUT, key_prefix=view.__name__
+        )(view_for_cookie)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            request.page_cache_hit = True
+            scopes = get_scopes(**kwargs)
+            versions = get_versions(scopes)
+            request.cache_versions = dict(zip(scopes, versions))
+            request.page_cache_prefix = ":".join(
+                [view.__name__] + [str(version) for version in versions]
+            )
+            return cached_view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cached_object(request, scope, load):
+    """
+    Объект, который живёт в кэше до bump() области scope, например
+    группа для своей страницы. Версию области для страницы
+    cache_versioned уже прочитал.
+    """
+    version = getattr(request, "cache_versions", {}).get(scope)
+    if version is None:
+        version, = get_versions([scope])
+    key = _scope_key("object", scope, version)
+    value = cache.get(key)
+    if value is None:
+        value = load()
+        cache.set(key, value, settings.PAGE_CACHE_TIMEOUT)
+    return value
+
+
+def post_page_scopes(post_id):
+    """Страница поста зависит и от счётчиков автора, и от его группы."""
+    posts = Post.objects.on_shard(post_id=post_id).filter(pk=post_id)
+    if sharding.enabled():
+        # Пользователи и группы в основной базе, JOIN с шардом невозможен.
+        author_id, group_id = posts.values_list(
+            "author_id", "group_id"
+        ).first() or (None, None)
+        username = User.objects.filter(pk=author_id).values_list(
+            "username", flat=True
+        ).first()
+        slug = group_id and Group.objects.filter(pk=group_id).values_list(
+            "slug", flat=True
+        ).first()
+    else:
+        username, slug = posts.values_list(
+            "author__username", "group__slug"
+        ).first() or (None, None)
+    scopes = [("post", post_id), ("author", username)]
+    if slug:
+        scopes.append(("group", slug))
+    return scopes
+
+
+def bump_author(user, old_username=None):
+    """Сбрасывает страницы, на которых видно имя автора."""
+    group_ids = set(
+        Post.objects.on_shard(author_id=user.pk).filter(
+            author_id=user.pk, group__isnull=False
+        ).values_list("group_id", flat=True).distinct()
+    )
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        "slug", flat=True
+    )
+    scopes = [("index",), ("author", user.username)]
+    scopes += [("group", slug) for slug in slugs]
+    if old_username and old_username != user.username:
+        # Под комментариями выводится username.
+        scopes.append(("author", old_username))
+        scopes += [
+            ("post", post_id)
+            for comments in sharding.each(
+                Comment.objects.filter(author_id=user.pk)
+            )
+            for post_id in set(
+                comments.values_list("post_id", flat=True)
+            )
+        ]
+    bump(*scopes)
+
+
+def bump_post(post, *old_group_ids):
+    """Сбрасывает все страницы, на которых виден пост."""
+    group_ids = {post.group_id, *old_group_ids} - {None}
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        "slug", flat=True
+    )
+    bump(
+        ("index",),
+        ("post", post.pk),
+        ("author", post.author.username),
+        *(("group", slug) for slug in slugs)
+    )
@@ -0,0 +1,89 @@
+from collections import Counter
+
+from django.apps import apps as global_apps
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import sharding
+from .models import Post, UserStats
+
+
+def bump_user(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя на deltas."""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    updated = UserStats.objects.filter(user_id=user_id).update(**updates)
+    # Уменьшать нечего, а при каскадном удалении пользователя
+    # новая строка сослалась бы на удалённую запись.
+    if not updated and min(deltas.values()) > 0:
+        UserStats.objects.get_or_create(user_id=user_id)
+        UserStats.objects.filter(user_id=user_id).update(**updates)
+
+
+def bump_post(post_id, delta):
+    """Атомарно сдвигает счётчик комментариев поста."""
+    Post.objects.on_shard(post_id=post_id).filter(pk=post_id).update(
+        comment_count=F("comment_count") + delta
+    )
+
+
+def get_stats(user):
+    """Счётчики пользователя, нули - если их ещё не заводили."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def _count(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef("pk")}
+            ).order_by().values(field).annotate(
+                total=Count("pk")
+            ).values("total")
+        ),
+        0
+    )
+
+
+def rebuild(apps=global_apps):
+    """Пересчитывает все счётчики по данным, например после импорта."""
+    User = apps.get_model("auth", "User")
+    Post = apps.get_model("posts", "Post")
+    Comment = apps.get_model("posts", "Comment")
+    Follow = apps.get_model("posts", "Follow")
+    UserStats = apps.get_model("posts", "UserStats")
+    UserStats.objects.bulk_create(
+        (
+            UserStats(user_id=pk)
+            for pk in User.objects.filter(
+                stats__isnull=True
+            ).values_list("pk", flat=True)
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    # Комментарии лежат на шарде своего поста - подзапрос не выходит
+    # за пределы шарда.
+    for posts in sharding.each(Post.objects.all()):
+        posts.update(comment_count=_count(Comment, "post"))
+    # В подзапросах OuterRef("pk") указывает на user_id счётчика.
+    UserStats.objects.update(
+        follower_count=_count(Follow, "author"),
+        following_count=_count(Follow, "user"),
+    )
+    if not sharding.enabled():
+        UserStats.objects.update(post_count=_count(Post, "author"))
+        return
+    # Посты на шардах, счётчики в основной базе: подзапрос невозможен.
+    post_counts = Counter()
+    for posts in sharding.each(Post.objects.order_by()):
+        post_counts.update(dict(
+            posts.values_list("author_id").annotate(total=Count("pk"))
+        ))
+    UserStats.objects.update(post_count=0)
+    stats = list(UserStats.objects.filter(user_id__in=list(post_counts)))
+    for row in stats:
+        row.post_count = post_counts[row.user_id]
+    UserStats.objects.bulk_update(stats, ["post_count"], batch_size=500)
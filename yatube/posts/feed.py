@@ -0,0 +1,217 @@
+import logging
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+
+from core.metrics import registry
+
+from . import sharding
+from .models import FEED_FIELDS, FeedEntry, Follow, Post, UserStats
+from .paginators import CURSOR_FIELDS, MergedFeed, keyset_slice
+
+logger = logging.getLogger(__name__)
+
+# Какая ветка обслужила чтение ленты или раскладку поста, см. /metrics.
+REQUESTS_METRIC = "yatube_follow_feed_requests_total"
+
+
+def _count(op, path):
+    registry.inc(REQUESTS_METRIC, {"op": op, "path": path})
+
+
+def is_pulled(author_id):
+    """Посты автора с большим числом подписчиков читаются при показе."""
+    return UserStats.objects.filter(
+        user_id=author_id,
+        follower_count__gt=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+def pulled_authors(user):
+    """Авторы из подписок пользователя, которых не раскладывают по лентам."""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__follower_count__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list("author_id", flat=True)
+    )
+
+
+def _create_entries(entries):
+    FeedEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def push_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if sharding.enabled():
+        return
+    if is_pulled(post.author_id):
+        _count("write", "pull")
+        return
+    _count("write", "push")
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list("user_id", flat=True)
+    _create_entries(
+        FeedEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers.iterator()
+    )
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика уже опубликованные посты автора."""
+    if sharding.enabled() or is_pulled(follow.author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=follow.author_id
+    ).values_list("id", "pub_date")
+    _create_entries(
+        FeedEntry(
+            user_id=follow.user_id,
+            post_id=post_id,
+            author_id=follow.author_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def prune(follow):
+    """
+    Убирает посты автора из ленты отписавшегося пользователя.
+
+    Если автор при этом опустился до порога, его посты снова
+    раскладываются по лентам оставшихся подписчиков.
+    """
+    FeedEntry.objects.filter(
+        user_id=follow.user_id,
+        author_id=follow.author_id
+    ).delete()
+    crossed = UserStats.objects.filter(
+        user_id=follow.author_id,
+        follower_count=settings.FEED_FANOUT_LIMIT
+    ).exists()
+    if crossed:
+        followers = Follow.objects.filter(author_id=follow.author_id)
+        for other in followers.iterator():
+            backfill(other)
+
+
+def rebuild():
+    """
+    Заново раскладывает ленты по подпискам, например после импорта.
+
+    Порог FEED_FANOUT_LIMIT берётся из UserStats, поэтому счётчики
+    должны быть пересчитаны раньше.
+    """
+    FeedEntry.objects.all().delete()
+    if sharding.enabled():
+        _rebuild_from_shards()
+        return
+    # Одним INSERT ... SELECT: построчный backfill на миллионах
+    # записей упирается в сборку объектов в Python.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FeedEntry._meta.db_table} "
+            "(user_id, post_id, author_id, pub_date) "
+            "SELECT follow.user_id, post.id, post.author_id, post.pub_date "
+            f"FROM {Follow._meta.db_table} follow "
+            f"INNER JOIN {Post._meta.db_table} post "
+            "ON post.author_id = follow.author_id "
+            f"LEFT JOIN {UserStats._meta.db_table} stats "
+            "ON stats.user_id = follow.author_id "
+            "WHERE COALESCE(stats.follower_count, 0) <= %s",
+            [settings.FEED_FANOUT_LIMIT],
+        )
+
+
+def _rebuild_from_shards(batch_size=5000):
+    # Подписки в основной базе, посты на шардах: JOIN невозможен,
+    # записи собираются в Python пачками.
+    followers = defaultdict(list)
+    follows = Follow.objects.exclude(
+        author__stats__follower_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values_list("author_id", "user_id")
+    for author_id, user_id in follows.iterator():
+        followers[author_id].append(user_id)
+    entries = (
+        FeedEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for posts in sharding.each(Post.objects.order_by())
+        for post_id, author_id, pub_date in posts.values_list(
+            "pk", "author_id", "pub_date"
+        ).iterator()
+        for user_id in followers.get(author_id, ())
+    )
+    for batch in iter(lambda: list(islice(entries, batch_size)), []):
+        FeedEntry.objects.bulk_create(batch)
+
+
+class HybridFeed(MergedFeed):
+    """
+    Лента подписок: inbox пользователя, слитый по (pub_date, id)
+    с потоками постов авторов, которых не раскладывают при записи.
+    """
+
+    def __init__(self, user):
+        pulled = pulled_authors(user)
+        self.inbox = FeedEntry.objects.filter(user=user).select_related(
+            "post__author", "post__group"
+        ).only(
+            "pub_date", "post", *(f"post__{field}" for field in FEED_FIELDS)
+        ).order_by("-pub_date", "-post_id")
+        if pulled:
+            self.inbox = self.inbox.exclude(author_id__in=pulled)
+        self.streams = [
+            Post.objects.filter(author_id=author_id).for_feed()
+            for author_id in pulled
+        ]
+        self.path = "hybrid" if pulled else "inbox"
+        _count("read", self.path)
+        logger.debug(
+            "follow feed for %s: %s, pulled authors: %s",
+            user.pk, self.path, len(pulled)
+        )
+
+    def slices(self, values, reverse, limit):
+        inbox = keyset_slice(
+            self.inbox, ("pub_date", "post_id"), values, reverse, limit
+        )
+        return [[entry.post for entry in inbox]] + [
+            keyset_slice(stream, CURSOR_FIELDS, values, reverse, limit)
+            for stream in self.streams
+        ]
+
+    def count(self):
+        return self.inbox.count() + sum(
+            stream.count() for stream in self.streams
+        )
+
+
+def follow_feed(user):
+    """
+    Лента подписок пользователя. На шардах раскладки нет: посты
+    авторов читаются с их шардов и сливаются.
+    """
+    if sharding.enabled():
+        _count("read", "sharded")
+        authors = Follow.objects.filter(user=user).values_list(
+            "author_id", flat=True
+        )
+        return sharding.by_authors(Post.objects.for_feed(), authors)
+    return HybridFeed(user)
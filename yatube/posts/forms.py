@@ -1,6 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import models
 
+from .images import normalize
 from .models import Comment, Post
 
 
@@ -17,6 +19,12 @@ class PostForm(forms.ModelForm):
             "group": "Группа",
         }
 
+    def clean_image(self):
+        image = self.cleaned_data["image"]
+        if isinstance(image, UploadedFile):
+            return normalize(image)
+        return image
+
 
 class CommentForm(models.ModelForm):
     class Meta:
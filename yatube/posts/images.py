@@ -0,0 +1,65 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+from sorl.thumbnail.base import EXTENSIONS
+
+# Форматы, в которых картинка хранится как есть, и их расширения.
+KEEP_FORMATS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif"}
+MIME_TYPES = {"AVIF": "image/avif", "WEBP": "image/webp"}
+
+
+def modern_formats():
+    """
+    Форматы из IMAGE_VARIANT_FORMATS, которые умеют сохранять
+    и Pillow, и sorl-thumbnail в этом окружении.
+    """
+    Image.init()
+    return [
+        fmt for fmt in settings.IMAGE_VARIANT_FORMATS
+        if fmt in Image.SAVE and fmt in EXTENSIONS
+        and (fmt != "WEBP" or features.check("webp"))
+    ]
+
+
+def normalize(upload):
+    """
+    Перекодирует загруженную картинку без метаданных.
+
+    Поворот из EXIF применяется к пикселям, большая сторона
+    ограничивается IMAGE_MAX_SIZE. JPEG, PNG и GIF сохраняют
+    свой формат и имя файла, остальные форматы становятся
+    PNG с прозрачностью или JPEG без неё.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    if getattr(image, "is_animated", False):
+        # Кадры анимации при перекодировании потерялись бы.
+        upload.seek(0)
+        return upload
+    fmt = image.format
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((settings.IMAGE_MAX_SIZE, settings.IMAGE_MAX_SIZE))
+    has_alpha = (
+        image.mode in ("RGBA", "LA")
+        or "transparency" in image.info
+    )
+    if fmt not in KEEP_FORMATS:
+        fmt = "PNG" if has_alpha else "JPEG"
+    if fmt == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    options = {"format": fmt}
+    if fmt == "JPEG":
+        options.update(quality=settings.IMAGE_QUALITY, optimize=True)
+    elif fmt == "PNG":
+        options["optimize"] = True
+    elif "transparency" in image.info:
+        options["transparency"] = image.info["transparency"]
+    buffer = io.BytesIO()
+    image.save(buffer, **options)
+    root, ext = os.path.splitext(os.path.basename(upload.name))
+    if ext.lower() not in (".jpeg", KEEP_FORMATS[fmt]):
+        ext = KEEP_FORMATS[fmt]
+    return ContentFile(buffer.getvalue(), name=root + ext)
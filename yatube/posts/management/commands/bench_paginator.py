@@ -0,0 +1,60 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.template import engines
+from django.template.loader import get_template
+
+# Разметка номеров страниц до elided_page_range: ссылка на каждую.
+FULL_RANGE_TEMPLATE = """
+{% for i in page_obj.paginator.page_range %}
+  {% if page_obj.number == i %}
+    <li class="page-item active">
+      <span class="page-link">{{ i }}</span>
+    </li>
+  {% else %}
+    <li class="page-item">
+      <a class="page-link" href="?{{ page_query }}page={{ i }}">{{ i }}</a>
+    </li>
+  {% endif %}
+{% endfor %}
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время отрисовки и размер пагинатора со всеми "
+        "номерами страниц и с сокращённым диапазоном."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--posts", type=int, default=50000,
+            help="Число постов в ленте."
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20,
+            help="Сколько раз отрисовать каждый вариант."
+        )
+
+    def handle(self, *args, **options):
+        paginator = Paginator(range(options["posts"]), 10)
+        page_obj = paginator.page(paginator.num_pages // 2 or 1)
+        context = {"page_obj": page_obj, "page_query": ""}
+        variants = (
+            ("full", engines["django"].from_string(FULL_RANGE_TEMPLATE)),
+            ("elided", get_template("posts/includes/paginator.html")),
+        )
+        self.stdout.write(
+            f"Страниц: {paginator.num_pages}, текущая: {page_obj.number}"
+        )
+        for name, template in variants:
+            size = len(template.render(context).encode())
+            seconds = timeit.timeit(
+                lambda: template.render(context),
+                number=options["repeat"]
+            )
+            self.stdout.write(
+                f"{name:>7}: {seconds / options['repeat'] * 1000:.2f} мс, "
+                f"{size} байт"
+            )
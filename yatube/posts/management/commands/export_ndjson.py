@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts.ndjson import MODELS, Progress, export_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает пользователей, группы, посты, комментарии и подписки "
+        "в NDJSON, не держа их в памяти."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output", nargs="?", default="-",
+            help="Файл для выгрузки, по умолчанию stdout."
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=2000,
+            help="Сколько строк читать из БД за раз."
+        )
+
+    def handle(self, *args, **options):
+        progress = Progress(self.stderr.write)
+        if options["output"] == "-":
+            export_rows(sys.stdout, options["batch_size"], progress)
+        else:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                export_rows(output, options["batch_size"], progress)
+        progress.report(", ".join(MODELS))
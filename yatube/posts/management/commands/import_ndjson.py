@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts.ndjson import Progress, import_rows, rebuild_derived
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает NDJSON из export_ndjson пачками через bulk_create "
+        "и пересчитывает счётчики, ленты и поисковый индекс. "
+        "С шардами посты и комментарии получают новые id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "input", nargs="?", default="-",
+            help="Файл для загрузки, по умолчанию stdin."
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=2000,
+            help="Сколько объектов записывать одним bulk_create."
+        )
+
+    def handle(self, *args, **options):
+        progress = Progress(self.stdout.write)
+        if options["input"] == "-":
+            skipped = import_rows(sys.stdin, options["batch_size"], progress)
+        else:
+            with open(options["input"], encoding="utf-8") as lines:
+                skipped = import_rows(lines, options["batch_size"], progress)
+        progress.report("загружено")
+        if skipped:
+            self.stdout.write(f"Пропущено строк других моделей: {skipped}")
+        rebuild_derived()
+        self.stdout.write(self.style.SUCCESS("Импорт завершён"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает счётчики постов, комментариев и подписок, "
+        "например после массового импорта."
+    )
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(self.style.SUCCESS("Счётчики пересчитаны"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import sharding
+from posts.models import Post
+from posts.thumbnails import render_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит миниатюры THUMBNAIL_GEOMETRIES для всех постов "
+        "с картинками, например для постов до появления очереди."
+    )
+
+    def handle(self, *args, **options):
+        images = Post.objects.exclude(image="").values_list(
+            "image", flat=True
+        )
+        names = (
+            name for shard in sharding.each(images)
+            for name in shard.iterator()
+        )
+        for done, name in enumerate(names, 1):
+            try:
+                render_all(name)
+            except Exception as error:
+                self.stderr.write(f"{name}: {error}")
+            if done % 100 == 0:
+                self.stdout.write(f"Готово: {done}")
+        self.stdout.write(self.style.SUCCESS("Миниатюры построены"))
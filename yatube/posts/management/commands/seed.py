@@ -0,0 +1,75 @@
+import argparse
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from posts.ndjson import Progress, rebuild_derived
+from posts.seeding import EPOCH, Seeder
+
+
+def moment(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise argparse.ArgumentTypeError(f"не дата и время: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет БД синтетическими пользователями, группами, постами, "
+        "комментариями и подписками. Один seed - одни и те же данные."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in (
+            ("users", 1000),
+            ("groups", 50),
+            ("posts", 20000),
+            ("comments", 50000),
+            ("follows", 20000),
+        ):
+            parser.add_argument(f"--{name}", type=int, default=default)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--skew", type=float, default=1.1,
+            help="Показатель Ципфа для авторов, групп и подписок."
+        )
+        parser.add_argument(
+            "--days", type=int, default=365,
+            help="За сколько дней распределить даты постов."
+        )
+        parser.add_argument(
+            "--now", type=moment, default=EPOCH,
+            help="От какого момента отсчитывать даты, по умолчанию "
+                 f"{EPOCH.isoformat()}."
+        )
+        parser.add_argument(
+            "--first-id", type=int, default=1,
+            help="С какого id нумеровать новые строки каждой таблицы."
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        progress = Progress(self.stdout.write, every=100000)
+        seeder = Seeder(
+            options["seed"],
+            options["batch_size"],
+            options["skew"],
+            options["days"],
+            progress,
+            now=options["now"],
+            first_id=options["first_id"],
+        )
+        seeder.run(
+            options["users"],
+            options["groups"],
+            options["posts"],
+            options["comments"],
+            options["follows"],
+        )
+        progress.report("создано")
+        rebuild_derived()
+        self.stdout.write(self.style.SUCCESS("Данные созданы"))
@@ -0,0 +1,71 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    # Только исторические модели и база миграции: шарды в этот момент
+    # могут быть ещё не созданы. Посты, уже лежащие на шардах,
+    # пересчитывает manage.py rebuild_counters.
+    alias = schema_editor.connection.alias
+    User = apps.get_model("auth", "User")
+    Post = apps.get_model("posts", "Post")
+    Comment = apps.get_model("posts", "Comment")
+    Follow = apps.get_model("posts", "Follow")
+    UserStats = apps.get_model("posts", "UserStats")
+
+    def count(model, field):
+        return Coalesce(
+            Subquery(
+                model.objects.using(alias).filter(
+                    **{field: OuterRef("pk")}
+                ).order_by().values(field).annotate(
+                    total=Count("pk")
+                ).values("total")
+            ),
+            0
+        )
+
+    UserStats.objects.using(alias).bulk_create(
+        (
+            UserStats(user_id=pk)
+            for pk in User.objects.using(alias).values_list("pk", flat=True)
+        ),
+        batch_size=500,
+    )
+    Post.objects.using(alias).update(comment_count=count(Comment, "post"))
+    UserStats.objects.using(alias).update(
+        post_count=count(Post, "author"),
+        follower_count=count(Follow, "author"),
+        following_count=count(Follow, "user"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0011_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('post_count', models.IntegerField(default=0, verbose_name='Постов')),
+                ('follower_count', models.IntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.IntegerField(default=0, verbose_name='Подписок')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def fill_search_index(apps, schema_editor):
+    # Индекс из 0014 пуст для постов, написанных до неё.
+    from posts import search
+
+    alias = schema_editor.connection.alias
+    SearchTerm = apps.get_model("posts", "SearchTerm")
+    search.fill(
+        search.make_backend(
+            schema_editor.connection, SearchTerm.objects.using(alias)
+        ),
+        [apps.get_model("posts", "Post").objects.using(alias)],
+        [apps.get_model("posts", "Comment").objects.using(alias)],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_shardticket'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,32 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Prefetch
 from django.db.models.deletion import CASCADE
 
+from . import sharding
+
 User = get_user_model()
 
+# Колонки, которые выводят карточка поста и страница поста.
+FEED_FIELDS = (
+    "text",
+    "pub_date",
+    "image",
+    "author",
+    "author__username",
+    "author__first_name",
+    "author__last_name",
+    "group",
+    "group__title",
+    "group__slug",
+    "comment_count",
+    "updated",
+)
+# Те же колонки без полей автора и группы - для шардов, где JOIN
+# с основной базой невозможен.
+SHARD_FEED_FIELDS = tuple(field for field in FEED_FIELDS if "__" not in field)
+AUTHOR_FIELDS = ("username", "first_name", "last_name")
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
@@ -14,6 +37,48 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(sharding.ShardedQuerySet):
+    def on_shard(self, author_id=None, post_id=None):
+        """Посты на шарде автора или поста; без шардов - как есть."""
+        return self.using(
+            sharding.shard_for(author_id=author_id, post_id=post_id)
+        )
+
+    def for_feed(self):
+        """Посты вместе с автором и группой одним запросом."""
+        if sharding.enabled():
+            return self._prefetch_author_group(
+                User.objects.only(*AUTHOR_FIELDS)
+            )
+        return self.select_related("author", "group").only(*FEED_FIELDS)
+
+    def for_detail(self):
+        """Пост для своей страницы: ещё и счётчики автора."""
+        if sharding.enabled():
+            return self._prefetch_author_group(
+                User.objects.select_related("stats").only(
+                    *AUTHOR_FIELDS, "stats__post_count"
+                )
+            )
+        return self.for_feed().select_related("author__stats").only(
+            *FEED_FIELDS, "author__stats__post_count"
+        )
+
+    def with_author(self):
+        """Посты с автором: JOIN или, на шардах, отдельный запрос."""
+        if sharding.enabled():
+            return self.prefetch_related("author")
+        return self.select_related("author")
+
+    def _prefetch_author_group(self, authors):
+        # Авторы и группы лежат в основной базе и читаются
+        # отдельными запросами на всю страницу.
+        return self.prefetch_related(
+            Prefetch("author", authors),
+            Prefetch("group", Group.objects.only("title", "slug")),
+        ).only(*SHARD_FEED_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField(
         "Текст поста",
@@ -41,12 +106,43 @@ class Post(models.Model):
         help_text="Выберите группу",
     )
     image = models.ImageField("Картинка", upload_to="posts/", blank=True)
+    updated = models.DateTimeField("Дата изменения", auto_now=True)
+    comment_count = models.IntegerField(
+        "Комментариев",
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
 
     class Meta:
         ordering = ("-pub_date",)
+        # Ленты автора и группы фильтруют по одному полю и сортируют
+        # по ключу курсора (pub_date, id) - без временной сортировки.
+        indexes = [
+            models.Index(
+                fields=("author", "-pub_date", "-id"),
+                name="post_author_date_idx"
+            ),
+            models.Index(
+                fields=("group", "-pub_date", "-id"),
+                name="post_group_date_idx"
+            ),
+        ]
+
+
+class CommentQuerySet(sharding.ShardedQuerySet):
+    def for_feed(self):
+        """Комментарии вместе с именем автора одним запросом."""
+        fields = ("post", "text", "created", "author")
+        if sharding.enabled():
+            return self.prefetch_related(
+                Prefetch("author", User.objects.only("username"))
+            ).only(*fields)
+        return self.select_related("author").only(*fields, "author__username")
 
 
 class Comment(models.Model):
@@ -63,11 +159,19 @@ class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = CommentQuerySet.as_manager()
+
     def __str__(self):
         return self.text
 
     class Meta:
         ordering = ("-created",)
+        indexes = [
+            models.Index(
+                fields=("post", "-created", "-id"),
+                name="comment_post_created_idx"
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -92,3 +196,107 @@ class Follow(models.Model):
                 name="unique_pair"
             ),
         ]
+        # unique_pair ищет подписки пользователя, этот индекс -
+        # подписчиков автора.
+        indexes = [
+            models.Index(
+                fields=("author", "user"),
+                name="follow_author_user_idx"
+            ),
+        ]
+
+
+class SearchTerm(models.Model):
+    """Запись обратного индекса поиска, если в SQLite нет FTS5."""
+
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(Post, on_delete=CASCADE, related_name="+")
+    comment = models.ForeignKey(
+        Comment,
+        on_delete=CASCADE,
+        null=True,
+        related_name="+"
+    )
+    count = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return self.term
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=("term", "post"),
+                name="search_term_post_idx"
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, обновляются сигналами."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=CASCADE,
+        primary_key=True,
+        related_name="stats"
+    )
+    post_count = models.IntegerField("Постов", default=0)
+    follower_count = models.IntegerField("Подписчиков", default=0)
+    following_count = models.IntegerField("Подписок", default=0)
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class FeedEntry(models.Model):
+    """Запись в ленте подписчика, создаётся при публикации поста."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=CASCADE,
+        related_name="feed_entries"
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=CASCADE,
+        related_name="feed_entries"
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=CASCADE,
+        related_name="+"
+    )
+    pub_date = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id}: {self.post_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "post"),
+                name="unique_feed_entry"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=("user", "-pub_date", "-post"),
+                name="feed_entry_user_date_idx"
+            ),
+            models.Index(
+                fields=("user", "author"),
+                name="feed_entry_user_author_idx"
+            ),
+        ]
+
+
+class ShardTicket(models.Model):
+    """
+    Выдаёт id постам и комментариям на шардах. Таблица держит
+    одну строку, см. sharding.next_ticket.
+    """
+
+    stub = models.CharField(max_length=1, unique=True)
+
+    def __str__(self):
+        return self.stub
@@ -0,0 +1,249 @@
+"""
+Потоковые выгрузка и загрузка данных сайта в NDJSON.
+
+Каждая строка - объект в формате dumpdata:
+{"model": "posts.post", "pk": 1, "fields": {...}}.
+
+С шардами id поста указывает на шард, а в выгрузке без шардов -
+нет, поэтому при загрузке посты и комментарии получают новые id
+из ShardTicket, а комментарии - новые id своих постов.
+"""
+import datetime
+import itertools
+import json
+import time
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+
+from . import counters, feed, search, sharding
+
+# Порядок моделей учитывает внешние ключи: сначала те, на кого ссылаются.
+MODELS = (
+    "auth.user",
+    "posts.group",
+    "posts.post",
+    "posts.comment",
+    "posts.follow",
+)
+
+
+class Encoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder округляет время до миллисекунд, а ключ
+    курсора (pub_date, id) должен пережить выгрузку без потерь.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class Progress:
+    """Печатает число обработанных строк и скорость раз в every строк."""
+
+    def __init__(self, write, every=10000):
+        self.write = write
+        self.every = every
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def add(self, label, rows=1):
+        before = self.rows
+        self.rows += rows
+        if before // self.every != self.rows // self.every:
+            self.report(label)
+
+    def report(self, label):
+        elapsed = time.monotonic() - self.started or 1e-9
+        self.write(
+            f"{label}: {self.rows} строк, {self.rows / elapsed:.0f} строк/с"
+        )
+
+
+def _fields(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+
+
+def export_rows(output, batch_size, progress):
+    """Пишет все объекты MODELS в output, по строке на объект."""
+    for label in MODELS:
+        model = apps.get_model(label)
+        fields = _fields(model)
+        rows = model._base_manager.order_by("pk").values_list(
+            "pk", *(field.attname for field in fields)
+        )
+        if label in sharding.SHARDED_MODELS:
+            rows = itertools.chain.from_iterable(
+                shard.iterator(chunk_size=batch_size)
+                for shard in sharding.each(rows)
+            )
+        else:
+            rows = rows.iterator(chunk_size=batch_size)
+        for pk, *values in rows:
+            record = {
+                "model": label,
+                "pk": pk,
+                "fields": {
+                    field.name: value
+                    for field, value in zip(fields, values)
+                },
+            }
+            output.write(
+                json.dumps(record, cls=Encoder, ensure_ascii=False)
+            )
+            output.write("\n")
+            progress.add(label)
+
+
+def auto_date_fields():
+    return [
+        field
+        for label in MODELS
+        for field in apps.get_model(label)._meta.concrete_fields
+        if getattr(field, "auto_now", False)
+        or getattr(field, "auto_now_add", False)
+    ]
+
+
+def _build(model, record, auto_dates):
+    """
+    Объект модели из записи. Отсутствующие в записи даты
+    auto_now/auto_now_add получают текущее время.
+    """
+    values = record["fields"]
+    obj = model(pk=record["pk"])
+    for field in _fields(model):
+        if field.name in values:
+            value = field.to_python(values[field.name])
+        elif field in auto_dates:
+            value = timezone.now()
+        else:
+            continue
+        setattr(obj, field.attname, value)
+    return obj
+
+
+def _renumber(label, objs, post_ids):
+    """
+    Стирает id постов и комментариев перед записью на шарды:
+    bulk_create выдаст новые. Комментарии переводятся на новые id
+    постов из post_ids. Возвращает прежние id.
+    """
+    old_ids = [obj.pk for obj in objs]
+    for obj in objs:
+        if label == "posts.comment":
+            if obj.post_id not in post_ids:
+                raise CommandError(
+                    f"Комментарий {obj.pk} ссылается на пост "
+                    f"{obj.post_id}, которого нет выше в файле"
+                )
+            obj.post_id = post_ids[obj.post_id]
+        obj.pk = None
+    return old_ids
+
+
+class KeepAutoDates:
+    """
+    bulk_create вызывает pre_save, и поля auto_now/auto_now_add
+    получили бы текущее время вместо заданного в объекте.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __enter__(self):
+        self.flags = [
+            (field.auto_now, field.auto_now_add) for field in self.fields
+        ]
+        for field in self.fields:
+            field.auto_now = field.auto_now_add = False
+
+    def __exit__(self, *exc_info):
+        for field, (auto_now, auto_now_add) in zip(self.fields, self.flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def import_rows(lines, batch_size, progress):
+    """
+    Загружает строки NDJSON пачками по batch_size через bulk_create.
+
+    В памяти держится не больше batch_size объектов на модель.
+    Перед записью пачки сбрасываются пачки моделей, на которые
+    она ссылается. Возвращает число пропущенных строк других моделей.
+    С шардами посты и комментарии получают новые id, и комментарий
+    должен идти в файле после своего поста, как в export_ndjson.
+    """
+    buffers = {label: [] for label in MODELS}
+    auto_dates = auto_date_fields()
+    skipped = 0
+    # Прежний id поста -> новый, если посты перенумерованы.
+    post_ids = {}
+
+    def flush(upto):
+        for label in MODELS[:MODELS.index(upto) + 1]:
+            objs = buffers[label]
+            if not objs:
+                continue
+            renumber = (
+                sharding.enabled() and label in sharding.SHARDED_MODELS
+            )
+            if renumber:
+                old_ids = _renumber(label, objs, post_ids)
+            apps.get_model(label).objects.bulk_create(
+                objs, batch_size=batch_size
+            )
+            if renumber and label == "posts.post":
+                post_ids.update(zip(old_ids, (obj.pk for obj in objs)))
+            progress.add(label, len(objs))
+            buffers[label] = []
+
+    with sharding.atomic(), KeepAutoDates(auto_dates):
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            label = record["model"].lower()
+            if label not in buffers:
+                skipped += 1
+                continue
+            buffers[label].append(
+                _build(apps.get_model(label), record, auto_dates)
+            )
+            if len(buffers[label]) >= batch_size:
+                flush(label)
+        flush(MODELS[-1])
+        reset_sequences()
+    return skipped
+
+
+def reset_sequences():
+    models = [apps.get_model(label) for label in MODELS]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    sharding.reserve_tickets()
+
+
+def rebuild_derived():
+    """
+    bulk_create не шлёт сигналов, поэтому счётчики, ленты
+    подписок и поисковый индекс пересчитываются после загрузки.
+    """
+    with sharding.atomic():
+        counters.rebuild()
+        feed.rebuild()
+        search.rebuild()
+    # Версии страниц в кэше ничего не знают о загруженных данных.
+    cache.clear()
@@ -0,0 +1,157 @@
+import base64
+import binascii
+import heapq
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_FIELDS = ("pub_date", "id")
+COMMENT_CURSOR_FIELDS = ("created", "id")
+
+
+def encode_cursor(values, reverse=False):
+    """Упаковывает ключ (дата, id) в непрозрачный токен."""
+    pub_date, pk = values
+    direction = "p" if reverse else "n"
+    raw = f"{direction}|{pub_date.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Возвращает (ключ, reverse) или None для испорченного токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        direction, pub_date, pk = raw.decode().split("|")
+        values = (parse_datetime(pub_date), int(pk))
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if direction not in ("n", "p") or values[0] is None:
+        return None
+    return values, direction == "p"
+
+
+def keyset_slice(queryset, fields, values, reverse, limit):
+    """
+    Следующие limit записей после ключа values без OFFSET и COUNT(*).
+
+    Условие pub_date <= X отдаётся индексу по дате,
+    равные даты добиваются сравнением по id.
+    """
+    date_field, id_field = fields
+    if reverse:
+        op, ordering = "gt", (date_field, id_field)
+    else:
+        op, ordering = "lt", ("-" + date_field, "-" + id_field)
+    queryset = queryset.order_by(*ordering)
+    if values is not None:
+        pub_date, pk = values
+        queryset = queryset.filter(
+            Q(**{f"{date_field}__{op}e": pub_date}),
+            Q(**{f"{date_field}__{op}": pub_date})
+            | Q(**{date_field: pub_date, f"{id_field}__{op}": pk}),
+        )
+    return list(queryset[:limit])
+
+
+class MergedFeed:
+    """
+    Лента, слитая по (pub_date, id) из нескольких источников.
+
+    Наследники возвращают из slices() срезы источников после ключа.
+    keyset() нужен CursorPaginator, count() и срезы - обычному
+    Paginator.
+    """
+
+    key = attrgetter(*CURSOR_FIELDS)
+
+    def slices(self, values, reverse, limit):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def keyset(self, values, reverse, limit):
+        merged = heapq.merge(
+            *self.slices(values, reverse, limit),
+            key=self.key,
+            reverse=not reverse
+        )
+        return list(islice(merged, limit))
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        return self.keyset(None, False, item.stop)[item.start:]
+
+
+class CursorPaginator(Paginator):
+    """
+    Keyset-пагинация ленты по (pub_date, id).
+
+    Вместо номера страницы принимает токен курсора и после get_page
+    хранит токены соседних страниц в next_cursor и previous_cursor.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, fields=CURSOR_FIELDS,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.fields = fields
+        self.key = attrgetter(*fields)
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def get_page(self, cursor):
+        decoded = decode_cursor(cursor) if cursor else None
+        values, reverse = decoded or (None, False)
+        limit = self.per_page + 1
+        if hasattr(self.object_list, "keyset"):
+            # Составные ленты сами режут свои источники по ключу.
+            rows = self.object_list.keyset(values, reverse, limit)
+        else:
+            rows = keyset_slice(
+                self.object_list, self.fields, values, reverse, limit
+            )
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            if not has_more:
+                # Дошли до начала ленты - отдаём обычную первую страницу.
+                return self.get_page(None)
+            rows.reverse()
+        has_next = reverse or has_more
+        has_previous = values is not None
+        self.next_cursor = self.previous_cursor = None
+        if rows and has_next:
+            self.next_cursor = encode_cursor(self.key(rows[-1]))
+        if rows and has_previous:
+            self.previous_cursor = encode_cursor(
+                self.key(rows[0]),
+                reverse=True
+            )
+        return Page(rows, 1, self)
+
+
+def paginate(request, object_list, fields=CURSOR_FIELDS):
+    """
+    Страница ленты для запроса.
+
+    По умолчанию используется курсор (?cursor=...),
+    ссылки вида ?page=N продолжают работать через обычный Paginator.
+    fields - поля ключа ленты, они же атрибуты её элементов.
+    """
+    page_number = request.GET.get("page")
+    if page_number is None and settings.CURSOR_PAGINATION:
+        paginator = CursorPaginator(
+            object_list,
+            settings.POST_COUNT,
+            fields=fields
+        )
+        return paginator.get_page(request.GET.get("cursor"))
+    paginator = Paginator(object_list, settings.POST_COUNT)
+    return paginator.get_page(page_number)
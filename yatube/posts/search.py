@@ -0,0 +1,215 @@
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from . import sharding
+from .models import Comment, Post, SearchTerm
+from .stemmer import tokenize
+
+FTS_TABLE = "posts_search_fts"
+# Длина SearchTerm.term: так обрезаются и слова индекса, и слова запроса.
+TERM_LENGTH = 64
+# Совпадение в комментарии весит меньше совпадения в самом посте.
+COMMENT_WEIGHT = 0.5
+
+
+class Fts5Backend:
+    """
+    Индекс в виртуальной таблице FTS5.
+
+    В таблицу пишутся уже выделенные основы слов, поэтому
+    морфологию берёт на себя stemmer, а ранжирование - bm25.
+    rowid чётный для поста и нечётный для комментария.
+    """
+
+    def __init__(self, connection=connection):
+        self.connection = connection
+
+    def _write(self, rowid, post_id, text):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [rowid]
+            )
+            if text is not None:
+                cursor.execute(
+                    f"INSERT INTO {FTS_TABLE} (rowid, body, post_id) "
+                    "VALUES (%s, %s, %s)",
+                    [rowid, " ".join(tokenize(text)), post_id],
+                )
+
+    def index_post(self, post):
+        self._write(post.pk * 2, post.pk, post.text)
+
+    def index_comment(self, comment):
+        self._write(comment.pk * 2 + 1, comment.post_id, comment.text)
+
+    def remove_post(self, post_id):
+        self._write(post_id * 2, post_id, None)
+
+    def remove_comment(self, comment_id):
+        self._write(comment_id * 2 + 1, None, None)
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    def search(self, terms, limit):
+        """
+        Посты, в тексте или комментариях которых есть все terms.
+
+        MATCH со всеми словами сразу требовал бы их в одной строке,
+        поэтому каждое слово ищется отдельно, а лучшие оценки слов
+        складываются по посту, как в InvertedIndexBackend.
+        """
+        terms = list(dict.fromkeys(terms))
+        matches = " UNION ALL ".join(
+            f"SELECT post_id, {index} AS term, CASE WHEN rowid %% 2"
+            f" THEN rank * {COMMENT_WEIGHT} ELSE rank END AS score"
+            f" FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+            for index in range(len(terms))
+        )
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT post_id FROM ("
+                "  SELECT post_id, term, MIN(score) AS score"
+                f"  FROM ({matches}) GROUP BY post_id, term"
+                ") GROUP BY post_id HAVING COUNT(*) = %s "
+                "ORDER BY SUM(score), post_id DESC LIMIT %s",
+                [*(f'"{term}"' for term in terms), len(terms), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class InvertedIndexBackend:
+    """Обратный индекс в таблице SearchTerm с ранжированием tf-idf."""
+
+    def __init__(self, terms=SearchTerm.objects):
+        self.terms = terms
+
+    def _write(self, post_id, comment_id, text):
+        self.terms.filter(
+            post_id=post_id,
+            comment_id=comment_id
+        ).delete()
+        self.terms.bulk_create(
+            self.terms.model(
+                term=term[:TERM_LENGTH],
+                post_id=post_id,
+                comment_id=comment_id,
+                count=count,
+            )
+            for term, count in Counter(tokenize(text)).items()
+        )
+
+    def index_post(self, post):
+        self._write(post.pk, None, post.text)
+
+    def index_comment(self, comment):
+        self._write(comment.post_id, comment.pk, comment.text)
+
+    def remove_post(self, post_id):
+        self.terms.filter(post_id=post_id).delete()
+
+    def remove_comment(self, comment_id):
+        self.terms.filter(comment_id=comment_id).delete()
+
+    def clear(self):
+        self.terms.all().delete()
+
+    def search(self, terms, limit):
+        terms = [term[:TERM_LENGTH] for term in terms]
+        postings = self.terms.filter(term__in=terms).values_list(
+            "term", "post_id", "comment_id", "count"
+        )
+        scores = defaultdict(dict)
+        for term, post_id, comment_id, count in postings.iterator():
+            weight = count * (COMMENT_WEIGHT if comment_id else 1)
+            scores[term][post_id] = scores[term].get(post_id, 0) + weight
+        if len(scores) < len(set(terms)):
+            return []
+        total = sum(
+            posts.count() for posts in sharding.each(Post.objects.all())
+        ) or 1
+        ranked = defaultdict(float)
+        found = set.intersection(*(set(posts) for posts in scores.values()))
+        for posts in scores.values():
+            idf = math.log(1 + total / len(posts))
+            for post_id in found:
+                ranked[post_id] += (1 + math.log(posts[post_id])) * idf
+        return sorted(ranked, key=lambda pk: (-ranked[pk], -pk))[:limit]
+
+
+_backend = None
+
+
+def fts5_available(connection=connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def make_backend(connection=connection, terms=SearchTerm.objects):
+    """Бэкенд из SEARCH_BACKEND: "fts5", "python" или "auto"."""
+    name = settings.SEARCH_BACKEND
+    if name == "auto":
+        use_fts = connection.vendor == "sqlite" and fts5_available(connection)
+        name = "fts5" if use_fts else "python"
+    if name == "fts5":
+        return Fts5Backend(connection)
+    return InvertedIndexBackend(terms)
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = make_backend()
+    return _backend
+
+
+def index_post(post):
+    get_backend().index_post(post)
+
+
+def index_comment(comment):
+    get_backend().index_comment(comment)
+
+
+def remove_post(post_id):
+    get_backend().remove_post(post_id)
+
+
+def remove_comment(comment_id):
+    get_backend().remove_comment(comment_id)
+
+
+def search_posts(query):
+    """id постов по запросу, самые релевантные первыми."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    return get_backend().search(terms, settings.SEARCH_MAX_RESULTS)
+
+
+def fill(backend, posts, comments):
+    """Заново строит индекс backend по querysets постов и комментариев."""
+    backend.clear()
+    for queryset in posts:
+        for post in queryset.only("text").iterator():
+            backend.index_post(post)
+    for queryset in comments:
+        for comment in queryset.only("post", "text").iterator():
+            backend.index_comment(comment)
+
+
+def rebuild():
+    """Переиндексирует все посты и комментарии."""
+    fill(
+        get_backend(),
+        sharding.each(Post.objects.all()),
+        sharding.each(Comment.objects.all()),
+    )
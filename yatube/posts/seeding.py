@@ -0,0 +1,246 @@
+"""
+Детерминированная генерация синтетических данных для замеров.
+
+Faker строит небольшие пулы имён и текстов, а строки собираются
+из них случайным генератором с заданным seed: так миллионы строк
+генерируются за минуты, а один и тот же seed даёт те же данные.
+Даты отсчитываются от момента now, а не от текущего времени, id -
+подряд с first_id, а не после уже лежащих в таблицах строк. На шардах
+номер first_id + n становится id поста или комментария на его шарде,
+см. sharding.global_id.
+"""
+import datetime
+import itertools
+import random
+from array import array
+from bisect import bisect
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import CommandError
+from faker import Faker
+
+from . import sharding
+from .models import Comment, Follow, Group, Post, User
+from .ndjson import KeepAutoDates, auto_date_fields, reset_sequences
+
+POOL_SIZE = 2000
+# Момент, от которого по умолчанию отсчитываются даты.
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Zipf:
+    """
+    Выбор ранга 0..n-1 с весом 1 / (rank + 1) ** skew.
+
+    Немногие популярные авторы и группы получают большую часть
+    постов, подписчиков и комментариев, как на живом сайте.
+    """
+
+    def __init__(self, rng, n, skew):
+        self.rng = rng
+        self.cum_weights = list(
+            itertools.accumulate(1 / rank ** skew for rank in range(1, n + 1))
+        )
+        self.total = self.cum_weights[-1]
+
+    def __call__(self):
+        return bisect(self.cum_weights, self.rng.random() * self.total)
+
+
+class Seeder:
+    def __init__(
+        self, seed, batch_size, skew, days, progress, now=EPOCH, first_id=1
+    ):
+        self.rng = random.Random(seed)
+        self.fake = Faker("ru_RU")
+        self.fake.seed_instance(seed)
+        self.batch_size = batch_size
+        self.skew = skew
+        self.progress = progress
+        self.now = now
+        self.first_id = first_id
+        self.period = datetime.timedelta(days=days).total_seconds()
+        self.sentences = self._pool(self.fake.sentence)
+        self.first_names = self._pool(self.fake.first_name)
+        self.last_names = self._pool(self.fake.last_name)
+        self.user_names = self._pool(self.fake.user_name)
+
+    def _pool(self, make):
+        return [make() for _ in range(POOL_SIZE)]
+
+    def _ids(self, model, count):
+        """
+        Номера новых строк; занятые id - ошибка, а не сдвиг. Для постов
+        и комментариев на шардах номер ещё переводится в id шарда.
+        """
+        ids = range(self.first_id, self.first_id + count)
+        low, high = ids.start, ids.stop
+        querysets = [model.objects.all()]
+        if model in (Post, Comment) and sharding.enabled():
+            shards = len(settings.POST_SHARDS)
+            low, high = low * shards, high * shards
+            querysets = sharding.each(model.objects.all())
+        if any(
+            queryset.filter(pk__gte=low, pk__lt=high).exists()
+            for queryset in querysets
+        ):
+            raise CommandError(
+                f"В {model._meta.db_table} уже есть строки с id "
+                f"{low}..{high - 1}, укажите другой --first-id"
+            )
+        return ids
+
+    def _on_shard(self, number, shard):
+        return number if shard is None else sharding.global_id(number, shard)
+
+    def _text(self, low, high):
+        return " ".join(
+            self.rng.choices(self.sentences, k=self.rng.randint(low, high))
+        )
+
+    def _date(self, max_age=None):
+        """Момент не старше max_age секунд, по умолчанию days дней."""
+        ago = self.rng.uniform(0, self.period if max_age is None else max_age)
+        return self.now - datetime.timedelta(seconds=ago), ago
+
+    def _insert(self, model, rows):
+        label = model._meta.label_lower
+        for batch in iter(
+            lambda: list(itertools.islice(rows, self.batch_size)), []
+        ):
+            model.objects.bulk_create(batch)
+            self.progress.add(label, len(batch))
+
+    def users(self, count):
+        ids = self._ids(User, count)
+        # Хэш считается один раз: pbkdf2 на каждого занял бы часы.
+        password = make_password(None)
+        self._insert(User, (
+            User(
+                id=user_id,
+                username=f"{self.rng.choice(self.user_names)}_{user_id}",
+                first_name=self.rng.choice(self.first_names),
+                last_name=self.rng.choice(self.last_names),
+                email=f"user{user_id}@example.com",
+                password=password,
+                date_joined=self.now,
+            )
+            for user_id in ids
+        ))
+        return list(ids)
+
+    def groups(self, count):
+        ids = self._ids(Group, count)
+        self._insert(Group, (
+            Group(
+                id=group_id,
+                title=self.fake.catch_phrase()[:200],
+                slug=f"group-{group_id}",
+                description=self.rng.choice(self.sentences),
+            )
+            for group_id in ids
+        ))
+        return list(ids)
+
+    def posts(self, count, user_ids, group_ids, no_group_share=0.3):
+        """
+        Посты авторов и групп по закону Ципфа. Возвращает id постов
+        и их возраст в секундах, чтобы комментарии были новее постов.
+        """
+        numbers = self._ids(Post, count)
+        pick_author = Zipf(self.rng, len(user_ids), self.skew)
+        pick_group = Zipf(self.rng, max(len(group_ids), 1), self.skew)
+        ids = array("q")
+        ages = array("d")
+
+        def rows():
+            for number in numbers:
+                pub_date, age = self._date()
+                ages.append(age)
+                group_id = None
+                if group_ids and self.rng.random() >= no_group_share:
+                    group_id = group_ids[pick_group()]
+                author_id = user_ids[pick_author()]
+                ids.append(self._on_shard(
+                    number, sharding.shard_for(author_id=author_id)
+                ))
+                yield Post(
+                    id=ids[-1],
+                    text=self._text(1, 8),
+                    author_id=author_id,
+                    group_id=group_id,
+                    pub_date=pub_date,
+                    updated=pub_date,
+                )
+
+        self._insert(Post, rows())
+        return ids, ages
+
+    def comments(self, count, post_ids, ages, user_ids):
+        # Популярные посты не совпадают с первыми по id.
+        ranked = self.rng.sample(range(len(post_ids)), len(post_ids))
+        pick_post = Zipf(self.rng, len(post_ids), self.skew)
+        pick_user = Zipf(self.rng, len(user_ids), self.skew)
+        numbers = self._ids(Comment, count)
+
+        def rows():
+            for number in numbers:
+                index = ranked[pick_post()]
+                created, _ = self._date(max_age=ages[index])
+                post_id = post_ids[index]
+                yield Comment(
+                    id=self._on_shard(
+                        number, sharding.shard_for(post_id=post_id)
+                    ),
+                    post_id=post_id,
+                    author_id=user_ids[pick_user()],
+                    text=self._text(1, 3),
+                    created=created,
+                )
+
+        self._insert(Comment, rows())
+
+    def follows(self, count, user_ids):
+        """
+        Подписки на популярных авторов без повторов и на себя.
+
+        Популярность у подписчиков не совпадает с плодовитостью:
+        иначе самый активный автор собрал бы и всех подписчиков,
+        а ленты разрослись бы квадратично.
+        """
+        user_ids = self.rng.sample(user_ids, len(user_ids))
+        pick_author = Zipf(self.rng, len(user_ids), self.skew)
+        seen = set()
+        attempts = count * 5
+        ids = iter(self._ids(Follow, count))
+
+        def rows():
+            made = 0
+            for _ in range(attempts):
+                if made == count:
+                    return
+                pair = (
+                    self.rng.choice(user_ids),
+                    user_ids[pick_author()],
+                )
+                if pair[0] == pair[1] or pair in seen:
+                    continue
+                seen.add(pair)
+                made += 1
+                yield Follow(
+                    id=next(ids), user_id=pair[0], author_id=pair[1]
+                )
+
+        self._insert(Follow, rows())
+
+    def run(self, users, groups, posts, comments, follows):
+        with sharding.atomic(), KeepAutoDates(auto_date_fields()):
+            user_ids = self.users(users)
+            group_ids = self.groups(groups)
+            if user_ids:
+                post_ids, ages = self.posts(posts, user_ids, group_ids)
+                if post_ids:
+                    self.comments(comments, post_ids, ages, user_ids)
+                self.follows(min(follows, users * (users - 1)), user_ids)
+            reset_sequences()
@@ -0,0 +1,252 @@
+"""
+Посты и комментарии на нескольких базах по автору.
+
+Шарды перечислены в POST_SHARDS; без них всё лежит в основной базе
+и функции модуля ничего не меняют. Пост живёт на шарде
+POST_SHARDS[author_id % N], комментарии - на шарде своего поста.
+id выдаёт таблица ShardTicket в основной базе: id = билет * N + номер
+шарда, поэтому шард поста виден по его id. Пользователи, группы,
+подписки, счётчики и поиск остаются в основной базе, ссылки на них
+внешними ключами не проверяются.
+
+Запросы с подсказкой-экземпляром (author.posts, post.comments, save())
+направляет ShardRouter, остальные выбирают шард сами через
+Post.objects.on_shard(). create() и bulk_create() без явной базы
+пишут каждый объект на его шард, см. ShardedQuerySet. Ленты по всем
+постам читаются с каждого шарда и сливаются по (pub_date, id),
+см. ShardedFeed.
+
+Схема создаётся по порядку: сначала manage.py migrate для основной
+базы, затем manage.py migrate --database=shard_N для каждого шарда.
+На шардах появляются только таблицы SHARD_TABLES, а миграции данных
+идут лишь в основной базе и шарды не читают. Счётчики и поисковый
+индекс постов, уже лежащих на шардах, пересчитывают команды
+rebuild_counters и rebuild_search_index.
+"""
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import (DEFAULT_DB_ALIAS, connections, models, router,
+                       transaction)
+from django.db.models import Max
+
+from .paginators import CURSOR_FIELDS, MergedFeed, keyset_slice
+
+SHARDED_MODELS = {"posts.post", "posts.comment"}
+# Пустые таблицы моделей со ссылками на пост: каскадное удаление
+# поста ищет их в базе самого поста.
+SHARD_TABLES = SHARDED_MODELS | {"posts.feedentry", "posts.searchterm"}
+
+
+def enabled():
+    return bool(settings.POST_SHARDS)
+
+
+def shard_for(author_id=None, post_id=None):
+    """Шард автора или поста; None - если шардов нет."""
+    shards = settings.POST_SHARDS
+    key = post_id if author_id is None else author_id
+    if not shards or key is None:
+        return None
+    return shards[int(key) % len(shards)]
+
+
+def next_ticket():
+    """
+    Следующий номер из ShardTicket. REPLACE держит в таблице одну
+    строку, а AUTOINCREMENT не выдаёт номера повторно.
+    """
+    from .models import ShardTicket
+
+    connection = connections[router.db_for_write(ShardTicket)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"REPLACE INTO {ShardTicket._meta.db_table} (stub) VALUES ('a')"
+        )
+        return cursor.lastrowid
+
+
+def global_id(ticket, using):
+    """id записи с номером ticket на шарде using."""
+    shards = settings.POST_SHARDS
+    return ticket * len(shards) + shards.index(using)
+
+
+def assign_id(instance, using):
+    """Глобальный id новой записи, которая пишется на шард using."""
+    if instance.pk is None and using in settings.POST_SHARDS:
+        instance.pk = global_id(next_ticket(), using)
+
+
+def reserve_tickets():
+    """
+    Сдвигает ShardTicket за самый большой id постов и комментариев -
+    после записи с готовыми id (сид, импорт).
+    """
+    from .models import Comment, Post, ShardTicket
+
+    if not enabled():
+        return
+    top = max(
+        queryset.aggregate(top=Max("pk"))["top"] or 0
+        for model in (Post, Comment)
+        for queryset in each(model.objects.all())
+    )
+    ticket = top // len(settings.POST_SHARDS)
+    if not ticket:
+        return
+    # AUTOINCREMENT не выдаст номер меньше уже вставленного.
+    connection = connections[router.db_for_write(ShardTicket)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"REPLACE INTO {ShardTicket._meta.db_table} (id, stub) "
+            "VALUES (%s, 'a')",
+            [ticket],
+        )
+
+
+@contextmanager
+def atomic():
+    """Транзакция в основной базе и на каждом шарде."""
+    with ExitStack() as stack:
+        for alias in [DEFAULT_DB_ALIAS, *settings.POST_SHARDS]:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def each(queryset):
+    """queryset на каждом шарде или он сам, если шардов нет."""
+    if not enabled():
+        return [queryset]
+    return [queryset.using(alias) for alias in settings.POST_SHARDS]
+
+
+class ShardedFeed(MergedFeed):
+    """Одна и та же лента, прочитанная с нескольких шардов."""
+
+    def __init__(self, querysets):
+        self.querysets = querysets
+
+    def slices(self, values, reverse, limit):
+        return [
+            keyset_slice(queryset, CURSOR_FIELDS, values, reverse, limit)
+            for queryset in self.querysets
+        ]
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+
+def scatter(queryset):
+    """Лента постов queryset со всех шардов."""
+    if not enabled():
+        return queryset
+    return ShardedFeed(each(queryset))
+
+
+def by_authors(queryset, author_ids):
+    """Лента постов авторов author_ids только с их шардов."""
+    groups = defaultdict(list)
+    for author_id in author_ids:
+        groups[shard_for(author_id=author_id)].append(author_id)
+    return ShardedFeed([
+        queryset.using(alias).filter(author_id__in=authors)
+        for alias, authors in sorted(groups.items())
+    ])
+
+
+def in_bulk(queryset, post_ids):
+    """in_bulk по id постов: по запросу на каждый нужный шард."""
+    if not enabled():
+        return queryset.in_bulk(post_ids)
+    groups = defaultdict(list)
+    for post_id in post_ids:
+        groups[shard_for(post_id=post_id)].append(post_id)
+    posts = {}
+    for alias, ids in groups.items():
+        posts.update(queryset.using(alias).in_bulk(ids))
+    return posts
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    create() и bulk_create() без using() пишут каждый объект на его
+    шард, а не в основную базу.
+    """
+
+    def _routed(self):
+        return enabled() and self._db is None
+
+    def create(self, **kwargs):
+        if not self._routed():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        # Шард по самому объекту выберет ShardRouter.
+        obj.save(force_insert=True)
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if not self._routed():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        groups = defaultdict(list)
+        for obj in objs:
+            alias = router.db_for_write(self.model, instance=obj)
+            assign_id(obj, alias)
+            if shard_for(post_id=obj.pk) != alias:
+                raise ValueError(
+                    f"{self.model._meta.label} с id {obj.pk} должен лежать "
+                    f"на шарде {shard_for(post_id=obj.pk)}, а не {alias}"
+                )
+            groups[alias].append(obj)
+        for alias, group in groups.items():
+            self.using(alias).bulk_create(group, *args, **kwargs)
+        return objs
+
+
+class ShardRouter:
+    """
+    Направляет посты и комментарии на шард по подсказке-экземпляру.
+    Остальное и запросы без подсказки решают следующие роутеры.
+    """
+
+    def _route(self, model, instance=None, **hints):
+        if (
+            not enabled()
+            or instance is None
+            or model._meta.label_lower not in SHARDED_MODELS
+        ):
+            return None
+        if instance._state.db in settings.POST_SHARDS:
+            return instance._state.db
+        label = instance._meta.label_lower
+        if label == "posts.post":
+            return shard_for(author_id=instance.author_id)
+        if label == "posts.comment":
+            return shard_for(post_id=instance.post_id)
+        # Посты пользователя лежат на его шарде, а его комментарии -
+        # на шардах постов.
+        if (
+            label == settings.AUTH_USER_MODEL.lower()
+            and model._meta.label_lower == "posts.post"
+        ):
+            return shard_for(author_id=instance.pk)
+        return None
+
+    db_for_read = _route
+    db_for_write = _route
+
+    def allow_relation(self, obj1, obj2, **hints):
+        shards = set(settings.POST_SHARDS)
+        databases = {obj1._state.db, obj2._state.db}
+        if not databases & shards:
+            return None
+        # Пользователи и группы видны с любого шарда, а пост
+        # и его комментарии - только на одном.
+        return len(databases) == 1 or not databases <= shards
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in settings.POST_SHARDS:
+            return None
+        return f"{app_label}.{model_name}" in SHARD_TABLES
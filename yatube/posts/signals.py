@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import caching, counters, feed, search, sharding, thumbnails
+from .models import Comment, FeedEntry, Follow, Group, Post, UserStats
+
+
+# Вход на сайт обновляет только last_login, его страницы не показывают.
+LOGIN_FIELDS = frozenset(["last_login"])
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def user_saving(sender, instance, update_fields, **kwargs):
+    if instance.pk is None or update_fields == LOGIN_FIELDS:
+        return
+    # Профиль по прежнему имени тоже нужно сбросить.
+    instance._old_username = sender.objects.filter(
+        pk=instance.pk
+    ).values_list("username", flat=True).first()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    elif update_fields != LOGIN_FIELDS:
+        caching.bump_author(instance, instance._old_username)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleting(sender, instance, **kwargs):
+    # Каскад удаления идёт по основной базе, а посты и комментарии
+    # пользователя лежат на шардах.
+    if not sharding.enabled():
+        return
+    for comments in sharding.each(Comment.objects.filter(author=instance)):
+        comments.delete()
+    Post.objects.on_shard(author_id=instance.pk).filter(
+        author=instance
+    ).delete()
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, using, **kwargs):
+    # Группу могли сменить - её страницу тоже нужно сбросить.
+    instance._old_group_id = instance.pk and Post.objects.using(
+        using
+    ).filter(pk=instance.pk).values_list("group_id", flat=True).first()
+    sharding.assign_id(instance, using)
+
+
+@receiver(pre_save, sender=Comment)
+def comment_saving(sender, instance, using, **kwargs):
+    sharding.assign_id(instance, using)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, post_count=1)
+        feed.push_post(instance)
+    else:
+        FeedEntry.objects.filter(post=instance).update(
+            pub_date=instance.pub_date
+        )
+    caching.bump_post(instance, instance._old_group_id)
+    search.index_post(instance)
+    if instance.image:
+        transaction.on_commit(lambda: thumbnails.enqueue(instance))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, post_count=-1)
+    caching.bump_post(instance)
+    search.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_post(instance.post_id, 1)
+    caching.bump(("post", instance.post_id))
+    search.index_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+    caching.bump(("post", instance.post_id))
+    search.remove_comment(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, follower_count=1)
+        counters.bump_user(instance.user_id, following_count=1)
+        feed.backfill(instance)
+    caching.bump(
+        ("author", instance.author.username),
+        ("author", instance.user.username),
+    )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, follower_count=-1)
+    counters.bump_user(instance.user_id, following_count=-1)
+    feed.prune(instance)
+    caching.bump(
+        ("author", instance.author.username),
+        ("author", instance.user.username),
+    )
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, **kwargs):
+    # Страницу по прежнему slug тоже нужно сбросить.
+    instance._old_slug = instance.pk and Group.objects.filter(
+        pk=instance.pk
+    ).values_list("slug", flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Название и ссылка группы есть на карточках главной и на страницах
+    # её постов, которые зависят от области группы.
+    slugs = {instance.slug, getattr(instance, "_old_slug", None)} - {None}
+    caching.bump(("index",), *(("group", slug) for slug in slugs))
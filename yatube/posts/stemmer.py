@@ -0,0 +1,122 @@
+"""Стеммер Snowball для русского языка без внешних зависимостей."""
+import re
+from functools import lru_cache
+
+VOWELS = "аеиоуыэюя"
+
+PERFECTIVE_GERUND = (
+    ("в", "вши", "вшись"),
+    ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись"),
+)
+ADJECTIVE = (
+    (),
+    (
+        "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем",
+        "им", "ым", "ом", "его", "ого", "ему", "ому", "их", "ых", "ую",
+        "юю", "ая", "яя", "ою", "ею",
+    ),
+)
+PARTICIPLE = (
+    ("ем", "нн", "вш", "ющ", "щ"),
+    ("ивш", "ывш", "ующ"),
+)
+REFLEXIVE = ((), ("ся", "сь"))
+VERB = (
+    (
+        "ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но",
+        "ет", "ют", "ны", "ть", "ешь", "нно",
+    ),
+    (
+        "ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей",
+        "уй", "ил", "ыл", "им", "ым", "ен", "ило", "ыло", "ено", "ят",
+        "ует", "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю",
+    ),
+)
+NOUN = (
+    (),
+    (
+        "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии",
+        "и", "ией", "ей", "ой", "ий", "й", "иям", "ям", "ием", "ем", "ам",
+        "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия",
+        "ья", "я",
+    ),
+)
+SUPERLATIVE = ((), ("ейше", "ейш"))
+DERIVATIONAL = ((), ("ость", "ост"))
+
+WORD_RE = re.compile(r"\w+")
+
+
+def _regions(word):
+    """Начала областей RV и R2 в слове."""
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word, start, groups):
+    """
+    Отрезает самое длинное окончание из groups, лежащее после start.
+
+    Окончания первой группы отрезаются, только если перед ними
+    стоит «а» или «я». Возвращает None, если окончания нет.
+    """
+    best = None
+    for group, endings in enumerate(groups):
+        for ending in endings:
+            if word.endswith(ending) and len(word) - len(ending) >= start:
+                if best is None or len(ending) > len(best[1]):
+                    best = (group, ending)
+    if best is None:
+        return None
+    group, ending = best
+    stem = word[:-len(ending)]
+    if group == 0 and not (len(stem) > start and stem[-1] in "ая"):
+        return None
+    return stem
+
+
+# Частота слов в тексте подчиняется закону Ципфа, поэтому
+# небольшой кэш снимает почти всю работу при индексации.
+@lru_cache(maxsize=65536)
+def stem(word):
+    word = word.lower().replace("ё", "е")
+    rv, r2 = _regions(word)
+    stemmed = _strip(word, rv, PERFECTIVE_GERUND)
+    if stemmed is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stemmed = _strip(word, rv, ADJECTIVE)
+        if stemmed is not None:
+            stemmed = _strip(stemmed, rv, PARTICIPLE) or stemmed
+        else:
+            stemmed = _strip(word, rv, VERB) or _strip(word, rv, NOUN)
+    word = stemmed or word
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+    word = _strip(word, r2, DERIVATIONAL) or word
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        return word[:-1]
+    superlative = _strip(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+        if word.endswith("нн"):
+            word = word[:-1]
+    elif word.endswith("ь") and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Основы слов текста в нижнем регистре."""
+    return [stem(word) for word in WORD_RE.findall(text.lower())]
@@ -0,0 +1,34 @@
+from django import template
+
+register = template.Library()
+
+ELLIPSIS = "…"
+
+
+@register.simple_tag
+def elided_page_range(page_obj, on_each_side=3, on_ends=2):
+    """
+    Номера страниц вокруг текущей, первые и последние on_ends
+    страниц и ELLIPSIS на месте пропусков.
+
+    Длина результата не зависит от числа страниц, поэтому
+    разметка пагинатора не растёт вместе с лентой.
+    """
+    number = page_obj.number
+    num_pages = page_obj.paginator.num_pages
+    if num_pages <= (on_each_side + on_ends) * 2:
+        return list(range(1, num_pages + 1))
+    pages = []
+    if number > 1 + on_each_side + on_ends + 1:
+        pages.extend(range(1, on_ends + 1))
+        pages.append(ELLIPSIS)
+        pages.extend(range(number - on_each_side, number + 1))
+    else:
+        pages.extend(range(1, number + 1))
+    if number < num_pages - on_each_side - on_ends - 1:
+        pages.extend(range(number + 1, number + on_each_side + 1))
+        pages.append(ELLIPSIS)
+        pages.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        pages.extend(range(number + 1, num_pages + 1))
+    return pages
@@ -0,0 +1,43 @@
+from django import template
+
+from posts import images, thumbnails
+
+register = template.Library()
+
+
+def _srcset(thumbnails_):
+    widths = {thumbnail.width: thumbnail for thumbnail in thumbnails_}
+    return ", ".join(
+        f"{thumbnail.url} {width}w"
+        for width, thumbnail in sorted(widths.items())
+    )
+
+
+@register.simple_tag
+def cached_thumbnail(image, geometry):
+    """Готовая миниатюра или None - картинка в запросе не ресайзится."""
+    if not image:
+        return None
+    return thumbnails.lookup(image, geometry)
+
+
+@register.simple_tag
+def responsive_image(image, geometry):
+    """
+    Данные для <picture>: миниатюра geometry в src, её варианты
+    в srcset и по одному <source> на современный формат.
+    None, пока миниатюра не построена.
+    """
+    base = cached_thumbnail(image, geometry)
+    if base is None:
+        return None
+    found = thumbnails.lookup_variants(image, geometry)
+    sources = [
+        {"type": images.MIME_TYPES[fmt], "srcset": _srcset(found[fmt])}
+        for fmt in images.modern_formats() if fmt in found
+    ]
+    return {
+        "src": base,
+        "srcset": _srcset([*found.get(None, []), base]),
+        "sources": sources,
+    }
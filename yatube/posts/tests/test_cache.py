@@ -0,0 +1,252 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core.backends.cache import LocalLRU, SQLiteCache, TieredCache
+from core.metrics import hit_ratios, registry
+
+from ..caching import SingleFlightCache, _version_key, bump
+from ..models import Group
+
+TIERED_CACHES = {
+    "default": {
+        "BACKEND": "core.backends.cache.TieredCache",
+        "LOCATION": "shared",
+        "OPTIONS": {"L1_TIMEOUT": 60, "BYPASS": ["page_version:"]},
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tiered-tests",
+    },
+}
+
+
+class VersionKeyTests(SimpleTestCase):
+    def test_scope_parts_are_hashed(self):
+        key = _version_key(("group", "группа с пробелом" * 20))
+        self.assertTrue(key.isascii())
+        self.assertNotIn(" ", key)
+        self.assertLess(len(key), 250)
+        self.assertEqual(
+            _version_key(("post", 5)), _version_key(("post", "5"))
+        )
+        self.assertEqual(_version_key(("index",)), "page_version:index")
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "cache.sqlite3")
+        self.cache = self.open()
+
+    def open(self):
+        return SQLiteCache(self.path, {})
+
+    def test_values_round_trip(self):
+        self.cache.set("number", 5)
+        self.cache.set("page", {"body": b"<html>"})
+        self.assertEqual(self.cache.get("number"), 5)
+        self.assertEqual(self.cache.get("page"), {"body": b"<html>"})
+        self.assertEqual(
+            self.cache.get_many(["number", "missing"]), {"number": 5}
+        )
+        self.assertIsNone(self.cache.get("missing"))
+
+    def test_processes_share_entries(self):
+        self.cache.set("key", "value")
+        other = self.open()
+        self.assertEqual(other.get("key"), "value")
+        other.delete("key")
+        self.assertFalse(self.cache.has_key("key"))
+
+    def test_expired_entries_are_missing(self):
+        self.cache.set("key", "value", timeout=1)
+        with mock.patch("time.time", return_value=time.time() + 2):
+            self.assertIsNone(self.cache.get("key"))
+            self.assertTrue(self.cache.add("key", "new"))
+            self.assertEqual(self.cache.get("key"), "new")
+
+    def test_add_keeps_live_entry(self):
+        self.assertTrue(self.cache.add("key", 1))
+        self.assertFalse(self.open().add("key", 2))
+        self.assertEqual(self.cache.get("key"), 1)
+
+    def test_incr_is_atomic_across_connections(self):
+        self.cache.set("counter", 0, timeout=None)
+
+        def work():
+            cache = self.open()
+            for _ in range(100):
+                cache.incr("counter")
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get("counter"), 400)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+    def test_cull_removes_soonest_to_expire(self):
+        cache = SQLiteCache(self.path, {"OPTIONS": {"MAX_ENTRIES": 10}})
+        cache.set("eternal", 1, timeout=None)
+        with mock.patch("core.backends.cache.CULL_EVERY", 1):
+            for number in range(12):
+                cache.set(f"key{number}", number, timeout=100 + number)
+        self.assertTrue(cache.has_key("eternal"))
+        self.assertTrue(cache.has_key("key11"))
+        self.assertFalse(cache.has_key("key0"))
+
+
+@override_settings(
+    PAGE_CACHE_STALE=60, PAGE_CACHE_LOCK_TIMEOUT=30, PAGE_CACHE_LOCK_WAIT=1
+)
+class SingleFlightCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = LocMemCache("single-flight", {})
+        self.addCleanup(self.backend.clear)
+
+    def test_stale_entry_is_rebuilt_once(self):
+        first = SingleFlightCache(self.backend)
+        second = SingleFlightCache(self.backend)
+        first.set("page", "old", 10)
+        with mock.patch("time.time", return_value=time.time() + 20):
+            # Первый пересчитывает, второй получает прежнюю страницу.
+            self.assertIsNone(first.get("page"))
+            self.assertEqual(second.get("page"), "old")
+            first.set("page", "new", 10)
+            self.assertEqual(second.get("page"), "new")
+        self.assertFalse(first.locks)
+
+    def test_miss_waits_for_first_writer(self):
+        first = SingleFlightCache(self.backend)
+        second = SingleFlightCache(self.backend)
+        self.assertIsNone(first.get("page"))
+        timer = threading.Timer(0.1, first.set, ["page", "fresh", 10])
+        timer.start()
+        self.addCleanup(timer.join)
+        self.assertEqual(second.get("page"), "fresh")
+
+    def test_release_lets_others_rebuild(self):
+        first = SingleFlightCache(self.backend)
+        second = SingleFlightCache(self.backend)
+        self.assertIsNone(first.get("page"))
+        first.release()
+        started = time.monotonic()
+        self.assertIsNone(second.get("page"))
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(second.locks, {"page"})
+
+
+class LocalLRUTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LocalLRU(max_entries=2, max_bytes=100)
+        lru.set("a", b"1", 60)
+        lru.set("b", b"2", 60)
+        lru.get("a")
+        lru.set("c", b"3", 60)
+        self.assertEqual(lru.get("a"), b"1")
+        self.assertIsNone(lru.get("b"))
+
+    def test_bounds_size_in_bytes(self):
+        lru = LocalLRU(max_entries=10, max_bytes=10)
+        lru.set("a", b"x" * 6, 60)
+        lru.set("b", b"x" * 6, 60)
+        self.assertIsNone(lru.get("a"))
+        lru.set("big", b"x" * 11, 60)
+        self.assertIsNone(lru.get("big"))
+        self.assertEqual(lru.size, 6)
+
+    def test_entries_expire(self):
+        lru = LocalLRU(max_entries=10, max_bytes=100)
+        lru.set("a", b"1", 1)
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 2):
+            self.assertIsNone(lru.get("a"))
+
+
+@override_settings(CACHES=TIERED_CACHES)
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches["default"]
+        self.shared = caches["shared"]
+        self.addCleanup(self.cache.clear)
+        self.addCleanup(registry.reset)
+        registry.reset()
+
+    def other_process(self):
+        # Другой процесс - свой L1 перед тем же L2.
+        cache = TieredCache("shared", TIERED_CACHES["default"])
+        cache.local = LocalLRU(100, 1024 ** 2)
+        return cache
+
+    def test_second_read_served_from_l1(self):
+        self.shared.set("page", "body")
+        self.assertEqual(self.cache.get("page"), "body")
+        self.shared.delete("page")
+        self.assertEqual(self.cache.get("page"), "body")
+        ratios = {
+            dict(labels)["tier"]: ratio
+            for (_, labels), ratio in hit_ratios(registry.counters).items()
+        }
+        self.assertEqual(ratios, {"l1": 0.5, "l2": 1})
+
+    def test_version_counters_bypass_l1(self):
+        other = self.other_process()
+        self.cache.set("page_version:index", 1, timeout=None)
+        self.assertEqual(other.get("page_version:index"), 1)
+        self.cache.incr("page_version:index")
+        self.assertEqual(other.get("page_version:index"), 2)
+        self.assertEqual(
+            other.get_many(["page_version:index"]), {"page_version:index": 2}
+        )
+
+    def test_writes_reach_l2_and_drop_l1_copy(self):
+        self.cache.set("key", "old")
+        self.assertEqual(self.shared.get("key"), "old")
+        self.cache.delete("key")
+        self.assertIsNone(self.cache.get("key"))
+        self.assertTrue(self.cache.add("key", "new"))
+        self.assertEqual(self.cache.get("key"), "new")
+
+    def test_l1_copy_lives_at_most_l1_timeout(self):
+        other = self.other_process()
+        self.cache.set("header", "old")
+        other.get("header")
+        self.cache.set("header", "new")
+        self.assertEqual(other.get("header"), "old")
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 61):
+            self.assertEqual(other.get("header"), "new")
+
+
+@override_settings(CACHES=TIERED_CACHES)
+class TieredPageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+
+    def setUp(self):
+        caches["default"].clear()
+        self.addCleanup(caches["default"].clear)
+
+    def test_bumped_group_is_not_served_from_l1(self):
+        url = reverse("posts:group_list", args=[self.group.slug])
+        client = Client()
+        client.get(url)
+        with self.assertNumQueries(0):
+            client.get(url)
+        Group.objects.filter(pk=self.group.pk).update(title="Новая")
+        bump(("group", self.group.slug))
+        response = client.get(url)
+        self.assertEqual(response.context["group"].title, "Новая")
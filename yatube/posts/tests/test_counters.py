@@ -0,0 +1,65 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import Comment, Follow, Post, User, UserStats
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username="Author")
+        cls.reader = User.objects.create(username="Reader")
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(text="Пост", author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text="Комментарий"
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.author).post_count, 1)
+        self.assertEqual(self.stats(self.author).follower_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.stats(self.author).follower_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+        Post.objects.filter(pk=post.pk).delete()
+        self.assertEqual(self.stats(self.author).post_count, 0)
+
+    def test_rebuild_counters(self):
+        """rebuild_counters восстанавливает счётчики после bulk_create."""
+        posts = Post.objects.bulk_create(
+            Post(text=f"Пост {i}", author=self.author) for i in range(3)
+        )
+        post = Post.objects.filter(author=self.author).first()
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.reader, text="Комментарий")
+            for _ in range(2)
+        )
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command("rebuild_counters", stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+        self.assertEqual(self.stats(self.author).post_count, len(posts))
+        self.assertTrue(UserStats.objects.filter(user=self.reader).exists())
+
+    def test_delete_user_with_posts(self):
+        """Удаление автора со всеми постами не ломает счётчики."""
+        leaving = User.objects.create(username="Leaving")
+        Post.objects.create(text="Пост", author=leaving)
+        Follow.objects.create(user=self.author, author=leaving)
+        leaving_id = leaving.id
+        leaving.delete()
+        self.assertFalse(UserStats.objects.filter(user=leaving_id).exists())
+        self.assertEqual(self.stats(self.author).following_count, 0)
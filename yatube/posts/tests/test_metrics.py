@@ -0,0 +1,187 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+
+from ..models import Post, User
+
+
+def sample(text, name, **labels):
+    """Значение строки метрики name с метками labels."""
+    for line in text.splitlines():
+        match = re.match(r"(\w+)(?:\{(.*)\})? (\S+)$", line)
+        if not match or match[1] != name:
+            continue
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match[2] or ""))
+        if found == labels:
+            return float(match[3])
+    return None
+
+
+@override_settings(METRICS_TOKEN="secret")
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create(username="Author")
+        Post.objects.create(text="Пост", author=author)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.client = Client()
+
+    def scrape(self):
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_view_metrics(self):
+        """Запросы, база, кэш страниц и шаблоны учитываются по view."""
+        self.client.get(reverse("posts:index"))
+        self.client.get(reverse("posts:index"))
+        text = self.scrape()
+        view = "posts:index"
+        self.assertEqual(sample(
+            text, "yatube_http_requests_total",
+            view=view, method="GET", status="200"
+        ), 2)
+        self.assertEqual(sample(
+            text, "yatube_http_request_duration_seconds_count", view=view
+        ), 2)
+        self.assertEqual(sample(
+            text, "yatube_http_request_duration_seconds_bucket",
+            view=view, le="+Inf"
+        ), 2)
+        self.assertGreater(
+            sample(text, "yatube_db_queries_total", view=view), 0
+        )
+        for result in ("hit", "miss"):
+            self.assertEqual(sample(
+                text, "yatube_page_cache_requests_total",
+                view=view, result=result
+            ), 1)
+        # Страница из кэша не отрисовывает шаблоны.
+        self.assertEqual(sample(
+            text, "yatube_template_render_duration_seconds_count", view=view
+        ), 1)
+
+    def test_unresolved_url(self):
+        self.client.get("/no-such-page/")
+        self.assertEqual(sample(
+            self.scrape(), "yatube_http_requests_total",
+            view="unresolved", method="GET", status="404"
+        ), 1)
+
+    @override_settings(METRICS_ALLOWED_IPS=["10.0.0.5"])
+    def test_access(self):
+        """/metrics закрыт для всех, кроме персонала, токена и адресов."""
+        url = reverse("metrics")
+        staff = User.objects.create(username="Staff", is_staff=True)
+        staff_client = Client()
+        staff_client.force_login(staff)
+        cases = [
+            (self.client, {}, 403),
+            (self.client, {"HTTP_AUTHORIZATION": "Bearer wrong"}, 403),
+            (self.client, {"HTTP_AUTHORIZATION": "Bearer secret"}, 200),
+            (self.client, {"REMOTE_ADDR": "10.0.0.5"}, 200),
+            (staff_client, {}, 200),
+        ]
+        for client, headers, status in cases:
+            with self.subTest(headers=headers, status=status):
+                response = client.get(url, **headers)
+                self.assertEqual(response.status_code, status)
+
+    def test_processes_are_summed(self):
+        """/metrics складывает метрики всех процессов из METRICS_DIR."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = metrics.Registry()
+        other.inc("yatube_db_queries_total", {"view": "posts:index"}, 5)
+        other.observe(
+            "yatube_http_request_duration_seconds",
+            {"view": "posts:index"},
+            0.3
+        )
+        with open(os.path.join(directory, "1.json"), "w") as dump:
+            json.dump(other.snapshot(), dump)
+        with override_settings(METRICS_DIR=directory):
+            self.client.get(reverse("posts:index"))
+            text = self.scrape()
+        self.assertGreater(
+            sample(text, "yatube_db_queries_total", view="posts:index"), 5
+        )
+        self.assertEqual(sample(
+            text, "yatube_http_request_duration_seconds_count",
+            view="posts:index"
+        ), 2)
+        self.assertEqual(sample(
+            text, "yatube_http_request_duration_seconds_bucket",
+            view="posts:index", le="0.25"
+        ), 1)
+        self.assertTrue(
+            os.path.exists(os.path.join(directory, f"{os.getpid()}.json"))
+        )
+
+
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create(username="Staff", is_staff=True)
+        cls.user = User.objects.create(username="User")
+        Post.objects.create(text="Пост", author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def timings(self, response):
+        return dict(
+            re.match(r'(\w+);dur=[\d.]+;desc="(.*)"', entry).groups()
+            for entry in re.split(
+                r", (?=\w+;dur=)", response["Server-Timing"]
+            )
+        )
+
+    def test_staff_opt_in(self):
+        """Разбивка времени по view для сотрудника с заголовком."""
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse("posts:index"), HTTP_X_SERVER_TIMING="1"
+        )
+        timings = self.timings(response)
+        self.assertEqual(timings["total"], "posts:index")
+        self.assertRegex(timings["db"], r"^[1-9]\d* queries$")
+        self.assertIn("template", timings)
+        self.assertIn("page miss", timings["cache"])
+        response = self.client.get(
+            reverse("posts:index"), HTTP_X_SERVER_TIMING="1"
+        )
+        self.assertIn("page hit", self.timings(response)["cache"])
+        self.assertNotIn("template", self.timings(response))
+
+    def test_cookie_opt_in(self):
+        self.client.force_login(self.staff)
+        self.client.cookies["server_timing"] = "1"
+        response = self.client.get(reverse("posts:index"))
+        self.assertIn("total", self.timings(response))
+
+    def test_disabled_by_default(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("posts:index"))
+        self.assertFalse(response.has_header("Server-Timing"))
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("posts:index"), HTTP_X_SERVER_TIMING="1"
+        )
+        self.assertFalse(response.has_header("Server-Timing"))
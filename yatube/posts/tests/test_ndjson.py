@@ -0,0 +1,83 @@
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import Comment, FeedEntry, Follow, Group, Post, User, UserStats
+from ..search import search_posts
+
+
+class NdjsonTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username="Author")
+        self.reader = User.objects.create(username="Reader")
+        self.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+        self.post = Post.objects.create(
+            text="Старый пост про кошек",
+            author=self.author,
+            group=self.group,
+        )
+        self.pub_date = timezone.now() - datetime.timedelta(days=30)
+        Post.objects.filter(pk=self.post.pk).update(pub_date=self.pub_date)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text="Комментарий"
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        handle, self.path = tempfile.mkstemp(suffix=".ndjson")
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def test_round_trip(self):
+        """Выгрузка и загрузка восстанавливают данные и производные."""
+        call_command(
+            "export_ndjson", self.path, "--batch-size", "1", stderr=StringIO()
+        )
+        with open(self.path, encoding="utf-8") as lines:
+            labels = [json.loads(line)["model"] for line in lines]
+        self.assertEqual(
+            labels,
+            [
+                "auth.user", "auth.user", "posts.group", "posts.post",
+                "posts.comment", "posts.follow",
+            ],
+        )
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.assertFalse(Post.objects.exists())
+        call_command(
+            "import_ndjson", self.path, "--batch-size", "1", stdout=StringIO()
+        )
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.pub_date, self.pub_date)
+        self.assertEqual(post.group.slug, "group")
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(Comment.objects.get().author.username, "Reader")
+        self.assertEqual(
+            UserStats.objects.get(user__username="Author").follower_count, 1
+        )
+        self.assertTrue(
+            FeedEntry.objects.filter(
+                user__username="Reader", post=post
+            ).exists()
+        )
+        self.assertEqual(search_posts("кошек"), [post.pk])
+
+    def test_children_before_parents(self):
+        """Строки, идущие раньше своих родителей, тоже загружаются."""
+        call_command("export_ndjson", self.path, stderr=StringIO())
+        with open(self.path, encoding="utf-8") as lines:
+            records = list(reversed(lines.readlines()))
+        with open(self.path, "w", encoding="utf-8") as output:
+            output.writelines(records)
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        call_command("import_ndjson", self.path, stdout=StringIO())
+        self.assertEqual(Post.objects.get().author.username, "Author")
+        self.assertEqual(Follow.objects.count(), 1)
@@ -0,0 +1,38 @@
+from django.core.paginator import Paginator
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase
+
+from ..templatetags.post_pagination import ELLIPSIS, elided_page_range
+
+
+class ElidedPageRangeTests(SimpleTestCase):
+    def test_short_range_is_not_elided(self):
+        page_obj = Paginator(range(100), 10).page(5)
+        self.assertEqual(elided_page_range(page_obj), list(range(1, 11)))
+
+    def test_long_range_is_elided(self):
+        """Остаются края ленты и соседи текущей страницы."""
+        page_obj = Paginator(range(50000), 10).page(2500)
+        self.assertEqual(
+            elided_page_range(page_obj),
+            [
+                1, 2, ELLIPSIS, 2497, 2498, 2499, 2500, 2501, 2502, 2503,
+                ELLIPSIS, 4999, 5000,
+            ],
+        )
+
+    def test_near_start(self):
+        page_obj = Paginator(range(50000), 10).page(3)
+        self.assertEqual(
+            elided_page_range(page_obj),
+            [1, 2, 3, 4, 5, 6, ELLIPSIS, 4999, 5000],
+        )
+
+    def test_paginator_markup_is_bounded(self):
+        """Число ссылок пагинатора не растёт вместе с лентой."""
+        page_obj = Paginator(range(50000), 10).page(2500)
+        html = render_to_string(
+            "posts/includes/paginator.html", {"page_obj": page_obj}
+        )
+        self.assertEqual(html.count("page=2498\""), 1)
+        self.assertLess(html.count("<li"), 20)
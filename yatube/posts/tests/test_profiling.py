@@ -0,0 +1,104 @@
+import json
+import marshal
+import shutil
+import tempfile
+from collections import Counter
+
+from django.core.cache import cache
+from django.template import engines
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import profiling
+
+from ..models import Post, User
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create(username="Staff", is_staff=True)
+        Post.objects.create(text="Пост", author=cls.staff)
+
+    def setUp(self):
+        cache.clear()
+        profiling.profiles.reset()
+        self.client = Client()
+        self.client.force_login(self.staff)
+
+    def download(self, view_name, fmt):
+        return self.client.get(reverse(
+            "core:profile_download", args=[view_name, fmt]
+        ))
+
+    def test_sampler_names_templates_and_filters(self):
+        """В стеках видны шаблон и фильтры, которые он вызывает."""
+        template = engines["django"].from_string(
+            "{% for line in lines %}{{ line|linebreaksbr }}{% endfor %}"
+        )
+        with profiling.Sampler(0.001, None) as sampler:
+            template.render({"lines": ["строка\nстрока"] * 20000})
+        labels = {name for stack in sampler.stacks for name in stack}
+        self.assertIn("template None", labels)
+        self.assertTrue(
+            any(name.startswith("linebreaksbr") for name in labels)
+        )
+
+    def test_downloads(self):
+        profiling.profiles.add_samples(
+            "posts:index", Counter({("view", "render"): 3, ("view",): 1})
+        )
+        response = self.download("posts:index", "collapsed")
+        self.assertEqual(
+            response.content.decode(), "view 1\nview;render 3\n"
+        )
+        with override_settings(PROFILE_INTERVAL=0.01):
+            response = self.download("posts:index", "speedscope")
+        profile = json.loads(response.content)["profiles"][0]
+        self.assertEqual(profile["weights"], [10, 30])
+        for view_name, fmt in (
+            ("posts:index", "pstats"),
+            ("posts:other", "collapsed"),
+            ("posts:index", "html"),
+        ):
+            with self.subTest(view_name=view_name, fmt=fmt):
+                response = self.download(view_name, fmt)
+                self.assertEqual(response.status_code, 404)
+
+    def test_cprofile_mode(self):
+        """Профиль cProfile копится по view и отдаётся в pstats."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(
+            PROFILE_SAMPLE_RATE=1, PROFILE_MODE="cprofile",
+            PROFILE_DIR=directory
+        ):
+            self.client.get(reverse("posts:index"))
+            response = self.client.get(reverse("core:profile_list"))
+            self.assertIn(
+                ("posts:index", 0, True), response.context["profiles"]
+            )
+            response = self.download("posts:index", "pstats")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(marshal.loads(response.content))
+
+    def test_views_without_samples_are_hidden(self):
+        """view без сэмплов не показывается и ссылок на 404 не даёт."""
+        profiling.profiles.add_samples("posts:index", Counter())
+        profiling.profiles.add_samples("posts:other", Counter({("v",): 2}))
+        response = self.client.get(reverse("core:profile_list"))
+        self.assertEqual(
+            response.context["profiles"], [("posts:other", 2, False)]
+        )
+        self.assertNotContains(response, "pstats")
+
+    def test_staff_only(self):
+        self.client.logout()
+        response = self.client.get(reverse("core:profile_list"))
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(PROFILE_SAMPLE_RATE=0)
+    def test_disabled(self):
+        self.client.get(reverse("posts:index"))
+        self.assertEqual(profiling.profiles.views(), [])
@@ -0,0 +1,93 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from mixer.backend.django import mixer
+
+from ..models import Comment, Follow, Group, Post, User
+
+
+class PostQueryCountTests(TestCase):
+    """Число запросов к БД на страницу не зависит от числа постов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username="Reader")
+        cls.author = User.objects.create(username="Author")
+        cls.group = mixer.blend(Group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for _ in range(15):
+            cls.post = Post.objects.create(
+                text="Текст поста",
+                author=cls.author,
+                group=cls.group,
+            )
+            Post.objects.create(
+                text="Пост другого автора",
+                author=mixer.blend(User),
+                group=cls.group,
+            )
+            Comment.objects.create(
+                post=cls.post,
+                author=mixer.blend(User),
+                text="Комментарий",
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_guest_query_count(self):
+        """Страницы для гостя укладываются в заданное число запросов."""
+        # страница: запросов
+        expected = {
+            reverse("posts:index"): 1,
+            reverse("posts:group_list", args=[self.group.slug]): 2,
+            reverse("posts:profile", args=[self.author.username]): 2,
+            reverse("posts:post_detail", args=[self.post.id]): 3,
+        }
+        for url, queries in expected.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    self.guest_client.get(url)
+
+    def test_authorized_query_count(self):
+        """
+        Для пользователя добавляются только сессия и сам пользователь
+        (и проверка подписки в профиле).
+        """
+        expected = {
+            reverse("posts:index"): 3,
+            reverse("posts:group_list", args=[self.group.slug]): 4,
+            reverse("posts:profile", args=[self.author.username]): 5,
+            reverse("posts:post_detail", args=[self.post.id]): 5,
+            reverse("posts:follow_index"): 4,
+            reverse("posts:post_create"): 3,
+            reverse("posts:post_edit", args=[self.post.id]): 3,
+        }
+        for url, queries in expected.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    self.authorized_client.get(url)
+
+    def test_page_number_fallback_query_count(self):
+        """Запасной режим ?page=N добавляет только COUNT(*)."""
+        with self.assertNumQueries(2):
+            self.guest_client.get(reverse("posts:index"), {"page": 2})
+
+    def test_cached_page_query_count(self):
+        """Повторный показ страницы берётся из кэша."""
+        # страница: запросов при попадании в кэш
+        expected = {
+            reverse("posts:index"): 0,
+            reverse("posts:group_list", args=[self.group.slug]): 0,
+            reverse("posts:profile", args=[self.author.username]): 0,
+            reverse("posts:post_detail", args=[self.post.id]): 1,
+        }
+        for url, queries in expected.items():
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+                with self.assertNumQueries(queries):
+                    self.guest_client.get(url)
@@ -0,0 +1,132 @@
+import re
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, skipUnlessDBFeature
+from django.urls import reverse
+from mixer.backend.django import mixer
+
+from ..models import Comment, Follow, Group, Post, User
+
+# Строки EXPLAIN QUERY PLAN, которые означают полный просмотр таблицы
+# или сортировку во временном B-дереве.
+FULL_SCAN_RE = re.compile(r"^SCAN (TABLE )?\w+$")
+TEMP_SORT_RE = re.compile(r"USE TEMP B-TREE")
+ALLOWED = (
+    # Ранжирование поиска сортирует по релевантности, индекса нет.
+    re.compile(r"FROM posts_search_fts"),
+    # Форма поста показывает все группы в выпадающем списке.
+    re.compile(r'FROM "posts_group"$'),
+)
+
+
+class PlanRecorder:
+    """execute_wrapper, запоминающий запросы вместе с параметрами."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many:
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+@skipUnlessDBFeature("supports_explaining_query_execution")
+class QueryPlanTests(TestCase):
+    """
+    Ни один запрос view из posts/views.py не просматривает таблицу
+    целиком и не сортирует строки во временном B-дереве.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username="Reader")
+        cls.author = User.objects.create(username="Author")
+        cls.group = mixer.blend(Group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(25):
+            cls.post = Post.objects.create(
+                text=f"Текст поста {number}",
+                author=cls.author,
+                group=cls.group,
+            )
+            Comment.objects.create(
+                post=cls.post,
+                author=mixer.blend(User),
+                text="Комментарий",
+            )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    @contextmanager
+    def assertIndexedPlans(self):
+        recorder = PlanRecorder()
+        cache.clear()
+        with connection.execute_wrapper(recorder):
+            yield
+        self.assertTrue(recorder.queries)
+        for sql, params in recorder.queries:
+            if not sql.lstrip().upper().startswith(
+                ("SELECT", "UPDATE", "DELETE")
+            ):
+                continue
+            if any(pattern.search(sql) for pattern in ALLOWED):
+                continue
+            plan = explain(sql, params)
+            for line in plan:
+                with self.subTest(sql=sql, line=line):
+                    self.assertIsNone(FULL_SCAN_RE.match(line), plan)
+                    self.assertIsNone(TEMP_SORT_RE.search(line), plan)
+
+    def test_read_views(self):
+        urls = [
+            reverse("posts:index"),
+            reverse("posts:index") + "?page=2",
+            reverse("posts:group_list", args=[self.group.slug]),
+            reverse("posts:group_list", args=[self.group.slug]) + "?page=2",
+            reverse("posts:profile", args=[self.author.username]),
+            reverse("posts:profile", args=[self.author.username])
+            + "?page=2",
+            reverse("posts:post_detail", args=[self.post.id]),
+            reverse("posts:post_comments", args=[self.post.id]),
+            reverse("posts:follow_index"),
+            reverse("posts:follow_index") + "?page=2",
+            reverse("posts:search") + "?q=текст",
+            reverse("posts:post_create"),
+            reverse("posts:post_edit", args=[self.post.id]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with self.assertIndexedPlans():
+                    self.client.get(url)
+
+    def test_write_views(self):
+        with self.assertIndexedPlans():
+            self.client.post(
+                reverse("posts:post_create"), {"text": "Новый пост"}
+            )
+        with self.assertIndexedPlans():
+            self.client.post(
+                reverse("posts:add_comment", args=[self.post.id]),
+                {"text": "Новый комментарий"},
+            )
+        other = User.objects.create(username="Other")
+        with self.assertIndexedPlans():
+            self.client.get(
+                reverse("posts:profile_follow", args=[other.username])
+            )
+        with self.assertIndexedPlans():
+            self.client.get(
+                reverse("posts:profile_unfollow", args=[other.username])
+            )
@@ -0,0 +1,105 @@
+from unittest import mock
+
+from django.db import connections
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from core import routers
+
+from ..models import Post, User
+
+
+class RouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        # В тестах реплика - зеркало основной базы; здесь - отдельная.
+        patcher = mock.patch.dict(
+            connections["replica"].settings_dict,
+            {"NAME": "file:replica.sqlite3?mode=ro"}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(routers.reset)
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Post), "replica")
+
+    def test_writes_pin_to_primary(self):
+        def view(request):
+            self.assertEqual(self.router.db_for_write(Post), "default")
+            self.assertEqual(self.router.db_for_read(Post), "default")
+            return HttpResponse()
+
+        routers.ReadYourWritesMiddleware(view)(RequestFactory().get("/"))
+        self.assertEqual(self.router.db_for_read(Post), "replica")
+
+    def test_writes_outside_requests_do_not_pin(self):
+        """Команды и фоновые потоки не остаются закреплёнными."""
+        self.assertEqual(self.router.db_for_write(Post), "default")
+        self.assertEqual(self.router.db_for_read(Post), "replica")
+
+    def test_mirror_is_not_a_replica(self):
+        with mock.patch.dict(
+            connections["replica"].settings_dict,
+            {"NAME": connections["default"].settings_dict["NAME"]}
+        ):
+            self.assertEqual(self.router.db_for_read(Post), "default")
+
+    def test_migrations_only_on_primary(self):
+        self.assertTrue(self.router.allow_migrate("default", "posts"))
+        self.assertFalse(self.router.allow_migrate("replica", "posts"))
+
+    def test_pin_cookie_pins_request(self):
+        seen = []
+        middleware = routers.ReadYourWritesMiddleware(
+            lambda request: seen.append(routers.pinned()) or HttpResponse()
+        )
+        factory = RequestFactory()
+        middleware(factory.get("/"))
+        request = factory.get("/")
+        request.COOKIES[routers.PIN_COOKIE] = "1"
+        middleware(request)
+        middleware(factory.post("/"))
+        self.assertEqual(seen, [False, True, True])
+        self.assertFalse(routers.pinned())
+
+
+class ReadYourWritesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username="Author")
+        cls.reader = User.objects.create(username="Reader")
+        cls.post = Post.objects.create(text="Пост", author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_write_sets_pin_cookie(self):
+        """После записи пользователь какое-то время читает из основной."""
+        response = self.client.post(
+            reverse("posts:add_comment", args=[self.post.id]),
+            {"text": "Комментарий"}
+        )
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], 10)
+        self.assertTrue(cookie["httponly"])
+
+    def test_read_does_not_pin(self):
+        response = self.client.get(reverse("posts:index"))
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_get_and_session_writes_do_not_pin(self):
+        """Окно открывает только запись в модели проекта методом POST."""
+        session = self.client.session
+        session["seen"] = True
+        session.save()
+        for response in (
+            self.client.get(
+                reverse("posts:profile_follow", args=[self.author.username])
+            ),
+            self.client.post(reverse("users:logout")),
+        ):
+            self.assertNotIn(routers.PIN_COOKIE, response.cookies)
@@ -0,0 +1,136 @@
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.apps import apps
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from .. import search
+from ..models import Comment, Post, User
+from ..stemmer import stem
+
+
+class StemmerTest(TestCase):
+    def test_stem(self):
+        """Формы одного слова сводятся к общей основе."""
+        words = {
+            "книга": "книг",
+            "книгами": "книг",
+            "красивая": "красив",
+            "красивые": "красив",
+            "вечерние": "вечерн",
+            "ёлки": "елк",
+            "программировании": "программирован",
+        }
+        for word, expected in words.items():
+            with self.subTest(word=word):
+                self.assertEqual(stem(word), expected)
+
+
+class SearchTests(TestCase):
+    backend = "auto"
+
+    def setUp(self):
+        self.override = override_settings(SEARCH_BACKEND=self.backend)
+        self.override.enable()
+        search._backend = None
+        self.client = Client()
+        self.author = User.objects.create(username="Author")
+        self.about_books = Post.objects.create(
+            text="Читаю интересные книги по вечерам",
+            author=self.author
+        )
+        self.about_dogs = Post.objects.create(
+            text="Гуляли с собакой, потом читали книгу",
+            author=self.author
+        )
+        Comment.objects.create(
+            post=self.about_books,
+            author=self.author,
+            text="Книги про собак тоже хороши",
+        )
+
+    def tearDown(self):
+        self.override.disable()
+        search._backend = None
+
+    def test_search_stems_and_ranks(self):
+        """Поиск находит другие формы слова и ранжирует по ним."""
+        self.assertEqual(
+            search.search_posts("книгами"),
+            [self.about_books.id, self.about_dogs.id],
+        )
+        self.assertEqual(
+            search.search_posts("собака"),
+            [self.about_dogs.id, self.about_books.id],
+        )
+        self.assertEqual(search.search_posts("вечер книга"), [
+            self.about_books.id
+        ])
+        self.assertEqual(search.search_posts("кошка"), [])
+
+    def test_terms_match_across_post_and_comments(self):
+        """
+        Слова ищутся во всём посте с комментариями, а не в одной
+        строке индекса: оба бэкенда находят одно и то же.
+        """
+        self.assertEqual(search.search_posts("собака вечер"), [
+            self.about_books.id
+        ])
+        self.assertEqual(search.search_posts("вечер вечером"), [
+            self.about_books.id
+        ])
+        self.assertEqual(search.search_posts("собака кошка"), [])
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении постов."""
+        self.about_dogs.text = "Теперь только про кошку"
+        self.about_dogs.save()
+        self.assertEqual(search.search_posts("кошки"), [self.about_dogs.id])
+        self.about_dogs.delete()
+        self.assertEqual(search.search_posts("кошки"), [])
+
+    def test_long_words_match(self):
+        """Слово длиннее обрезки индекса тоже находится."""
+        word = "supercalifragilistic" * 5
+        post = Post.objects.create(text=f"Слово {word}", author=self.author)
+        self.assertEqual(search.search_posts(word), [post.id])
+
+    def test_migration_fills_index(self):
+        """Миграция индексирует посты, написанные до поиска."""
+        search.get_backend().clear()
+        migration = import_module("posts.migrations.0017_fill_search_index")
+        migration.fill_search_index(
+            apps, SimpleNamespace(connection=connection)
+        )
+        self.assertEqual(search.search_posts("вечер книга"), [
+            self.about_books.id
+        ])
+
+    def test_admin_search(self):
+        """Админка ищет и по подстроке, и по формам слова."""
+        admin = User.objects.create_superuser("admin", "a@a.ru", "pass")
+        self.client.force_login(admin)
+        url = reverse("admin:posts_post_changelist")
+        for query, expected in {
+            "нтересн": [self.about_books],
+            "книгами": [self.about_books, self.about_dogs],
+        }.items():
+            with self.subTest(query=query):
+                response = self.client.get(url, {"q": query})
+                self.assertCountEqual(
+                    response.context["cl"].result_list, expected
+                )
+
+    def test_search_page(self):
+        """Страница поиска показывает найденные посты."""
+        response = self.client.get(reverse("posts:search"), {"q": "собаки"})
+        self.assertEqual(
+            list(response.context["page_obj"]),
+            [self.about_dogs, self.about_books],
+        )
+
+
+class InvertedIndexSearchTests(SearchTests):
+    backend = "python"
@@ -0,0 +1,82 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count, F
+from django.test import TestCase
+
+from ..models import Comment, FeedEntry, Follow, Group, Post, User, UserStats
+
+SIZES = {
+    "users": 30,
+    "groups": 4,
+    "posts": 300,
+    "comments": 500,
+    "follows": 60,
+}
+
+
+class SeedTests(TestCase):
+    def seed(self, **options):
+        call_command("seed", stdout=StringIO(), **SIZES, **options)
+
+    def test_seed_creates_requested_rows(self):
+        self.seed()
+        self.assertEqual(User.objects.count(), SIZES["users"])
+        self.assertEqual(Group.objects.count(), SIZES["groups"])
+        self.assertEqual(Post.objects.count(), SIZES["posts"])
+        self.assertEqual(Comment.objects.count(), SIZES["comments"])
+        self.assertEqual(Follow.objects.count(), SIZES["follows"])
+        self.assertFalse(Follow.objects.filter(user=F("author")).exists())
+        self.assertFalse(
+            Comment.objects.filter(created__lt=F("post__pub_date")).exists()
+        )
+        self.assertEqual(
+            sum(UserStats.objects.values_list("post_count", flat=True)),
+            SIZES["posts"],
+        )
+        self.assertTrue(FeedEntry.objects.exists())
+
+    def test_authors_are_skewed(self):
+        """Самый активный автор пишет заметно больше среднего."""
+        self.seed()
+        counts = sorted(
+            Post.objects.order_by().values("author").annotate(
+                total=Count("pk")
+            ).values_list("total", flat=True),
+            reverse=True,
+        )
+        self.assertGreater(counts[0], 3 * SIZES["posts"] / SIZES["users"])
+
+    def snapshot(self):
+        return (
+            list(Post.objects.order_by("pk").values_list(
+                "pk", "text", "author__username", "group__slug", "pub_date"
+            )),
+            list(Comment.objects.order_by("pk").values_list(
+                "pk", "post_id", "author_id", "created"
+            )),
+            list(Follow.objects.order_by("pk").values_list(
+                "pk", "user_id", "author_id"
+            )),
+        )
+
+    def test_same_seed_same_data(self):
+        """Повторный запуск с тем же seed даёт те же строки и даты."""
+        self.seed(seed=7)
+        first = self.snapshot()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.seed(seed=7)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_taken_ids_are_refused(self):
+        """Занятые id не сдвигают нумерацию, а останавливают запуск."""
+        User.objects.create(username="existing")
+        with self.assertRaises(CommandError):
+            self.seed()
+        self.assertEqual(User.objects.count(), 1)
+        self.seed(first_id=1000)
+        self.assertEqual(
+            Post.objects.order_by("pk").values_list("pk", flat=True)[0], 1000
+        )
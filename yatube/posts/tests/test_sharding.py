@@ -0,0 +1,399 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.utils import load_backend
+from django.test import (Client, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.metrics import registry
+
+from .. import counters, feed, sharding
+from ..models import Comment, FeedEntry, Follow, Post, User, UserStats
+
+SHARDS = ["shard_0", "shard_1"]
+
+
+class ShardingTests(TestCase):
+    databases = {"default", *SHARDS}
+
+    @classmethod
+    def setUpClass(cls):
+        # Шарды добавляются на время класса: в настройках их нет.
+        cls.directory = tempfile.mkdtemp()
+        for alias in SHARDS:
+            connections.databases[alias] = {
+                **connections["default"].settings_dict,
+                "NAME": os.path.join(cls.directory, f"{alias}.sqlite3"),
+                "OPTIONS": {"pragmas": {"foreign_keys": "OFF"}},
+                "TEST": {},
+            }
+        cls.sharding = override_settings(POST_SHARDS=SHARDS)
+        cls.sharding.enable()
+        for alias in SHARDS:
+            call_command("migrate", database=alias, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.sharding.disable()
+        for alias in SHARDS:
+            connections[alias].close()
+            delattr(connections._connections, alias)
+            del connections.databases[alias]
+        shutil.rmtree(cls.directory)
+
+    @classmethod
+    def setUpTestData(cls):
+        # Авторы с id разной чётности попадают на разные шарды.
+        cls.first = User.objects.create(username="first")
+        cls.second = User.objects.create(username="second")
+        if cls.first.pk % 2 == cls.second.pk % 2:
+            cls.second = User.objects.create(username="third")
+        cls.reader = User.objects.create(username="reader")
+        start = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        cls.posts = []
+        for number in range(12):
+            author = (cls.first, cls.second)[number % 2]
+            post = author.posts.create(text=f"Пост {number}")
+            post.pub_date = start + datetime.timedelta(hours=number)
+            post.save()
+            cls.posts.append(post)
+        Follow.objects.create(user=cls.reader, author=cls.second)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.first)
+
+    def queries(self):
+        """Счётчики запросов к каждому шарду."""
+        contexts = {
+            alias: CaptureQueriesContext(connections[alias])
+            for alias in SHARDS
+        }
+        for context in contexts.values():
+            context.__enter__()
+            self.addCleanup(context.__exit__, None, None, None)
+        return contexts
+
+    def drop_feed_entries_after_test(self):
+        # В тестах основная база проверяет внешние ключи, а записи
+        # ленты ссылаются на посты с шардов.
+        self.addCleanup(FeedEntry.objects.all().delete)
+
+    def shard_of(self, user):
+        return SHARDS[user.pk % len(SHARDS)]
+
+    def test_posts_live_on_author_shard(self):
+        for post in self.posts:
+            alias = self.shard_of(post.author)
+            self.assertEqual(post._state.db, alias)
+            self.assertEqual(sharding.shard_for(post_id=post.pk), alias)
+            self.assertTrue(
+                Post.objects.using(alias).filter(pk=post.pk).exists()
+            )
+        self.assertFalse(Post.objects.using("default").exists())
+        ids = [post.pk for post in self.posts]
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_profile_hits_one_shard(self):
+        queries = self.queries()
+        response = self.client.get(
+            reverse("posts:profile", args=[self.first.username])
+        )
+        self.assertEqual(response.status_code, 200)
+        other = self.shard_of(self.second)
+        self.assertEqual(len(queries[other]), 0)
+        self.assertGreater(len(queries[self.shard_of(self.first)]), 0)
+        self.assertTrue(all(
+            post.author_id == self.first.pk
+            for post in response.context["page_obj"]
+        ))
+
+    def test_detail_and_edit_hit_one_shard(self):
+        post = self.posts[0]
+        other = self.shard_of(self.second)
+        queries = self.queries()
+        response = self.client.get(
+            reverse("posts:post_detail", args=[post.pk])
+        )
+        self.assertEqual(response.context["post"], post)
+        self.client.post(
+            reverse("posts:post_edit", args=[post.pk]),
+            {"text": "Новый текст"}
+        )
+        self.assertEqual(len(queries[other]), 0)
+        post.refresh_from_db()
+        self.assertEqual(post.text, "Новый текст")
+
+    def test_comment_lives_with_post(self):
+        post = self.posts[1]
+        alias = self.shard_of(self.second)
+        self.client.post(
+            reverse("posts:add_comment", args=[post.pk]),
+            {"text": "Комментарий"}
+        )
+        comment = Comment.objects.using(alias).get(post=post)
+        self.assertEqual(sharding.shard_for(post_id=comment.pk), alias)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        response = self.client.get(
+            reverse("posts:post_detail", args=[post.pk])
+        )
+        self.assertEqual(list(response.context["comments"]), [comment])
+
+    def test_index_merges_shards_by_date(self):
+        expected = sorted(
+            self.posts, key=lambda post: (post.pub_date, post.pk),
+            reverse=True
+        )
+        response = self.client.get(reverse("posts:index"))
+        first_page = list(response.context["page_obj"])
+        self.assertEqual(first_page, expected[:10])
+        self.assertEqual(
+            first_page[0].author.username, expected[0].author.username
+        )
+        response = self.client.get(
+            reverse("posts:index"),
+            {"cursor": response.context["page_obj"].paginator.next_cursor}
+        )
+        self.assertEqual(list(response.context["page_obj"]), expected[10:])
+
+    def test_follow_index_reads_followed_shards(self):
+        self.addCleanup(registry.reset)
+        registry.reset()
+        self.client.force_login(self.reader)
+        queries = self.queries()
+        response = self.client.get(reverse("posts:follow_index"))
+        expected = sorted(
+            (post for post in self.posts if post.author == self.second),
+            key=lambda post: post.pub_date, reverse=True
+        )
+        self.assertEqual(list(response.context["page_obj"]), expected)
+        self.assertEqual(len(queries[self.shard_of(self.first)]), 0)
+        key = (feed.REQUESTS_METRIC, (("op", "read"), ("path", "sharded")))
+        self.assertEqual(registry.counters[key], 1)
+
+    def test_create_without_hint_goes_to_shard(self):
+        post = Post.objects.create(text="Без подсказки", author=self.second)
+        alias = self.shard_of(self.second)
+        self.assertEqual(post._state.db, alias)
+        self.assertEqual(sharding.shard_for(post_id=post.pk), alias)
+        comment = Comment.objects.create(
+            post=post, author=self.first, text="Тоже"
+        )
+        self.assertEqual(sharding.shard_for(post_id=comment.pk), alias)
+        self.assertFalse(Post.objects.using("default").exists())
+
+    def test_bulk_create_splits_by_shard(self):
+        posts = Post.objects.bulk_create([
+            Post(text="Первый", author=self.first),
+            Post(text="Второй", author=self.second),
+        ])
+        for post in posts:
+            self.assertEqual(post._state.db, self.shard_of(post.author))
+            self.assertEqual(
+                sharding.shard_for(post_id=post.pk), post._state.db
+            )
+        wrong = sharding.global_id(1000, self.shard_of(self.second))
+        with self.assertRaises(ValueError):
+            Post.objects.bulk_create([
+                Post(pk=wrong, text="Чужой id", author=self.first)
+            ])
+
+    def test_user_deletion_removes_shard_rows(self):
+        Comment.objects.create(
+            post=self.posts[1], author=self.first, text="Комментарий"
+        )
+        self.first.delete()
+        for alias in SHARDS:
+            self.assertFalse(
+                Post.objects.using(alias).filter(
+                    author_id=self.first.pk
+                ).exists()
+            )
+            self.assertFalse(
+                Comment.objects.using(alias).filter(
+                    author_id=self.first.pk
+                ).exists()
+            )
+        self.assertEqual(
+            Post.objects.using(self.shard_of(self.second)).count(), 6
+        )
+
+    def test_rebuild_counters_and_feeds(self):
+        Comment.objects.create(
+            post=self.posts[1], author=self.first, text="Комментарий"
+        )
+        Post.objects.using(self.shard_of(self.second)).update(comment_count=0)
+        UserStats.objects.update(post_count=0)
+        FeedEntry.objects.all().delete()
+        self.drop_feed_entries_after_test()
+        counters.rebuild()
+        feed.rebuild()
+        self.posts[1].refresh_from_db()
+        self.assertEqual(self.posts[1].comment_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.second).post_count, 6
+        )
+        self.assertEqual(
+            set(FeedEntry.objects.values_list("post_id", flat=True)),
+            {post.pk for post in self.posts if post.author == self.second}
+        )
+
+    def test_import_renumbers_unsharded_export(self):
+        """
+        Выгрузка без шардов загружается: посты и комментарии
+        получают id своих шардов, комментарии - новые id постов.
+        """
+        self.drop_feed_entries_after_test()
+        # id без шардов не совпадают по чётности с шардом автора.
+        authors = {author.pk + 1: author for author in (self.first,
+                                                        self.second)}
+        records = [
+            {"model": "posts.post", "pk": pk,
+             "fields": {"text": f"Импорт {pk}", "author": author.pk}}
+            for pk, author in authors.items()
+        ] + [
+            {"model": "posts.comment", "pk": pk,
+             "fields": {"text": f"Ответ {pk}", "post": pk,
+                        "author": self.reader.pk}}
+            for pk in authors
+        ]
+        path = os.path.join(self.directory, "export.ndjson")
+        with open(path, "w", encoding="utf-8") as output:
+            output.writelines(json.dumps(record) + "\n" for record in records)
+        call_command("import_ndjson", path, stdout=StringIO())
+        for number, author in authors.items():
+            alias = self.shard_of(author)
+            post = Post.objects.using(alias).get(text=f"Импорт {number}")
+            self.assertEqual(sharding.shard_for(post_id=post.pk), alias)
+            self.assertEqual(post.comment_count, 1)
+            comment = Comment.objects.using(alias).get(
+                text=f"Ответ {number}"
+            )
+            self.assertEqual(comment.post_id, post.pk)
+            self.assertEqual(sharding.shard_for(post_id=comment.pk), alias)
+
+    def test_admin_reads_one_shard(self):
+        admin = User.objects.create_superuser("admin", "a@a.ru", "pass")
+        self.client.force_login(admin)
+        url = reverse("admin:posts_post_changelist")
+        alias = self.shard_of(self.second)
+        response = self.client.get(url, {"shard": alias})
+        self.assertEqual(
+            set(response.context["cl"].result_list),
+            {post for post in self.posts if post.author == self.second}
+        )
+        post = self.posts[1]
+        response = self.client.get(
+            reverse("admin:posts_post_change", args=[post.pk])
+        )
+        self.assertEqual(response.context["original"], post)
+
+    def test_seed_places_rows_on_shards(self):
+        self.drop_feed_entries_after_test()
+        call_command(
+            "seed", users=10, groups=2, posts=50, comments=80, follows=10,
+            first_id=100, stdout=StringIO()
+        )
+        for alias in SHARDS:
+            for post in Post.objects.using(alias).filter(pk__gte=200):
+                self.assertEqual(self.shard_of(post.author), alias)
+                self.assertEqual(sharding.shard_for(post_id=post.pk), alias)
+            for comment in Comment.objects.using(alias):
+                self.assertEqual(sharding.shard_for(post_id=comment.pk), alias)
+                self.assertTrue(
+                    Post.objects.using(alias).filter(
+                        pk=comment.post_id
+                    ).exists()
+                )
+        self.assertEqual(
+            sum(Post.objects.using(alias).count() for alias in SHARDS), 62
+        )
+        post = Post.objects.create(text="После сида", author=self.first)
+        self.assertGreater(post.pk, 150 * len(SHARDS))
+
+
+class ShardMigrationTests(SimpleTestCase):
+    """Развёртывание с шардами с нуля: migrate, затем каждый шард."""
+
+    databases = {"default", *SHARDS}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        for alias in SHARDS:
+            connections.databases[alias] = cls.settings_for(alias)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in SHARDS:
+            connections[alias].close()
+            delattr(connections._connections, alias)
+            del connections.databases[alias]
+        shutil.rmtree(cls.directory)
+
+    @classmethod
+    def settings_for(cls, alias):
+        return {
+            **connections["default"].settings_dict,
+            "NAME": os.path.join(cls.directory, f"{alias}.sqlite3"),
+            "OPTIONS": {"pragmas": {"foreign_keys": "OFF"}},
+            "TEST": {},
+        }
+
+    def setUp(self):
+        # Пустая основная база вместо тестовой, которую не трогаем.
+        settings_dict = self.settings_for("default")
+        fresh = load_backend(settings_dict["ENGINE"]).DatabaseWrapper(
+            settings_dict, "default"
+        )
+        original = connections["default"]
+        setattr(connections._connections, "default", fresh)
+        self.addCleanup(setattr, connections._connections, "default",
+                        original)
+        self.addCleanup(fresh.close)
+
+    def test_migrate_default_then_shards(self):
+        with override_settings(POST_SHARDS=SHARDS):
+            # Данные до счётчиков: 0012 считает их в основной базе.
+            call_command(
+                "migrate", "posts", "0011", database="default", verbosity=0
+            )
+            state = MigrationExecutor(connections["default"]).loader
+            apps = state.project_state(("posts", "0011_feedentry")).apps
+            author = apps.get_model("auth", "User").objects.create(
+                username="author"
+            )
+            post = apps.get_model("posts", "Post").objects.create(
+                text="Пост", author_id=author.pk
+            )
+            apps.get_model("posts", "Comment").objects.create(
+                text="Комментарий", author_id=author.pk, post_id=post.pk
+            )
+            for alias in ["default", *SHARDS]:
+                call_command("migrate", database=alias, verbosity=0)
+        stats = UserStats.objects.using("default").get(user_id=author.pk)
+        self.assertEqual(stats.post_count, 1)
+        post = Post.objects.using("default").get(pk=post.pk)
+        self.assertEqual(post.comment_count, 1)
+        for alias in SHARDS:
+            tables = connections[alias].introspection.table_names()
+            self.assertIn("posts_post", tables)
+            self.assertIn("posts_comment", tables)
+            self.assertNotIn("posts_userstats", tables)
+            self.assertNotIn("auth_user", tables)
@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import slow_queries
+
+from ..models import Post, User
+
+
+class SlowQueryLogTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create(username="Author")
+        Post.objects.create(text="Пост", author=author)
+
+    def setUp(self):
+        cache.clear()
+
+    def records(self, url):
+        with override_settings(SLOW_QUERY_THRESHOLD=0):
+            with self.assertLogs("core.slow_queries") as logs:
+                Client().get(url)
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_slow_queries_are_logged(self):
+        """Запрос выше порога пишется с view, местом вызова и планом."""
+        records = self.records(reverse("posts:index"))
+        posts = [
+            record for record in records
+            if 'FROM "posts_post"' in record["sql"]
+        ]
+        self.assertTrue(posts)
+        record = posts[0]
+        self.assertEqual(record["view"], "posts:index")
+        self.assertEqual(record["path"], reverse("posts:index"))
+        self.assertRegex(record["location"], r"^posts/.+\.py:\d+ in \w+$")
+        self.assertTrue(record["plan"])
+        self.assertGreaterEqual(record["duration_ms"], 0)
+
+    @override_settings(SLOW_QUERY_THRESHOLD=None)
+    def test_disabled(self):
+        with self.assertRaises(AssertionError):
+            with self.assertLogs("core.slow_queries"):
+                Client().get(reverse("posts:index"))
+
+    def test_top_command(self):
+        """Команда сводит одинаковые запросы и сортирует по времени."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "slow.log")
+        records = [
+            {"sql": "SELECT 1 WHERE id IN (%s, %s)", "duration_ms": 40},
+            {"sql": "SELECT 1 WHERE id IN (%s, %s, %s)", "duration_ms": 30},
+            {"sql": "SELECT 2", "duration_ms": 50, "plan": ["SCAN t"]},
+        ]
+        with open(path, "w", encoding="utf-8") as log:
+            log.writelines(json.dumps(record) + "\n" for record in records)
+        offenders = slow_queries.top(slow_queries.read_log(path), 10)
+        self.assertEqual(
+            [(found["count"], found["total_ms"]) for found in offenders],
+            [(2, 70), (1, 50)]
+        )
+        out = StringIO()
+        call_command(
+            "slow_queries", log=path, top=1, plans=True, stdout=out
+        )
+        self.assertIn("%s, ...", out.getvalue())
+        self.assertNotIn("SELECT 2", out.getvalue())
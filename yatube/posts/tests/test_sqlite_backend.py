@@ -0,0 +1,77 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def connect(self, **options):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "db.sqlite3")
+        connection = ConnectionHandler({"default": {
+            "ENGINE": "core.backends.sqlite3",
+            "NAME": path,
+            "OPTIONS": options,
+        }})["default"]
+        self.addCleanup(connection.close)
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE item (value INTEGER)")
+        return connection, path
+
+    def lock(self, path):
+        """Соединение, которое держит блокировку записи."""
+        blocker = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self.addCleanup(blocker.close)
+        blocker.execute("BEGIN IMMEDIATE")
+        return blocker
+
+    def test_pragmas(self):
+        connection, _ = self.connect(pragmas={"cache_size": -1000})
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("PRAGMA cache_size")
+            self.assertEqual(cursor.fetchone()[0], -1000)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_busy_retry(self):
+        """Запрос вне транзакции повторяется, пока база занята."""
+        connection, path = self.connect(
+            timeout=0, busy_retries=5, busy_backoff=0.02
+        )
+        blocker = self.lock(path)
+        timer = threading.Timer(0.05, blocker.commit)
+        timer.start()
+        self.addCleanup(timer.join)
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO item VALUES (1)")
+            cursor.execute("SELECT COUNT(*) FROM item")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_busy_without_retries(self):
+        connection, path = self.connect(timeout=0, busy_retries=0)
+        self.lock(path)
+        with self.assertRaisesMessage(OperationalError, "database is locked"):
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO item VALUES (1)")
+
+    def test_transactions_take_write_lock(self):
+        """Транзакция сразу берёт блокировку записи."""
+        connection, path = self.connect()
+        connection._start_transaction_under_autocommit()
+        self.addCleanup(connection.connection.rollback)
+        other = sqlite3.connect(path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(
+            sqlite3.OperationalError, "database is locked"
+        ):
+            other.execute("BEGIN IMMEDIATE")
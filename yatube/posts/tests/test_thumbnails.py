@@ -0,0 +1,119 @@
+import io
+import shutil
+import tempfile
+from concurrent.futures import Future
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+
+from .. import images, thumbnails
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+SMALL_GIF = (
+    b"\x47\x49\x46\x38\x39\x61\x02\x00"
+    b"\x01\x00\x80\x00\x00\x00\x00\x00"
+    b"\xFF\xFF\xFF\x21\xF9\x04\x00\x00"
+    b"\x00\x00\x00\x2C\x00\x00\x00\x00"
+    b"\x02\x00\x01\x00\x00\x02\x02\x0C"
+    b"\x0A\x00\x3B"
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailPipelineTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text="Пост с картинкой",
+            author=User.objects.create(username="Author"),
+            image=SimpleUploadedFile(
+                name="small.gif", content=SMALL_GIF, content_type="image/gif"
+            ),
+        )
+
+    def test_placeholder_until_rendered(self):
+        """
+        Пока миниатюры нет, страница показывает заглушку,
+        а после очереди - готовую картинку.
+        """
+        url = reverse("posts:index")
+        self.assertIsNone(thumbnails.lookup(self.post.image, "960x339"))
+        response = self.client.get(url)
+        self.assertContains(response, "bg-light")
+        self.assertNotContains(response, "<img class=\"card-img")
+        thumbnails.enqueue(self.post)
+        thumbnail = thumbnails.lookup(self.post.image, "960x339")
+        self.assertIsNotNone(thumbnail)
+        self.assertEqual(tuple(thumbnail.size), (960, 339))
+        cache.clear()
+        response = self.client.get(url)
+        self.assertContains(response, f"src=\"{thumbnail.url}\"")
+        self.assertContains(response, f"{thumbnail.url} 960w")
+
+    def test_rendered_in_worker_process(self):
+        """
+        Миниатюры из рабочего процесса появляются на странице,
+        хотя этот процесс уже закэшировал их отсутствие.
+        """
+        url = reverse("posts:index")
+        response = self.client.get(url)
+        self.assertNotContains(response, "<img class=\"card-img")
+        # У рабочего процесса свой кэш kvstore, общая только база.
+        with mock.patch.object(KVStore, "cache", LocMemCache("worker", {})):
+            thumbnails.render_all(self.post.image.name)
+        self.assertIsNone(thumbnails.lookup(self.post.image, "960x339"))
+        done = Future()
+        done.set_result(self.post.image.name)
+        thumbnails._rendered(self.post.pk, self.post.image.name, done)
+        thumbnail = thumbnails.lookup(self.post.image, "960x339")
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get(url)
+        self.assertContains(response, f"src=\"{thumbnail.url}\"")
+
+    @override_settings(IMAGE_VARIANT_FORMATS=())
+    def test_variants_do_not_upscale(self):
+        """Варианты для srcset не увеличивают мелкую картинку."""
+        thumbnails.enqueue(self.post)
+        found = thumbnails.lookup_variants(self.post.image, "960x339")
+        self.assertEqual(list(found), [None])
+        self.assertTrue(all(t.width <= 2 for t in found[None]))
+
+
+@override_settings(IMAGE_MAX_SIZE=100)
+class NormalizeTests(TestCase):
+    @staticmethod
+    def upload(name, fmt, size, **options):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, (200, 10, 10)).save(buffer, fmt, **options)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_strips_exif_and_caps_size(self):
+        """Метаданные удаляются, большая сторона ограничивается."""
+        exif = Image.Exif()
+        exif[0x010F] = "Phone"
+        exif[0x0112] = 6
+        result = images.normalize(
+            self.upload("photo.jpeg", "JPEG", (400, 200), exif=exif)
+        )
+        image = Image.open(result)
+        self.assertEqual(result.name, "photo.jpeg")
+        self.assertEqual(image.size, (50, 100))
+        self.assertFalse(image.getexif())
+
+    def test_converts_other_formats(self):
+        """Прочие форматы сохраняются как JPEG."""
+        result = images.normalize(self.upload("scan.bmp", "BMP", (10, 10)))
+        self.assertEqual(result.name, "scan.jpg")
+        self.assertEqual(Image.open(result).format, "JPEG")
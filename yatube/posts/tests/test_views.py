@@ -1,20 +1,24 @@
 import datetime
+import shutil
 import tempfile
 
 from django import forms
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.forms.models import model_to_dict
+from django.template.loader import render_to_string
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from mixer.backend.django import mixer
 
-from ..models import Comment, Follow, Group, Post, User
+from core import metrics
+
+from .. import feed
+from ..models import Comment, FeedEntry, Follow, Group, Post, User
 
 User = get_user_model()
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -38,6 +42,11 @@ class PostPagesTests(TestCase):
         cls.test_post.pub_date += datetime.timedelta(days=1)
         cls.test_post.save()
 
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
     def setUp(self):
         cache.clear()
         self.guest_client = Client()
@@ -100,6 +109,34 @@ class PostPagesTests(TestCase):
                     post_count
                 )
 
+    def test_cursor_pagination(self):
+        """
+        Курсор проходит ленту без пропусков и повторов,
+        токен предыдущей страницы возвращает назад.
+        """
+        url = reverse("posts:index")
+        response = self.client.get(url)
+        first_page = list(response.context["page_obj"])
+        paginator = response.context["page_obj"].paginator
+        self.assertIsNone(paginator.previous_cursor)
+        seen = list(first_page)
+        pages = [first_page]
+        while paginator.next_cursor:
+            response = self.client.get(
+                url, {"cursor": paginator.next_cursor}
+            )
+            paginator = response.context["page_obj"].paginator
+            pages.append(list(response.context["page_obj"]))
+            seen.extend(pages[-1])
+        self.assertEqual([len(page) for page in pages], [10, 10, 4])
+        self.assertEqual(seen, list(Post.objects.order_by("-pub_date", "-id")))
+        response = self.client.get(
+            url, {"cursor": paginator.previous_cursor}
+        )
+        self.assertEqual(list(response.context["page_obj"]), pages[1])
+        response = self.client.get(url, {"cursor": "испорчен"})
+        self.assertEqual(list(response.context["page_obj"]), first_page)
+
     def test_pages_show_correct_context(self):
         """
         Шаблоны index, group_list, profile
@@ -301,30 +338,139 @@ class PostPagesTests(TestCase):
             self.not_guest
         )
 
+    @override_settings(COMMENT_COUNT=2)
+    def test_comments_are_paginated(self):
+        """
+        Страница поста показывает первые COMMENT_COUNT комментариев,
+        остальные отдаются фрагментом по курсору.
+        """
+        for number in range(3):
+            Comment.objects.create(
+                post=self.test_post,
+                author=self.not_guest,
+                text=f"Коммент {number}"
+            )
+        response = self.client.get(
+            reverse(
+                "posts:post_detail",
+                kwargs={"post_id": self.test_post.id}
+            )
+        )
+        texts = [comment.text for comment in response.context["comments"]]
+        self.assertEqual(texts, ["Коммент 2", "Коммент 1"])
+        next_cursor = response.context["next_cursor"]
+        self.assertIsNotNone(next_cursor)
+        response = self.client.get(
+            reverse(
+                "posts:post_comments",
+                kwargs={"post_id": self.test_post.id}
+            ),
+            {"cursor": next_cursor}
+        )
+        texts = [comment.text for comment in response.context["comments"]]
+        self.assertEqual(texts, ["Коммент 0"])
+        self.assertIsNone(response.context["next_cursor"])
+        self.assertNotContains(response, "<html")
+
     def test_cache(self):
+        """
+        Главная страница берётся из кэша, но изменения постов
+        видны сразу.
+        """
         post_text = "for cache testing"
         self.authorized_client.get(reverse("posts:index"))
+        response = self.authorized_client.get(reverse("posts:index"))
+        # Страница отдана из кэша без рендеринга шаблона
+        self.assertIsNone(response.context)
         post = Post.objects.create(
             text=post_text,
             author=self.test_author,
             group=None
         )
-        # Кэш не обновлен - пост отсутствует на главной
-        response = self.authorized_client.get(reverse("posts:index"))
-        self.assertNotContains(response, post_text)
-        # Кэш обновлен - пост присутствует
-        cache.clear()
+        # Новый пост сбросил версию кэша - он сразу на главной
         response = self.authorized_client.get(reverse("posts:index"))
         self.assertContains(response, post_text)
-        # Пост удалён, но до сих пор присутствует на главной
         post.delete()
         response = self.authorized_client.get(reverse("posts:index"))
-        self.assertContains(response, post_text)
-        # Кэш очищен - пост отсутствует на главной
-        cache.clear()
-        response = self.authorized_client.get(reverse("posts:index"))
         self.assertNotContains(response, post_text)
 
+    def test_cache_invalidation(self):
+        """Комментарий и подписка сбрасывают страницы поста и профиля."""
+        post_url = reverse(
+            "posts:post_detail",
+            kwargs={"post_id": self.test_post.id}
+        )
+        profile_url = reverse(
+            "posts:profile",
+            kwargs={"username": self.test_author.username}
+        )
+        self.client.get(post_url)
+        self.client.get(profile_url)
+        Comment.objects.create(
+            post=self.test_post,
+            author=self.not_guest,
+            text="Свежий комментарий"
+        )
+        Follow.objects.create(user=self.not_guest, author=self.test_author)
+        self.assertContains(self.client.get(post_url), "Свежий комментарий")
+        self.assertContains(self.client.get(profile_url), "Подписчиков: 1")
+
+    def test_author_change_resets_pages(self):
+        """Новое имя автора сразу видно в профиле и на главной."""
+        profile_url = reverse(
+            "posts:profile",
+            kwargs={"username": self.test_author.username}
+        )
+        self.client.get(profile_url)
+        self.client.get(reverse("posts:index"))
+        self.test_author.first_name = "Лев"
+        self.test_author.last_name = "Толстой"
+        self.test_author.save()
+        self.assertContains(self.client.get(profile_url), "Лев Толстой")
+        self.assertContains(
+            self.client.get(reverse("posts:index")), "Лев Толстой"
+        )
+
+    def test_group_change_resets_cards(self):
+        """Новые название и slug группы сразу видны на страницах постов."""
+        group = Group.objects.get(pk=self.test_post.group_id)
+        self.client.get(reverse("posts:index"))
+        self.client.get(
+            reverse("posts:post_detail", args=[self.test_post.id])
+        )
+        group.title = "НовоеНазвание"
+        group.slug = "new_slug"
+        group.save()
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(
+            response, reverse("posts:group_list", args=["new_slug"])
+        )
+        self.assertNotContains(
+            response, reverse("posts:group_list", args=["test_slug"])
+        )
+        self.assertContains(
+            self.client.get(
+                reverse("posts:post_detail", args=[self.test_post.id])
+            ),
+            "НовоеНазвание"
+        )
+
+    def test_post_card_fragment_cache(self):
+        """Карточка поста кэшируется до изменения поста."""
+        def render_card():
+            post = Post.objects.for_feed().get(pk=self.test_post.pk)
+            return render_to_string(
+                "posts/includes/post_card.html", {"post": post}
+            )
+
+        self.assertIn(self.test_post.text, render_card())
+        # update() не трогает updated - карточка остаётся прежней
+        Post.objects.filter(pk=self.test_post.pk).update(text="Новый текст")
+        self.assertNotIn("Новый текст", render_card())
+        post = Post.objects.get(pk=self.test_post.pk)
+        post.save()
+        self.assertIn("Новый текст", render_card())
+
     def test_follow(self):
         """
         Авторизованный пользователь может подписываться
@@ -384,3 +530,79 @@ class PostPagesTests(TestCase):
         self.assertFalse(
             self.not_guest.follower.filter(author=self.test_author).exists()
         )
+
+    def test_follow_feed_entries(self):
+        """
+        Лента подписок заполняется при подписке и публикации
+        и очищается при отписке.
+        """
+        entries = FeedEntry.objects.filter(user=self.not_author)
+        self.authorized_client.get(
+            reverse(
+                "posts:profile_follow",
+                kwargs={"username": self.test_author}
+            )
+        )
+        self.assertEqual(
+            list(entries.values_list("post", flat=True)),
+            [self.test_post.id]
+        )
+        new_post = Post.objects.create(
+            text="Пост для ленты",
+            author=self.test_author
+        )
+        self.assertTrue(entries.filter(post=new_post).exists())
+        response = self.authorized_client.get(reverse("posts:follow_index"))
+        self.assertIn(new_post, response.context["page_obj"])
+        self.authorized_client.get(
+            reverse(
+                "posts:profile_unfollow",
+                kwargs={"username": self.test_author}
+            )
+        )
+        self.assertFalse(entries.exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_hybrid_follow_feed(self):
+        """
+        Посты автора с подписчиками сверх порога не раскладываются
+        по лентам, а подмешиваются при чтении в порядке дат.
+        """
+        self.addCleanup(metrics.registry.reset)
+        metrics.registry.reset()
+        Follow.objects.create(user=self.not_guest, author=self.test_author)
+        Follow.objects.create(user=self.not_author, author=self.test_author)
+        Follow.objects.create(user=self.not_author, author=self.user_1)
+        new_post = Post.objects.create(
+            text="Пост популярного автора",
+            author=self.test_author
+        )
+        self.assertFalse(FeedEntry.objects.filter(post=new_post).exists())
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.not_author).count(), 23
+        )
+        url = reverse("posts:follow_index")
+        response = self.authorized_client.get(url)
+        exposition = metrics.exposition()
+        for op, path in (("write", "pull"), ("read", "hybrid")):
+            self.assertIn(
+                f'{feed.REQUESTS_METRIC}{{op="{op}",path="{path}"}} 1.0\n',
+                exposition
+            )
+        seen = list(response.context["page_obj"])
+        paginator = response.context["page_obj"].paginator
+        while paginator.next_cursor:
+            response = self.authorized_client.get(
+                url, {"cursor": paginator.next_cursor}
+            )
+            paginator = response.context["page_obj"].paginator
+            seen.extend(response.context["page_obj"])
+        expected = list(
+            Post.objects.filter(
+                author__in=(self.test_author, self.user_1)
+            ).order_by("-pub_date", "-id")
+        )
+        self.assertIn(new_post, seen)
+        self.assertEqual(seen, expected)
+        response = self.authorized_client.get(url, {"page": 3})
+        self.assertEqual(list(response.context["page_obj"]), expected[20:])
@@ -0,0 +1,193 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from core.metrics import timer
+
+from . import images
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _options(source, options):
+    """Опции миниатюры так же, как их дополняет sorl-thumbnail."""
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault("format", backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def variants(geometry):
+    """
+    Пары (геометрия, опции) всех вариантов миниатюры geometry.
+
+    Для каждой ширины из IMAGE_SRCSET_WIDTHS строятся варианты
+    в доступных современных форматах и в формате исходника,
+    без увеличения мелких картинок. Сама geometry идёт последней:
+    раз она есть в kvstore, остальные варианты уже построены.
+    """
+    options = settings.THUMBNAIL_GEOMETRIES[geometry]
+    width, height = map(int, geometry.split("x"))
+    result = []
+    for size_width in settings.IMAGE_SRCSET_WIDTHS:
+        size = f"{size_width}x{round(height * size_width / width)}"
+        size_options = {**options, "upscale": False}
+        for fmt in images.modern_formats():
+            result.append((size, {**size_options, "format": fmt}))
+        if size != geometry:
+            result.append((size, size_options))
+    result.append((geometry, options))
+    return result
+
+
+def _thumbnail(file_, geometry, options):
+    """Миниатюра file_ с её ключом в kvstore, файла может ещё не быть."""
+    source = ImageFile(file_)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, _options(source, options)
+    )
+    return ImageFile(name, default.storage)
+
+
+@timer("thumbnail")
+def lookup(file_, geometry, options=None):
+    """Готовая миниатюра или None, если её ещё не построили."""
+    if options is None:
+        options = settings.THUMBNAIL_GEOMETRIES[geometry]
+    return default.kvstore.get(_thumbnail(file_, geometry, options))
+
+
+@timer("thumbnail")
+def lookup_variants(file_, geometry):
+    """
+    Готовые варианты geometry: словарь формат -> список миниатюр
+    по возрастанию ширины, формат исходника под ключом None.
+    """
+    found = {}
+    for size, options in variants(geometry)[:-1]:
+        thumbnail = lookup(file_, size, options)
+        if thumbnail is not None:
+            found.setdefault(options.get("format"), []).append(thumbnail)
+    return found
+
+
+def forget_misses(name):
+    """
+    Стирает из кэша kvstore промахи по всем вариантам миниатюр name.
+
+    cached_db запоминает отсутствие миниатюры на
+    THUMBNAIL_CACHE_TIMEOUT, а рабочий процесс пула обновляет
+    только базу и свой кэш.
+    """
+    kvstore = default.kvstore
+    for geometry in settings.THUMBNAIL_GEOMETRIES:
+        for size, options in variants(geometry):
+            thumbnail = _thumbnail(name, size, options)
+            kvstore.cache.delete(add_prefix(thumbnail.key, "image"))
+
+
+def render_all(name):
+    """Строит все варианты миниатюр из THUMBNAIL_GEOMETRIES."""
+    for geometry in settings.THUMBNAIL_GEOMETRIES:
+        for size, options in variants(geometry):
+            get_thumbnail(name, size, **options)
+    return name
+
+
+# Модуль импортируется в рабочем процессе до django.setup(),
+# поэтому модели подключаются только внутри функций.
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _rendered(post_id, name, future):
+    from . import caching
+    from .models import Post
+
+    with _lock:
+        _pending.discard(name)
+    if future.exception() is not None:
+        logger.error(
+            "thumbnails for %s failed", name, exc_info=future.exception()
+        )
+        return
+    forget_misses(name)
+    post = Post.objects.on_shard(post_id=post_id).filter(
+        pk=post_id
+    ).with_author().first()
+    if post is not None:
+        # Страницы с заглушкой сбрасываются, чтобы показать картинку.
+        caching.bump_post(post)
+
+
+@timer("thumbnail")
+def enqueue(post):
+    """
+    Ставит построение миниатюр поста в очередь пула процессов.
+
+    При THUMBNAIL_WORKERS = 0 миниатюры строятся сразу.
+    """
+    name = post.image.name
+    try:
+        if not name or not post.image.storage.exists(name):
+            return
+    except (SuspiciousFileOperation, ValueError):
+        # Файл вне MEDIA_ROOT: строить миниатюры не из чего.
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        render_all(name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    try:
+        future = _get_executor().submit(render_all, name)
+    except BrokenProcessPool:
+        # Упавший рабочий процесс ломает весь пул - создаём новый.
+        _reset_executor()
+        future = _get_executor().submit(render_all, name)
+    future.add_done_callback(
+        lambda done: _rendered(post.pk, name, done)
+    )
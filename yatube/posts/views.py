@@ -2,18 +2,23 @@ from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.http import urlencode
 
+from .caching import cache_versioned, cached_object, post_page_scopes
+from .counters import get_stats
+from .feed import follow_feed
 from .forms import CommentForm, PostForm
+from . import sharding
 from .models import Follow, Group, Post, User
+from .paginators import (COMMENT_CURSOR_FIELDS, CursorPaginator,
+                         encode_cursor, paginate)
+from .search import search_posts
 
 
-@cache_page(20, key_prefix="index_page")
+@cache_versioned(lambda: [("index",)])
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, settings.POST_COUNT)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    post_list = sharding.scatter(Post.objects.for_feed())
+    page_obj = paginate(request, post_list)
     context = {
         "page_obj": page_obj,
         "index": True
@@ -21,12 +26,15 @@ def index(request):
     return render(request, "posts/index.html", context)
 
 
+@cache_versioned(lambda slug: [("group", slug)])
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, settings.POST_COUNT)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    group = cached_object(
+        request,
+        ("group", slug),
+        lambda: get_object_or_404(Group, slug=slug)
+    )
+    post_list = sharding.scatter(group.posts.for_feed())
+    page_obj = paginate(request, post_list)
     context = {
         "group": group,
         "page_obj": page_obj,
@@ -34,39 +42,95 @@ def group_posts(request, slug):
     return render(request, "posts/group_list.html", context)
 
 
+@cache_versioned(lambda username: [("author", username)])
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
+    author = cached_object(
+        request,
+        ("author", username),
+        lambda: get_object_or_404(
+            User.objects.select_related("stats"),
+            username=username
+        )
+    )
+    stats = get_stats(author)
+    post_list = author.posts.for_feed()
     following = request.user.is_authenticated and (
         request.user.follower.filter(author=author).exists()
     )
-    paginator = Paginator(post_list, settings.POST_COUNT)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, post_list)
     context = {
         "author": author,
         "page_obj": page_obj,
-        "post_count": post_list.count(),
+        "post_count": stats.post_count,
+        "stats": stats,
         "following": following,
     }
     return render(request, "posts/profile.html", context)
 
 
+@cache_versioned(post_page_scopes)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    author = post.author
-    post_count = author.posts.count()
+    post = get_object_or_404(
+        Post.objects.on_shard(post_id=post_id).for_detail(),
+        id=post_id
+    )
+    post_count = get_stats(post.author).post_count
     form = CommentForm()
-    comments = post.comments.all()
+    comments = post.comments.for_feed().order_by("-created", "-id")[
+        :settings.COMMENT_COUNT
+    ]
+    next_cursor = None
+    # Счётчик в посте избавляет от запроса «есть ли ещё комментарии».
+    if comments and post.comment_count > len(comments):
+        last = list(comments)[-1]
+        next_cursor = encode_cursor((last.created, last.id))
     context = {
         "post": post,
         "post_count": post_count,
         "form": form,
         "comments": comments,
+        "next_cursor": next_cursor,
     }
     return render(request, "posts/post_detail.html", context)
 
 
+@cache_versioned(lambda post_id: [("post", post_id)], per_user=False)
+def post_comments(request, post_id):
+    """Следующая порция комментариев поста фрагментом HTML."""
+    post = get_object_or_404(
+        Post.objects.on_shard(post_id=post_id).only("id"),
+        id=post_id
+    )
+    paginator = CursorPaginator(
+        post.comments.for_feed(),
+        settings.COMMENT_COUNT,
+        fields=COMMENT_CURSOR_FIELDS
+    )
+    page_obj = paginator.get_page(request.GET.get("cursor"))
+    context = {
+        "post": post,
+        "comments": page_obj,
+        "next_cursor": paginator.next_cursor,
+    }
+    return render(request, "posts/includes/comment_list.html", context)
+
+
+def search(request):
+    query = request.GET.get("q", "").strip()
+    paginator = Paginator(search_posts(query), settings.POST_COUNT)
+    page_obj = paginator.get_page(request.GET.get("page"))
+    posts = sharding.in_bulk(Post.objects.for_feed(), page_obj.object_list)
+    page_obj.object_list = [
+        posts[pk] for pk in page_obj.object_list if pk in posts
+    ]
+    context = {
+        "query": query,
+        "page_obj": page_obj,
+        "page_query": urlencode({"q": query}) + "&",
+    }
+    return render(request, "posts/search.html", context)
+
+
 @login_required
 def post_create(request):
     context = {
@@ -85,8 +149,11 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    if request.user != post.author:
+    post = get_object_or_404(
+        Post.objects.on_shard(post_id=post_id),
+        id=post_id
+    )
+    if request.user.id != post.author_id:
         return redirect("posts:post_detail", post_id)
     context = {
         "title": "Редактировать запись",
@@ -107,7 +174,10 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.on_shard(post_id=post_id),
+        id=post_id
+    )
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -119,10 +189,7 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, settings.POST_COUNT)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, follow_feed(request.user))
     context = {
         "page_obj": page_obj,
         "follow": True
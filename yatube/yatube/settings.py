@@ -1,4 +1,8 @@
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -39,11 +43,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
+    "core.slow_queries.SlowQueryMiddleware",
+    "core.profiling.ProfilingMiddleware",
+    "core.routers.ReadYourWritesMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.middleware.ServerTimingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -54,7 +63,9 @@ TEMPLATES_DIR = [os.path.join(BASE_DIR, "templates")]
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "core.templating.DjangoTemplates",
+        # Без NAME движок назывался бы по модулю, "templating".
+        "NAME": "django",
         "DIRS": TEMPLATES_DIR,
         "APP_DIRS": True,
         "OPTIONS": {
@@ -77,11 +88,96 @@ WSGI_APPLICATION = "yatube.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        # sqlite3 с WAL, PRAGMA и повтором при занятой базе,
+        # см. core/backends/sqlite3/base.py.
+        "ENGINE": "core.backends.sqlite3",
         "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
-    }
+        "CONN_MAX_AGE": 60,
+        "OPTIONS": {
+            "timeout": 5,
+            "busy_retries": 5,
+            "busy_backoff": 0.01,
+        },
+    },
+    # Та же база только для чтения. Снимок-копия файла тоже подойдёт,
+    # если обновлять его чаще, чем READ_YOUR_WRITES_SECONDS.
+    "replica": {
+        "ENGINE": "core.backends.sqlite3",
+        "NAME": "file:{}?mode=ro".format(os.path.join(BASE_DIR, "db.sqlite3")),
+        "CONN_MAX_AGE": 60,
+        "OPTIONS": {
+            "timeout": 5,
+            # WAL включает основная база, реплике его не переключить.
+            "pragmas": {"journal_mode": None},
+        },
+        "TEST": {"MIRROR": "default"},
+    },
 }
 
+# Посты и комментарии можно разложить по POST_SHARD_COUNT базам
+# по автору, см. posts/sharding.py. При 0 всё лежит в основной базе.
+# Миграции: сначала migrate, затем migrate --database=shard_N
+# для каждого шарда.
+POST_SHARD_COUNT = int(os.environ.get("POST_SHARD_COUNT", 0))
+POST_SHARDS = [f"shard_{index}" for index in range(POST_SHARD_COUNT)]
+for alias in POST_SHARDS:
+    DATABASES[alias] = {
+        "ENGINE": "core.backends.sqlite3",
+        "NAME": os.path.join(BASE_DIR, f"db_{alias}.sqlite3"),
+        "CONN_MAX_AGE": 60,
+        "OPTIONS": {
+            "timeout": 5,
+            "busy_retries": 5,
+            "busy_backoff": 0.01,
+            # Пользователи и группы - в основной базе.
+            "pragmas": {"foreign_keys": "OFF"},
+        },
+    }
+if POST_SHARDS:
+    # Основная база ссылается на посты с шардов (поиск, ленты).
+    DATABASES["default"]["OPTIONS"]["pragmas"] = {"foreign_keys": "OFF"}
+
+DATABASE_ROUTERS = [
+    "posts.sharding.ShardRouter",
+    "core.routers.PrimaryReplicaRouter",
+]
+DATABASE_REPLICAS = ["replica"]
+# Сколько секунд после записи пользователь читает из основной базы.
+READ_YOUR_WRITES_SECONDS = 10
+
+
+# Кэш в файле CACHE_LOCATION общий для всех процессов сервера,
+# перед ним - LRU в памяти процесса, см. core/backends/cache.py.
+# Без него у каждого процесса свой кэш в памяти, и сброс страниц
+# не доходит до других процессов.
+CACHE_LOCATION = os.environ.get("CACHE_LOCATION")
+if CACHE_LOCATION:
+    CACHES = {
+        "default": {
+            "BACKEND": "core.backends.cache.TieredCache",
+            "LOCATION": "shared",
+            "OPTIONS": {
+                "MAX_ENTRIES": 5000,
+                "MAX_BYTES": 64 * 1024 * 1024,
+                "L1_TIMEOUT": 60,
+                # Версии страниц (posts/caching.py) меняются на месте
+                # и читаются только из общего кэша.
+                "BYPASS": ["page_version:"],
+            },
+        },
+        "shared": {
+            "BACKEND": "core.backends.cache.SQLiteCache",
+            "LOCATION": CACHE_LOCATION,
+            "OPTIONS": {"timeout": 5, "MAX_ENTRIES": 100000},
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -128,6 +224,11 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media/")
+# Тесты (manage.py test и pytest) загружают картинки и строят миниатюры
+# во временный каталог, который удаляется по завершении прогона.
+if sys.argv[1:2] == ["test"] or "pytest" in sys.modules:
+    MEDIA_ROOT = tempfile.mkdtemp(prefix="yatube-media-")
+    atexit.register(shutil.rmtree, MEDIA_ROOT, ignore_errors=True)
 
 LOGIN_URL = "users:login"
 LOGIN_REDIRECT_URL = "posts:index"
@@ -136,3 +237,82 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 POST_COUNT = 10
+# Комментарии под постом отдаются порциями по COMMENT_COUNT.
+COMMENT_COUNT = 20
+CURSOR_PAGINATION = True
+FEED_BATCH_SIZE = 500
+FEED_FANOUT_LIMIT = 1000
+PAGE_CACHE_TIMEOUT = 60 * 60 * 4
+# Просроченная страница ещё PAGE_CACHE_STALE секунд отдаётся, пока
+# её пересчитывает один процесс; остальные ждут первую запись страницы
+# не дольше PAGE_CACHE_LOCK_WAIT секунд, см. posts/caching.py.
+PAGE_CACHE_STALE = 60
+PAGE_CACHE_LOCK_TIMEOUT = 30
+PAGE_CACHE_LOCK_WAIT = 2
+SEARCH_BACKEND = "auto"
+SEARCH_MAX_RESULTS = 1000
+# Размеры миниатюр, которые строятся в фоне после сохранения поста.
+THUMBNAIL_GEOMETRIES = {
+    "960x339": {"crop": "center", "upscale": True},
+}
+THUMBNAIL_WORKERS = 2
+# Загруженные картинки уменьшаются до IMAGE_MAX_SIZE по большей стороне.
+IMAGE_MAX_SIZE = 2048
+IMAGE_QUALITY = 85
+# Ширины и форматы вариантов миниатюр для srcset. Недоступные
+# в текущей сборке Pillow форматы пропускаются.
+IMAGE_SRCSET_WIDTHS = (480, 960, 1440)
+IMAGE_VARIANT_FORMATS = ("AVIF", "WEBP")
+# Каталог, через который процессы складывают метрики для /metrics.
+# Без него /metrics показывает метрики только отдавшего его процесса.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = 1
+# /metrics открыт персоналу, запросам с заголовком
+# "Authorization: Bearer METRICS_TOKEN" и адресам METRICS_ALLOWED_IPS
+# (через запятую). За прокси REMOTE_ADDR - адрес прокси.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+METRICS_ALLOWED_IPS = [
+    address.strip()
+    for address in os.environ.get("METRICS_ALLOWED_IPS", "").split(",")
+    if address.strip()
+]
+# Запросы дольше SLOW_QUERY_THRESHOLD мс пишутся в SLOW_QUERY_LOG
+# вместе с планом. None (по умолчанию) отключает журнал.
+SLOW_QUERY_THRESHOLD = (
+    float(os.environ["SLOW_QUERY_THRESHOLD"])
+    if os.environ.get("SLOW_QUERY_THRESHOLD") else None
+)
+SLOW_QUERY_LOG = os.path.join(BASE_DIR, "slow_queries.log")
+# Доля профилируемых запросов и режим: "sampling" снимает стек
+# раз в PROFILE_INTERVAL секунд, "cprofile" считает каждый вызов.
+# Процессы складывают профили в PROFILE_DIR. По умолчанию выключено.
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "sampling")
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "message": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "slow_queries": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": SLOW_QUERY_LOG,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "encoding": "utf-8",
+            "delay": True,
+            "formatter": "message",
+        },
+    },
+    "loggers": {
+        "core.slow_queries": {
+            "handlers": ["slow_queries"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+    },
+}
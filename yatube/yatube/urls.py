@@ -3,6 +3,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import metrics
+
 handler403 = "core.views.permission_denied_view"
 handler404 = "core.views.page_not_found"
 handler500 = "core.views.server_error"
@@ -13,6 +15,8 @@ urlpatterns = [
     path("auth/", include("django.contrib.auth.urls")),
     path("", include("posts.urls", namespace="posts")),
     path("about/", include("about.urls", namespace="about")),
+    path("metrics", metrics, name="metrics"),
+    path("", include("core.urls", namespace="core")),
 ]
 
 if settings.DEBUG: